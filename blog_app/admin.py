@@ -1,26 +1,171 @@
-from typing import Any
+from django import forms
 from django.contrib import admin
-from django.db.models.query import QuerySet
-from django.http import HttpRequest
-from django.db.models import Sum, Count
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth import admin as auth_admin
+from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.db.models import (
+    Case,
+    Count,
+    IntegerField,
+    Max,
+    OuterRef,
+    Subquery,
+    Sum,
+    When,
+)
+from django.db.models.fields import AutoFieldMixin
+from django.db.models.functions import Coalesce
+from django.utils.functional import cached_property
 
+from blog_app.deletion import delete_article, delete_user
 from blog_app.models import (
     Article,
     ArticleFavorite,
     ArticleRate,
     Category,
     CommentRate,
+    Deletion,
+    Job,
     Profile,
     ProfileSubscription,
     Tag,
     UploadedFile,
     UploadedImage,
     Comment,
+    count_subquery,
 )
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that never runs a full `COUNT(*)` over a large table.
+
+    Unfiltered changelists are estimated from the highest primary key,
+    filtered ones are counted up to `count_limit` rows.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        pk = queryset.model._meta.pk
+        if not queryset.query.where and isinstance(pk, AutoFieldMixin):
+            return (
+                queryset.model._base_manager.aggregate(max_pk=Max("pk"))["max_pk"]
+                or 0
+            )
+        return queryset.order_by().values("pk")[: self.count_limit].count()
+
+
+class AutocompleteFilter(admin.SimpleListFilter):
+    """
+    List filter for relations to large tables.
+
+    Renders an admin autocomplete select instead of listing every related
+    row in the sidebar. Use `autocomplete_filter()` to build one.
+    """
+
+    template = "admin/blog_app/autocomplete_filter.html"
+    field_name = None
+
+    def __init__(self, request, params, model, model_admin):
+        self.parameter_name = self.field_name
+        super().__init__(request, params, model, model_admin)
+        field = model._meta.get_field(self.field_name)
+        self.form_field = forms.ModelChoiceField(
+            queryset=field.remote_field.model._base_manager.all(),
+            required=False,
+            widget=AutocompleteSelect(field, model_admin.admin_site),
+        )
+
+    def lookups(self, request, model_admin):
+        # The choices are fetched by the widget, but the filter is only
+        # rendered when it has at least one lookup.
+        return [(None, None)]
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+    def choices(self, changelist):
+        yield {
+            "selected": self.value() is None,
+            "query_string": changelist.get_query_string(remove=[self.parameter_name]),
+            "query_params": [
+                (key, value)
+                for key, value in changelist.params.items()
+                if key != self.parameter_name
+            ],
+            "widget": self.form_field.widget.render(
+                self.parameter_name,
+                self.value(),
+                attrs={"onchange": "this.form.submit()"},
+            ),
+        }
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.field_name: self.value()})
+        return queryset
+
+
+def autocomplete_filter(model, field_name):
+    field = model._meta.get_field(field_name)
+    return type(
+        f"{field.name.title().replace('_', '')}AutocompleteFilter",
+        (AutocompleteFilter,),
+        {"title": field.verbose_name, "field_name": field_name},
+    )
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    show_facets = admin.ShowFacets.NEVER
+
+    @property
+    def media(self):
+        media = super().media
+        for list_filter in self.list_filter:
+            if isinstance(list_filter, type) and issubclass(
+                list_filter, AutocompleteFilter
+            ):
+                field = self.model._meta.get_field(list_filter.field_name)
+                media += AutocompleteSelect(field, self.admin_site).media
+        return media
+
+
+class BackgroundDeletionAdmin(admin.ModelAdmin):
+    """
+    Deletes with `delete_later()`, hiding the objects at once and deleting
+    what cascades in the background, see `blog_app.deletion`. Confirmations
+    only list the selected objects, collecting the cascades would stall the
+    request the same way.
+    """
+
+    def delete_later(self, obj, requested_by):
+        raise NotImplementedError
+
+    def delete_model(self, request, obj):
+        self.delete_later(obj, request.user)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_later(obj, request.user)
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        return (
+            [str(obj) for obj in objs],
+            {self.model._meta.verbose_name_plural: len(objs)},
+            set(),
+            [],
+        )
+
+
 @admin.register(Article)
-class ArticleAdmin(admin.ModelAdmin):
+class ArticleAdmin(BackgroundDeletionAdmin, LargeTableAdmin):
 
     list_display = (
         "id",
@@ -35,11 +180,20 @@ class ArticleAdmin(admin.ModelAdmin):
         "updated_at",
     )
 
+    list_select_related = ("author", "category")
+
     ordering = ("-updated_at",)
 
     date_hierarchy = "created_at"
 
-    list_filter = ("author", "category", "tags", "editor_choice")
+    list_filter = (
+        autocomplete_filter(Article, "author"),
+        "category",
+        autocomplete_filter(Article, "tags"),
+        "editor_choice",
+    )
+
+    autocomplete_fields = ("author", "cover", "tags")
 
     search_fields = [
         "title",
@@ -49,17 +203,28 @@ class ArticleAdmin(admin.ModelAdmin):
         "tags__name",
     ]
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(num_comments=count_subquery(Comment, "article"))
+            .prefetch_related("tags")
+        )
+
     @admin.display(ordering="rating")
     def rating(self, obj):
         return obj.rating
 
-    @admin.display(ordering="comments__count")
+    @admin.display(ordering="num_comments")
     def comments(self, obj):
-        return obj.comments.count()
+        return obj.num_comments
 
     def tags_list(self, obj):
         return [str(tag) for tag in obj.tags.all()]
 
+    def delete_later(self, obj, requested_by):
+        delete_article(obj, requested_by=requested_by)
+
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -67,37 +232,71 @@ class CategoryAdmin(admin.ModelAdmin):
 
     search_fields = ["name"]
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                num_articles=Count("articles", distinct=True),
+                rating=Sum(
+                    Case(
+                        When(articles__article_rates__is_positive=True, then=1),
+                        When(articles__article_rates__is_positive=False, then=-1),
+                        default=0,
+                        output_field=IntegerField(),
+                    )
+                ),
+            )
+        )
+
+    @admin.display(ordering="num_articles")
     def articles(self, obj):
-        return obj.articles.count()
+        return obj.num_articles
 
+    @admin.display(ordering="rating")
     def rating(self, obj):
-        return obj.articles.aggregate(Sum("rating"))["rating__sum"]
+        return obj.rating
 
 
 @admin.register(Tag)
-class TagAdmin(admin.ModelAdmin):
+class TagAdmin(LargeTableAdmin):
     list_display = ("name", "articles_count")
 
     search_fields = ["name"]
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(num_articles=Count("articles"))
+        )
+
+    @admin.display(ordering="num_articles")
     def articles_count(self, obj):
-        return obj.articles.count()
+        return obj.num_articles
 
 
 @admin.register(ArticleRate)
-class ArticleRateAdmin(admin.ModelAdmin):
+class ArticleRateAdmin(LargeTableAdmin):
     list_display = ("article", "user", "is_positive")
 
+    list_select_related = ("article", "user")
+
     search_fields = ["article__title", "user__username"]
 
-    list_filter = ("user", "article")
+    list_filter = (
+        autocomplete_filter(ArticleRate, "user"),
+        autocomplete_filter(ArticleRate, "article"),
+    )
+
+    autocomplete_fields = ("user", "article")
 
     def article(self, obj):
         return obj.article.title
 
 
 @admin.register(Comment)
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin):
     list_display = (
         "content",
         "article",
@@ -108,6 +307,8 @@ class CommentAdmin(admin.ModelAdmin):
         "updated_at",
     )
 
+    list_select_related = ("article", "author", "reply_to__author")
+
     search_fields = [
         "content",
         "article__title",
@@ -115,34 +316,51 @@ class CommentAdmin(admin.ModelAdmin):
     ]
 
     list_filter = (
-        "author",
-        "article",
-        "reply_to",
+        autocomplete_filter(Comment, "author"),
+        autocomplete_filter(Comment, "article"),
+        autocomplete_filter(Comment, "reply_to"),
     )
 
+    autocomplete_fields = ("author", "article", "reply_to")
+
     date_hierarchy = "updated_at"
 
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(num_replies=count_subquery(Comment, "reply_to"))
+        )
+
     def article(self, obj):
         return obj.article.title
 
+    @admin.display(ordering="num_replies")
     def replies(self, obj):
-        return obj.replies.count()
+        return obj.num_replies
 
 
 @admin.register(CommentRate)
-class CommentRateAdmin(admin.ModelAdmin):
+class CommentRateAdmin(LargeTableAdmin):
     list_display = ("comment", "user", "is_positive")
 
+    list_select_related = ("comment__author", "user")
+
     search_fields = ["comment__content", "user__username"]
 
-    list_filter = ("user", "comment")
+    list_filter = (
+        autocomplete_filter(CommentRate, "user"),
+        autocomplete_filter(CommentRate, "comment"),
+    )
+
+    autocomplete_fields = ("user", "comment")
 
     def comment(self, obj):
         return obj.comment.content
 
 
 @admin.register(UploadedImage)
-class UploadedImageAdmin(admin.ModelAdmin):
+class UploadedImageAdmin(LargeTableAdmin):
     list_display = (
         "id",
         "image",
@@ -150,7 +368,11 @@ class UploadedImageAdmin(admin.ModelAdmin):
         "uploaded_at",
     )
 
-    list_filter = ("user",)
+    list_select_related = ("user",)
+
+    list_filter = (autocomplete_filter(UploadedImage, "user"),)
+
+    autocomplete_fields = ("user",)
 
     search_fields = ["user__username", "image"]
 
@@ -158,7 +380,7 @@ class UploadedImageAdmin(admin.ModelAdmin):
 
 
 @admin.register(UploadedFile)
-class UploadedFileAdmin(admin.ModelAdmin):
+class UploadedFileAdmin(LargeTableAdmin):
     list_display = (
         "id",
         "file",
@@ -166,7 +388,11 @@ class UploadedFileAdmin(admin.ModelAdmin):
         "uploaded_at",
     )
 
-    list_filter = ("user",)
+    list_select_related = ("user",)
+
+    list_filter = (autocomplete_filter(UploadedFile, "user"),)
+
+    autocomplete_fields = ("user",)
 
     search_fields = ["user__username", "file"]
 
@@ -174,18 +400,25 @@ class UploadedFileAdmin(admin.ModelAdmin):
 
 
 @admin.register(ArticleFavorite)
-class ArticleFavoriteAdmin(admin.ModelAdmin):
+class ArticleFavoriteAdmin(LargeTableAdmin):
     list_display = ("user", "article", "favored_at")
 
+    list_select_related = ("user", "article")
+
     search_fields = ["user__username", "article__title"]
 
-    list_filter = ["user", "article"]
+    list_filter = (
+        autocomplete_filter(ArticleFavorite, "user"),
+        autocomplete_filter(ArticleFavorite, "article"),
+    )
+
+    autocomplete_fields = ("user", "article")
 
     date_hierarchy = "favored_at"
 
 
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = (
         "user",
         "username",
@@ -197,26 +430,127 @@ class ProfileAdmin(admin.ModelAdmin):
         "date_joined",
     )
 
+    list_select_related = ("user",)
+
+    autocomplete_fields = ("user", "avatar")
+
     search_fields = ["username", "public_name", "user__username", "bio"]
 
     date_hierarchy = "user__date_joined"
 
+    actions = ["delete_users_in_background"]
+
+    def get_queryset(self, request):
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                num_subscribers=count_subquery(ProfileSubscription, "profile"),
+                num_articles=Coalesce(
+                    Subquery(
+                        Article._base_manager.filter(author=OuterRef("user"))
+                        .order_by()
+                        .values("author")
+                        .annotate(count=Count("pk"))
+                        .values("count")
+                    ),
+                    0,
+                ),
+            )
+        )
+
+    @admin.display(boolean=True, ordering="avatar")
     def has_avatar(self, obj):
-        return obj.avatar is not None
+        return obj.avatar_id is not None
+
+    @admin.display(ordering="num_subscribers")
+    def subscribers_count(self, obj):
+        return obj.num_subscribers
 
+    @admin.display(ordering="num_articles")
+    def articles_count(self, obj):
+        return obj.num_articles
+
+    @admin.display(ordering="user__date_joined")
     def date_joined(self, obj):
         return obj.user.date_joined
 
+    @admin.action(
+        description="Delete the users of selected profiles in the background",
+        permissions=["delete"],
+    )
+    def delete_users_in_background(self, request, queryset):
+        for profile in queryset.select_related("user"):
+            delete_user(profile.user, requested_by=request.user)
+        self.message_user(request, f"{len(queryset)} users hidden and queued")
+
 
 @admin.register(ProfileSubscription)
-class ProfileSubscriptionAdmin(admin.ModelAdmin):
+class ProfileSubscriptionAdmin(LargeTableAdmin):
     list_display = ("user", "subscribed_to", "subscribed_at")
 
+    list_select_related = ("user", "profile__user")
+
     search_fields = ["user__username", "profile__username"]
 
     date_hierarchy = "subscribed_at"
 
-    list_filter = ("user", "profile")
+    list_filter = (
+        autocomplete_filter(ProfileSubscription, "user"),
+        autocomplete_filter(ProfileSubscription, "profile"),
+    )
+
+    autocomplete_fields = ("user", "profile")
 
     def subscribed_to(self, obj):
         return obj.profile.username
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = (
+        "id",
+        "name",
+        "status",
+        "attempts",
+        "run_at",
+        "locked_by",
+    )
+
+    list_filter = ("status", "name")
+
+    search_fields = ["name", "dedup_key"]
+
+    date_hierarchy = "run_at"
+
+
+@admin.register(Deletion)
+class DeletionAdmin(LargeTableAdmin):
+    list_display = (
+        "id",
+        "kind",
+        "object_id",
+        "requested_by",
+        "requested_at",
+        "step",
+        "rows",
+        "finished_at",
+    )
+
+    list_select_related = ("requested_by",)
+
+    list_filter = ("kind",)
+
+    date_hierarchy = "requested_at"
+
+    readonly_fields = [field.name for field in Deletion._meta.fields]
+
+
+# Registered by `django.contrib.auth.admin` when imported above.
+admin.site.unregister(User)
+
+
+@admin.register(User)
+class UserAdmin(BackgroundDeletionAdmin, auth_admin.UserAdmin):
+    def delete_later(self, obj, requested_by):
+        delete_user(obj, requested_by=requested_by)
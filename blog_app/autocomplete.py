@@ -0,0 +1,329 @@
+import heapq
+import logging
+import sys
+import threading
+import time
+import unicodedata
+from functools import partial
+
+from django.conf import settings
+from django.db import models, transaction
+
+from blog_app.invalidation import get_transport, handles, publish
+from blog_app.models import Article, Profile, Tag
+
+logger = logging.getLogger(__name__)
+
+
+def normalize(text) -> str:
+    """Case, accent and whitespace insensitive form of `text`."""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.split())
+
+
+class _Node:
+    __slots__ = ("children", "ids", "top")
+
+    def __init__(self):
+        self.children = {}
+        # Entries with a key ending here, `None` when there are none.
+        self.ids = None
+        # Ranks of the best entries under the node, best first.
+        self.top = ()
+
+
+class PrefixIndex:
+    """
+    Trie of the normalized keys of weighted entries. Every node keeps the
+    `size` heaviest entries under it, so a lookup only walks the prefix.
+
+    An entry can have several keys, the words of a title for instance.
+    Keys are indexed up to `max_depth` characters, longer prefixes filter
+    the entries under the deepest node.
+
+    Writes are serialized, lookups don't lock: the tops of the nodes are
+    replaced, never changed in place.
+    """
+
+    def __init__(self, size=10, max_depth=12):
+        self.size = size
+        self.max_depth = max_depth
+        self.root = _Node()
+        # id -> (label, weight, normalized keys)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _rank(self, entry_id):
+        label, weight, _ = self.entries[entry_id]
+        return (-weight, label, entry_id)
+
+    def _add_keys(self, entry_id, keys) -> list:
+        """Add the entry to the end nodes of its keys, return their paths."""
+        paths = []
+        for key in keys:
+            node = self.root
+            path = [node]
+            for char in key[: self.max_depth]:
+                child = node.children.get(char)
+                if child is None:
+                    child = node.children[char] = _Node()
+                node = child
+                path.append(node)
+            if node.ids is None:
+                node.ids = set()
+            node.ids.add(entry_id)
+            paths.append(path)
+        return paths
+
+    def _compute_top(self, node):
+        ranks = {self._rank(entry_id) for entry_id in node.ids or ()}
+        for child in node.children.values():
+            ranks.update(child.top)
+        node.top = tuple(heapq.nsmallest(self.size, ranks))
+
+    def load(self, entries):
+        """
+        Add `(id, label, weight, keys)` entries, `keys` defaults to the
+        label. Faster than `set()` for many entries, tops are computed once.
+        """
+        with self.lock:
+            for entry_id, label, weight, keys in entries:
+                if entry_id in self.entries:
+                    self._remove(entry_id)
+                keys = self._normalize_keys(label, keys)
+                self.entries[entry_id] = (label, weight, keys)
+                self._add_keys(entry_id, keys)
+            # Children before parents.
+            stack = [(self.root, False)]
+            while stack:
+                node, visited = stack.pop()
+                if visited:
+                    self._compute_top(node)
+                else:
+                    stack.append((node, True))
+                    stack.extend((child, False) for child in node.children.values())
+
+    def set(self, entry_id, label, weight, keys=None):
+        keys = self._normalize_keys(label, keys)
+        with self.lock:
+            if entry_id in self.entries:
+                self._remove(entry_id)
+            self.entries[entry_id] = (label, weight, keys)
+            rank = self._rank(entry_id)
+            for path in self._add_keys(entry_id, keys):
+                for node in path:
+                    if rank in node.top:
+                        continue
+                    if len(node.top) < self.size or rank < node.top[-1]:
+                        node.top = tuple(sorted((*node.top, rank))[: self.size])
+
+    def remove(self, entry_id):
+        with self.lock:
+            if entry_id in self.entries:
+                self._remove(entry_id)
+
+    def _remove(self, entry_id):
+        rank = self._rank(entry_id)
+        _, _, keys = self.entries.pop(entry_id)
+        paths = []
+        for key in keys:
+            path = [self.root]
+            for char in key[: self.max_depth]:
+                path.append(path[-1].children[char])
+            path[-1].ids.discard(entry_id)
+            paths.append((key[: self.max_depth], path))
+        # Once the entry is gone from every end node, so that the tops
+        # computed don't take it from a node not updated yet.
+        for key, path in paths:
+            for depth in range(len(path) - 1, -1, -1):
+                node = path[depth]
+                if not node.ids:
+                    node.ids = None
+                if depth and node.ids is None and not node.children:
+                    # Already gone when another key of the entry ended below.
+                    path[depth - 1].children.pop(key[depth - 1], None)
+                elif rank in node.top:
+                    self._compute_top(node)
+
+    def _normalize_keys(self, label, keys) -> tuple:
+        keys = {normalize(key) for key in ((label,) if keys is None else keys)}
+        keys.discard("")
+        return tuple(keys)
+
+    def lookup(self, prefix, limit=None) -> list:
+        """Return the `(id, label, weight)` of the heaviest matches of `prefix`."""
+        prefix = normalize(prefix)
+        limit = min(limit or self.size, self.size)
+        node = self.root
+        for char in prefix[: self.max_depth]:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        if len(prefix) <= self.max_depth:
+            ranks = node.top[:limit]
+        else:
+            # Few entries share that many characters, filter them all.
+            ids = set()
+            stack = [node]
+            while stack:
+                node = stack.pop()
+                ids.update(node.ids or ())
+                stack.extend(node.children.values())
+            matches = []
+            for entry_id in ids:
+                entry = self.entries.get(entry_id)
+                if entry and any(key.startswith(prefix) for key in entry[2]):
+                    matches.append((-entry[1], entry[0], entry_id))
+            ranks = heapq.nsmallest(limit, matches)
+        return [(entry_id, label, -weight) for weight, label, entry_id in ranks]
+
+    def get_stats(self) -> dict:
+        """Return the counts and approximate memory of the index, walks it all."""
+        nodes = 0
+        size = sys.getsizeof(self.entries)
+        for label, weight, keys in list(self.entries.values()):
+            size += sys.getsizeof(label) + sys.getsizeof(keys)
+            size += sum(sys.getsizeof(key) for key in keys)
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            size += sys.getsizeof(node) + sys.getsizeof(node.children)
+            size += sys.getsizeof(node.top)
+            if node.ids is not None:
+                size += sys.getsizeof(node.ids)
+            stack.extend(node.children.values())
+        return {"entries": len(self.entries), "nodes": nodes, "bytes": size}
+
+
+def title_keys(title) -> list:
+    # Every word starts a key, "python" finds "Learning Python".
+    words = title.split()
+    return [" ".join(words[index:]) for index in range(len(words))]
+
+
+def _tag_entries(**filters):
+    tags = (
+        Tag.objects.filter(**filters)
+        .annotate(
+            count=models.Count(
+                "articles", filter=models.Q(articles__deleted_at=None)
+            )
+        )
+        .values_list("name", "count")
+    )
+    for name, count in tags:
+        yield name, name, count, None
+
+
+def _title_entries(**filters):
+    articles = Article._base_manager.filter(deleted_at=None, **filters).values_list(
+        "pk", "title", "views"
+    )
+    for pk, title, views in articles.iterator():
+        yield pk, title, views, title_keys(title)
+
+
+def _username_entries(**filters):
+    profiles = (
+        Profile.objects.filter(**filters)
+        .annotate(count=models.Count("subscribers"))
+        .values_list("pk", "username", "count")
+    )
+    for pk, username, count in profiles.iterator():
+        yield pk, username, count, None
+
+
+# Index name -> entries, weighted by articles, views and subscribers.
+SOURCES = {
+    "tags": _tag_entries,
+    "titles": _title_entries,
+    "usernames": _username_entries,
+}
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+_build_seconds = {}
+
+
+def build_index(name) -> PrefixIndex:
+    started = time.perf_counter()
+    index = PrefixIndex(
+        size=settings.AUTOCOMPLETE_LIMIT,
+        max_depth=settings.AUTOCOMPLETE_MAX_DEPTH,
+    )
+    index.load(SOURCES[name]())
+    _build_seconds[name] = time.perf_counter() - started
+    logger.info(
+        "Built the %s autocomplete index of %d entries in %.2fs",
+        name,
+        len(index),
+        _build_seconds[name],
+    )
+    return index
+
+
+def get_index(name) -> PrefixIndex:
+    """Return the process wide index `name`, built on first use."""
+    index = _indexes.get(name)
+    if index is None:
+        with _indexes_lock:
+            index = _indexes.get(name)
+            if index is None:
+                index = _indexes[name] = build_index(name)
+    return index
+
+
+def preload():
+    """Build the indexes in the background, before the first lookups."""
+
+    def build_all():
+        for name in SOURCES:
+            try:
+                get_index(name)
+            except Exception:
+                logger.exception("Failed to build the %s autocomplete index", name)
+
+    threading.Thread(target=build_all, name="autocomplete-preload", daemon=True).start()
+
+
+def _reload_entries(name, entry_ids):
+    index = _indexes.get(name)
+    if index is None:
+        return
+    found = set()
+    for entry in SOURCES[name](pk__in=entry_ids):
+        index.set(*entry)
+        found.add(entry[0])
+    for entry_id in set(entry_ids) - found:
+        index.remove(entry_id)
+
+
+def reload_entries(name, entry_ids):
+    """
+    Read entries of the index `name` again once the transaction commits,
+    in the processes where the index is built. `entry_ids` can be a lazy
+    queryset, it is only read if this or other processes may have built it.
+    """
+    if name not in _indexes and get_transport() is None:
+        return
+    entry_ids = list(entry_ids)
+    if name in _indexes:
+        transaction.on_commit(partial(_reload_entries, name, entry_ids))
+    publish("entries", {"name": name, "entry_ids": entry_ids})
+
+
+@handles("entries")
+def entries_published(name, entry_ids):
+    _reload_entries(name, entry_ids)
+
+
+def get_autocomplete_stats() -> dict:
+    return {
+        name: {**index.get_stats(), "build_seconds": _build_seconds.get(name)}
+        for name, index in list(_indexes.items())
+    }
@@ -0,0 +1,33 @@
+from uuid import uuid4
+
+from django.core.cache import cache
+
+from blog_app.invalidation import handles, publish
+
+
+def version_key(kind: str, pk) -> str:
+    return f"blog_app:version:{kind}:{pk}"
+
+
+def get_versions(*keys: str) -> dict[str, str]:
+    """
+    Return the current version of each key. Cached data built from an
+    object stays valid while the versions it was built with are unchanged.
+    """
+    versions = cache.get_many(keys)
+    return {key: versions.get(key, "") for key in keys}
+
+
+def bump_version(kind: str, pk):
+    # A random version, unlike a counter, can't come back to an old value
+    # after the key was evicted.
+    key = version_key(kind, pk)
+    version = uuid4().hex
+    cache.set(key, version, timeout=None)
+    # Other processes may have their own cache.
+    publish("version", {"key": key, "version": version})
+
+
+@handles("version")
+def set_version(key, version):
+    cache.set(key, version, timeout=None)
@@ -0,0 +1,167 @@
+import hashlib
+import re
+import zlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from blog_app.caching import get_versions
+
+# Preferred first when the client accepts several with the same quality.
+ENCODINGS = ("gzip", "deflate")
+
+COMPRESSIBLE_TYPES = re.compile(
+    r"^(text/|application/(json|javascript|xml|yaml|x-ndjson|vnd\.oai\.openapi))"
+)
+
+
+def negotiate_encoding(request) -> str | None:
+    """Pick the content coding from the request's `Accept-Encoding`."""
+    qualities = {}
+    for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        match = re.search(r"q\s*=\s*([0-9.]+)", params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        if coding:
+            qualities[coding] = quality
+    best, best_quality = None, 0.0
+    for coding in ENCODINGS:
+        quality = qualities.get(coding, qualities.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def _compressor(encoding, level):
+    # gzip framing for "gzip", zlib framing for "deflate" as in RFC 9110.
+    wbits = 31 if encoding == "gzip" else 15
+    return zlib.compressobj(level, zlib.DEFLATED, wbits)
+
+
+def compress(data: bytes, encoding: str, level: int | None = None) -> bytes:
+    if level is None:
+        level = settings.COMPRESSION_LEVEL
+    compressor = _compressor(encoding, level)
+    return compressor.compress(data) + compressor.flush()
+
+
+def compress_stream(chunks, encoding: str, level: int | None = None):
+    if level is None:
+        level = settings.COMPRESSION_STREAMING_LEVEL
+    compressor = _compressor(encoding, level)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def is_compressible(response) -> bool:
+    return bool(COMPRESSIBLE_TYPES.match(response.get("Content-Type", "")))
+
+
+class CompressionMiddleware:
+    """
+    Compresses responses with gzip or deflate, as accepted by the client.
+
+    Responses smaller than `COMPRESSION_MIN_SIZE` are sent as they are,
+    streaming responses are compressed chunk by chunk. Responses marked by
+    `ResponseCache` are stored compressed once compressed.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.has_header("Content-Encoding") or not is_compressible(response):
+            return response
+
+        patch_vary_headers(response, ("Accept-Encoding",))
+        encoding = negotiate_encoding(request)
+        response_cache = getattr(response, "response_cache", None)
+
+        if response.streaming:
+            if encoding is None or response.is_async:
+                return response
+            response.streaming_content = compress_stream(
+                response.streaming_content,
+                encoding,
+            )
+            del response.headers["Content-Length"]
+        else:
+            content = response.content
+            if encoding is not None and len(content) >= settings.COMPRESSION_MIN_SIZE:
+                compressed = compress(content, encoding)
+                if len(compressed) < len(content):
+                    response.content = compressed
+                    response.headers["Content-Length"] = str(len(compressed))
+                else:
+                    encoding = None
+            else:
+                encoding = None
+            if response_cache is not None and response.status_code == 200:
+                response_cache.store(response, encoding)
+
+        if encoding is not None:
+            etag = response.get("ETag")
+            if etag and etag.startswith('"'):
+                response.headers["ETag"] = "W/" + etag
+            response.headers["Content-Encoding"] = encoding
+        return response
+
+
+class ResponseCache:
+    """
+    Cache of rendered and compressed responses.
+
+    Entries are looked up by request path and negotiated encoding, and are
+    stale as soon as one of the version keys passed to `track()` changes,
+    see `bump_version()`.
+    """
+
+    def __init__(self, request, name):
+        self.encoding = negotiate_encoding(request)
+        path_hash = hashlib.md5(request.get_full_path().encode()).hexdigest()
+        self.key = f"blog_app:response:{name}:{path_hash}:{self.encoding}"
+        self.versions = {}
+
+    def track(self, *version_keys):
+        # Called before the response is built, so that changes made while
+        # it is built make the entry stale.
+        self.versions = get_versions(*version_keys)
+
+    def get(self) -> HttpResponse | None:
+        entry = cache.get(self.key)
+        if entry is None or get_versions(*entry["versions"]) != entry["versions"]:
+            return None
+        response = HttpResponse(entry["content"], content_type=entry["content_type"])
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if entry["encoding"] is not None:
+            response.headers["Content-Encoding"] = entry["encoding"]
+        return response
+
+    def mark(self, response):
+        """Store `response` once `CompressionMiddleware` compressed it."""
+        response.response_cache = self
+        return response
+
+    def store(self, response, encoding):
+        cache.set(
+            self.key,
+            {
+                "content": response.content,
+                "content_type": response["Content-Type"],
+                "encoding": encoding,
+                "versions": self.versions,
+            },
+            timeout=settings.COMPRESSION_CACHE_TIMEOUT,
+        )
@@ -0,0 +1,254 @@
+import logging
+import time
+from dataclasses import dataclass
+from typing import Callable
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, models, transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from blog_app.autocomplete import reload_entries
+from blog_app.caching import bump_version
+from blog_app.jobs import enqueue
+from blog_app.models import (
+    Article,
+    ArticleFavorite,
+    ArticleRate,
+    Comment,
+    CommentRate,
+    Deletion,
+    Profile,
+    ProfileSubscription,
+    RelatedArticle,
+    SimilarArticle,
+)
+from blog_app.recommendations import interactions_removed
+from blog_app.related import schedule_refresh
+from blog_app.signals import invalidate_article
+
+logger = logging.getLogger(__name__)
+
+ArticleTag = Article.tags.through
+
+
+@dataclass
+class Step:
+    """
+    Rows to delete, a batch at a time, before the object itself.
+
+    Rows are deleted without signals nor cascades, unless `send_signals`
+    is set. With `set_null`, the field is cleared instead, like
+    `on_delete=SET_NULL` does. `before` is called with the rows of each
+    batch before they go.
+    """
+
+    queryset: models.QuerySet
+    set_null: str | None = None
+    send_signals: bool = False
+    before: Callable | None = None
+
+
+def _tags_deleted(rows):
+    reload_entries("tags", rows.values_list("tag_id", flat=True).distinct())
+
+
+def _related_deleted(rows):
+    # The lists of the articles staying lose an article, fill them up again.
+    for article_id in (
+        rows.filter(article__deleted_at=None)
+        .values_list("article_id", flat=True)
+        .distinct()
+    ):
+        schedule_refresh(article_id)
+
+
+def _rates_deleted(rows):
+    article_ids = list(
+        rows.filter(article__deleted_at=None)
+        .values_list("article_id", flat=True)
+        .distinct()
+    )
+    for article_id in article_ids:
+        invalidate_article(article_id)
+    interactions_removed(article_ids)
+
+
+def _subscriptions_deleted(rows):
+    profiles = rows.filter(profile__deleted_at=None)
+    for user_id in profiles.values_list("profile__user_id", flat=True).distinct():
+        bump_version("author", user_id)
+    reload_entries("usernames", profiles.values_list("profile_id", flat=True))
+
+
+def get_article_steps(articles) -> list[Step]:
+    """Steps deleting what cascades from the `articles` queryset."""
+    comments = Comment._base_manager.filter(article__in=articles)
+    return [
+        Step(CommentRate.objects.filter(comment__in=comments)),
+        # Replies first, the comments they reply to are leaves after them.
+        Step(comments.filter(replies=None)),
+        Step(ArticleRate.objects.filter(article__in=articles)),
+        Step(ArticleFavorite.objects.filter(article__in=articles)),
+        Step(ArticleTag.objects.filter(article__in=articles), before=_tags_deleted),
+        Step(
+            RelatedArticle.objects.filter(
+                models.Q(article__in=articles) | models.Q(related__in=articles)
+            ),
+            before=_related_deleted,
+        ),
+        Step(
+            SimilarArticle.objects.filter(
+                models.Q(article__in=articles) | models.Q(similar__in=articles)
+            )
+        ),
+        # Nothing cascades anymore, the signals update the caches.
+        Step(articles, send_signals=True),
+    ]
+
+
+def get_steps(deletion) -> list[Step]:
+    if deletion.kind == Deletion.ARTICLE:
+        return get_article_steps(
+            Article._base_manager.filter(pk=deletion.object_id)
+        )
+    user_id = deletion.object_id
+    return [
+        *get_article_steps(Article._base_manager.filter(author_id=user_id)),
+        Step(Comment._base_manager.filter(author_id=user_id), set_null="author"),
+        Step(CommentRate.objects.filter(user_id=user_id)),
+        Step(ArticleRate.objects.filter(user_id=user_id), before=_rates_deleted),
+        Step(ArticleFavorite.objects.filter(user_id=user_id), before=_rates_deleted),
+        Step(
+            ProfileSubscription.objects.filter(
+                models.Q(user_id=user_id) | models.Q(profile__user_id=user_id)
+            ),
+            before=_subscriptions_deleted,
+        ),
+        # The profile, tokens and uploads are left, few rows.
+        Step(User.objects.filter(pk=user_id), send_signals=True),
+    ]
+
+
+def delete_rows(model, ids):
+    """
+    Delete the rows of `model` with these primary keys in one statement,
+    without the signals nor the cascades `delete()` would fetch them for.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+
+
+def run_batch(step, batch_size) -> int:
+    """Delete a batch of the rows of `step`, return how many."""
+    model = step.queryset.model
+    ids = list(step.queryset.values_list("pk", flat=True)[:batch_size])
+    if not ids:
+        return 0
+    with transaction.atomic():
+        rows = model._base_manager.filter(pk__in=ids)
+        if step.before is not None:
+            step.before(rows)
+        if step.set_null:
+            rows.update(**{step.set_null: None})
+        elif step.send_signals:
+            rows.delete()
+        else:
+            delete_rows(model, ids)
+    return len(ids)
+
+
+def run_deletion(deletion_id):
+    """
+    Run the steps of a deletion a batch at a time, for up to
+    `DELETION_JOB_SECONDS`, then queue the rest. Batches are separate
+    transactions, so writers are only held up by a batch.
+    """
+    deletion = Deletion.objects.filter(pk=deletion_id, finished_at=None).first()
+    if deletion is None:
+        return
+    steps = get_steps(deletion)
+    deadline = time.monotonic() + settings.DELETION_JOB_SECONDS
+    while deletion.step < len(steps):
+        step = steps[deletion.step]
+        count = run_batch(step, settings.DELETION_BATCH_SIZE)
+        if count:
+            label = step.queryset.model._meta.label_lower
+            deletion.rows[label] = deletion.rows.get(label, 0) + count
+            deletion.save(update_fields=["rows"])
+        else:
+            deletion.step += 1
+            deletion.save(update_fields=["step"])
+        if time.monotonic() > deadline:
+            _enqueue(deletion_id)
+            return
+    deletion.finished_at = timezone.now()
+    deletion.save(update_fields=["finished_at"])
+    logger.info("%s done: %s", deletion, deletion.rows)
+
+
+def delete_article(article, requested_by=None) -> Deletion:
+    """Hide the article at once and delete it in the background."""
+    with transaction.atomic():
+        Article._base_manager.filter(pk=article.pk).update(
+            deleted_at=timezone.now()
+        )
+        invalidate_article(article.pk, article.author_id)
+        reload_entries("titles", [article.pk])
+        reload_entries("tags", article.tags.values_list("name", flat=True))
+        return _request(Deletion.ARTICLE, article.pk, requested_by)
+
+
+def delete_user(user, requested_by=None) -> Deletion:
+    """
+    Log the user out, hide their profile and articles at once and delete
+    them in the background. Their comments stay, without author.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        Token.objects.filter(user_id=user.pk).delete()
+        Profile._base_manager.filter(user_id=user.pk).update(deleted_at=now)
+        articles = Article._base_manager.filter(author_id=user.pk, deleted_at=None)
+        article_ids = list(articles.values_list("pk", flat=True))
+        articles.update(deleted_at=now)
+        for article_id in article_ids:
+            bump_version("article", article_id)
+        bump_version("author", user.pk)
+        reload_entries("titles", article_ids)
+        reload_entries(
+            "tags",
+            ArticleTag.objects.filter(article_id__in=article_ids)
+            .values_list("tag_id", flat=True)
+            .distinct(),
+        )
+        reload_entries(
+            "usernames",
+            Profile._base_manager.filter(user_id=user.pk).values_list("pk", flat=True),
+        )
+        return _request(Deletion.USER, user.pk, requested_by)
+
+
+def _request(kind, object_id, requested_by):
+    deletion, created = Deletion.objects.get_or_create(
+        kind=kind,
+        object_id=object_id,
+        defaults={"requested_by": requested_by},
+    )
+    if created:
+        _enqueue(deletion.pk)
+    return deletion
+
+
+def _enqueue(deletion_id):
+    # Never run by the request, even with `JOBS_EAGER`.
+    enqueue(
+        run_deletion,
+        deletion_id,
+        dedup_key=f"deletion:{deletion_id}",
+        always_queue=True,
+    )
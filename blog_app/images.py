@@ -0,0 +1,82 @@
+import base64
+import io
+import logging
+
+from django.conf import settings
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+
+from blog_app.caching import bump_version
+from blog_app.models import Article, Profile, UploadedImage
+
+logger = logging.getLogger(__name__)
+
+# EXIF orientations turning the image a quarter.
+TRANSPOSED_ORIENTATIONS = {5, 6, 7, 8}
+
+
+def analyze_image(file) -> dict:
+    """
+    Return the displayed size, format, dominant colour and placeholder of
+    an image file, the `UploadedImage` fields.
+    """
+    size = settings.IMAGE_PLACEHOLDER_SIZE
+    with Image.open(file) as image:
+        image_format = image.format or ""
+        width, height = image.size
+        orientation = image.getexif().get(ExifTags.Base.Orientation)
+        if orientation in TRANSPOSED_ORIENTATIONS:
+            width, height = height, width
+        # JPEGs are decoded at the smallest scale still larger than needed.
+        image.draft("RGB", (size, size))
+        image = ImageOps.exif_transpose(image)
+        if "A" in image.getbands() or "transparency" in image.info:
+            # Transparent parts would turn black, lay them on white.
+            image = image.convert("RGBA")
+            background = Image.new("RGBA", image.size, "white")
+            image = Image.alpha_composite(background, image)
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+
+    paletted = image.quantize(colors=4)
+    _, index = max(paletted.getcolors())
+    red, green, blue = paletted.getpalette()[index * 3 : index * 3 + 3]
+
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=settings.IMAGE_PLACEHOLDER_QUALITY)
+    return {
+        "width": width,
+        "height": height,
+        "format": image_format,
+        "dominant_color": f"#{red:02x}{green:02x}{blue:02x}",
+        "placeholder": "data:image/jpeg;base64,"
+        + base64.b64encode(buffer.getvalue()).decode("ascii"),
+    }
+
+
+def process_image(image_id):
+    """Store the metadata of an uploaded image, run as a job after uploads."""
+    uploaded = UploadedImage.objects.filter(pk=image_id).first()
+    if uploaded is None:
+        return
+    try:
+        with uploaded.image.open("rb") as file:
+            metadata = analyze_image(file)
+        metadata["file_size"] = uploaded.image.size
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        # Not retried, the file won't get better.
+        logger.warning("Can't read the image %s: %s", uploaded, error)
+        metadata = {}
+    UploadedImage.objects.filter(pk=image_id).update(
+        processed_at=timezone.now(),
+        **metadata,
+    )
+    # Responses embedding the image are cached.
+    for article_id in Article._base_manager.filter(cover_id=image_id).values_list(
+        "pk", flat=True
+    ):
+        bump_version("article", article_id)
+    for user_id in Profile._base_manager.filter(avatar_id=image_id).values_list(
+        "user_id", flat=True
+    ):
+        bump_version("author", user_id)
@@ -0,0 +1,275 @@
+import logging
+import os
+import socket
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter, deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from blog_app.models import Invalidation
+
+logger = logging.getLogger(__name__)
+
+# Messages of this process, by (topic, outcome).
+invalidation_counts = Counter()
+# Seconds between the publication and the handling of the last messages
+# received.
+invalidation_lags = deque(maxlen=1000)
+
+_handlers = {}
+
+
+def handles(topic):
+    """
+    Register the decorated function to handle the messages of `topic` sent
+    by other processes, called with the payload as keyword arguments.
+    """
+
+    def register(func):
+        _handlers[topic] = func
+        return func
+
+    return register
+
+
+def get_publisher() -> str:
+    """Name of this process in messages, a listener skips its own."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+@dataclass
+class Message:
+    topic: str
+    payload: dict
+    publisher: str = ""
+    published_at: datetime | None = None
+
+
+class Transport(ABC):
+    """
+    Carries messages to every process, the `INVALIDATION_TRANSPORT`.
+    `publish()` is called from any thread, `receive()` from the listener
+    thread of a process.
+    """
+
+    @abstractmethod
+    def publish(self, messages: list[Message]):
+        pass
+
+    @abstractmethod
+    def receive(self) -> list[Message]:
+        """
+        Return the messages sent since the last call, those of this process
+        included, up to `INVALIDATION_BATCH_SIZE`.
+        """
+
+
+class DatabaseTransport(Transport):
+    """
+    Messages are rows of the `Invalidation` table, polled by the listeners
+    and deleted after `INVALIDATION_RETENTION_SECONDS`. SQLite serializes
+    writers, so ids grow in commit order and reading after the last id seen
+    can't skip a message.
+    """
+
+    def __init__(self):
+        self.last_id = None
+        self.next_prune = timezone.now()
+
+    def publish(self, messages):
+        Invalidation.objects.bulk_create(
+            Invalidation(
+                topic=message.topic,
+                payload=message.payload,
+                publisher=message.publisher,
+                published_at=message.published_at,
+            )
+            for message in messages
+        )
+        now = timezone.now()
+        if now > self.next_prune:
+            retention = timedelta(seconds=settings.INVALIDATION_RETENTION_SECONDS)
+            self.next_prune = now + retention / 10
+            Invalidation.objects.filter(published_at__lt=now - retention).delete()
+
+    def receive(self):
+        if self.last_id is None:
+            # The caches of a new process are empty, nothing to invalidate.
+            self.last_id = Invalidation.objects.aggregate(last=models.Max("pk"))
+            self.last_id = self.last_id["last"] or 0
+            return []
+        rows = list(
+            Invalidation.objects.filter(pk__gt=self.last_id).order_by("pk")[
+                : settings.INVALIDATION_BATCH_SIZE
+            ]
+        )
+        if rows:
+            self.last_id = rows[-1].pk
+        return [
+            Message(row.topic, row.payload, row.publisher, row.published_at)
+            for row in rows
+        ]
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport() -> Transport | None:
+    """Return the process wide `INVALIDATION_TRANSPORT`, `None` without."""
+    global _transport
+    if _transport is None and settings.INVALIDATION_TRANSPORT:
+        with _transport_lock:
+            if _transport is None:
+                _transport = import_string(settings.INVALIDATION_TRANSPORT)()
+    return _transport
+
+
+_outbox = threading.local()
+
+
+def publish(topic, payload):
+    """
+    Send a message to the other processes once the transaction commits.
+    The caller invalidates the caches of this process itself.
+    """
+    if get_transport() is None:
+        return
+    if not hasattr(_outbox, "messages"):
+        _outbox.messages = []
+    _outbox.messages.append(Message(topic, payload))
+    # The first callback sends the messages of the transaction at once.
+    # Those of a rolled back one go with the next commit, invalidating
+    # more than needed is harmless.
+    transaction.on_commit(_flush)
+
+
+@contextmanager
+def batched_publishes():
+    """
+    Send the messages published in the block at once when it ends, rather
+    than with each commit. Wraps requests and jobs, which may commit many
+    times, each once in autocommit.
+    """
+    _outbox.depth = getattr(_outbox, "depth", 0) + 1
+    try:
+        yield
+    finally:
+        _outbox.depth -= 1
+        if not _outbox.depth:
+            # Not before the commit, the others could cache the old data.
+            transaction.on_commit(_flush)
+
+
+def _flush():
+    messages = getattr(_outbox, "messages", None)
+    if not messages or getattr(_outbox, "depth", 0):
+        return
+    _outbox.messages = []
+    publisher = get_publisher()
+    now = timezone.now()
+    for message in messages:
+        message.publisher = publisher
+        message.published_at = now
+    try:
+        get_transport().publish(messages)
+    except Exception:
+        logger.exception("Failed to publish %s invalidations", len(messages))
+        outcome = "unsent"
+    else:
+        outcome = "sent"
+    for message in messages:
+        invalidation_counts[message.topic, outcome] += 1
+
+
+class InvalidationMiddleware:
+    """Sends the invalidations of a request in one batch, see `publish()`."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with batched_publishes():
+            return self.get_response(request)
+
+
+def handle(message):
+    lag = (timezone.now() - message.published_at).total_seconds()
+    invalidation_lags.append(lag)
+    handler = _handlers.get(message.topic)
+    if handler is None:
+        invalidation_counts[message.topic, "unhandled"] += 1
+        return
+    try:
+        handler(**message.payload)
+    except Exception:
+        logger.exception("Failed to handle a %s invalidation", message.topic)
+        invalidation_counts[message.topic, "failed"] += 1
+    else:
+        invalidation_counts[message.topic, "received"] += 1
+
+
+def listen(stopped: threading.Event):
+    """Handle the messages of the other processes until `stopped` is set."""
+    transport = get_transport()
+    publisher = get_publisher()
+    while not stopped.is_set():
+        messages = []
+        try:
+            messages = transport.receive()
+            for message in messages:
+                if message.publisher != publisher:
+                    handle(message)
+        except Exception:
+            logger.exception("Invalidation listener failed")
+        finally:
+            close_old_connections()
+        # Messages are late by a poll interval at most, unless piling up.
+        if len(messages) < settings.INVALIDATION_BATCH_SIZE:
+            stopped.wait(settings.INVALIDATION_POLL_INTERVAL)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def start_listener() -> threading.Event | None:
+    """
+    Start the listener thread of this process, once. Return the event
+    stopping it, `None` without transport.
+    """
+    global _listener
+    if get_transport() is None:
+        return None
+    with _listener_lock:
+        if _listener is None:
+            _listener = threading.Event()
+            threading.Thread(
+                target=listen,
+                args=(_listener,),
+                name="invalidation-listener",
+                daemon=True,
+            ).start()
+    return _listener
+
+
+def get_invalidation_stats() -> dict:
+    lags = sorted(invalidation_lags)
+    return {
+        "messages": {
+            f"{topic}:{outcome}": count
+            for (topic, outcome), count in invalidation_counts.items()
+        },
+        "lag_seconds": {
+            "p50": lags[len(lags) // 2] if lags else None,
+            "p99": lags[int(len(lags) * 0.99)] if lags else None,
+            "max": lags[-1] if lags else None,
+        },
+    }
@@ -0,0 +1,272 @@
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from collections import Counter
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, models, transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from blog_app.invalidation import batched_publishes
+from blog_app.models import Job
+
+logger = logging.getLogger(__name__)
+
+# Jobs handled by this process, by (name, outcome), and their run time.
+job_counts = Counter()
+job_seconds = Counter()
+
+
+def get_job_name(func) -> str:
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def enqueue(
+    func,
+    *args,
+    dedup_key=None,
+    delay=0,
+    max_attempts=None,
+    always_queue=False,
+    **kwargs,
+) -> Job | None:
+    """
+    Queue a call of `func`, a module level function, with JSON serializable
+    arguments. Jobs may run more than once and should be idempotent.
+
+    The job is part of the current transaction. Return `None` when a job
+    with the same `dedup_key` is already queued. With the `JOBS_EAGER`
+    setting, the call is made in process once the transaction commits,
+    once for the calls with the same `dedup_key` in the transaction, unless
+    `always_queue` is set for jobs too long to hold up a request.
+    """
+    name = get_job_name(func)
+    if settings.JOBS_EAGER and not always_queue:
+        _on_commit_once(
+            dedup_key, name, partial(_run_eager, name, func, *args, **kwargs)
+        )
+        return None
+    try:
+        with transaction.atomic():
+            queued = Job.objects.create(
+                name=name,
+                args=list(args),
+                kwargs=kwargs,
+                dedup_key=dedup_key,
+                max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+                run_at=timezone.now() + timedelta(seconds=delay),
+            )
+    except IntegrityError:
+        if dedup_key is None:
+            raise
+        job_counts[name, "deduplicated"] += 1
+        return None
+    job_counts[name, "enqueued"] += 1
+    return queued
+
+
+def enqueue_on_commit(func, *args, dedup_key, **kwargs):
+    """
+    Queue a job like `enqueue()` once the transaction commits, once for the
+    calls with the same `dedup_key` in the transaction. For work following
+    every change of an object, which may change many times in a transaction.
+    """
+    _on_commit_once(
+        dedup_key,
+        get_job_name(func),
+        partial(enqueue, func, *args, dedup_key=dedup_key, **kwargs),
+    )
+
+
+# Dedup keys of the callbacks waiting for the commit, by thread.
+_waiting = threading.local()
+
+
+def _on_commit_once(dedup_key, name, callback):
+    # Decided when the callbacks run, the keys of rolled back transactions
+    # are left behind but never skip a callback.
+    if dedup_key is None:
+        transaction.on_commit(callback)
+        return
+    if not hasattr(_waiting, "keys"):
+        _waiting.keys = set()
+    _waiting.keys.add(dedup_key)
+
+    def run():
+        if dedup_key not in _waiting.keys:
+            job_counts[name, "deduplicated"] += 1
+            return
+        _waiting.keys.discard(dedup_key)
+        callback()
+
+    transaction.on_commit(run)
+
+
+def _run_eager(name, func, *args, **kwargs):
+    # The transaction is committed, a failing job mustn't fail the request.
+    started = time.monotonic()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        job_counts[name, "failed"] += 1
+        logger.exception("Job %s failed", name)
+    else:
+        job_counts[name, "succeeded"] += 1
+    finally:
+        job_seconds[name] += time.monotonic() - started
+
+
+def claim_job(worker) -> Job | None:
+    """Mark the next due job as run by `worker` and return it."""
+    now = timezone.now()
+    due = (
+        Job.objects.filter(status=Job.QUEUED, run_at__lte=now)
+        .order_by("run_at")
+        .values_list("pk", flat=True)[:10]
+    )
+    for pk in due:
+        # Only one worker's update matches, whatever the database.
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            locked_by=worker,
+            locked_at=now,
+            attempts=models.F("attempts") + 1,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def _requeue(job, run_at, error=""):
+    try:
+        with transaction.atomic():
+            Job.objects.filter(pk=job.pk).update(
+                status=Job.QUEUED,
+                run_at=run_at,
+                locked_by="",
+                locked_at=None,
+                last_error=error,
+            )
+    except IntegrityError:
+        # The same work was queued again meanwhile.
+        Job.objects.filter(pk=job.pk).delete()
+
+
+def run_job(job):
+    started = time.monotonic()
+    try:
+        with batched_publishes():
+            import_string(job.name)(*job.args, **job.kwargs)
+    except Exception:
+        error = traceback.format_exc()
+        if job.attempts < job.max_attempts:
+            backoff = min(
+                settings.JOBS_RETRY_BACKOFF * 2 ** (job.attempts - 1),
+                settings.JOBS_RETRY_BACKOFF_MAX,
+            )
+            # Jittered, so jobs failing together don't retry together.
+            backoff = random.uniform(backoff / 2, backoff)
+            _requeue(job, timezone.now() + timedelta(seconds=backoff), error)
+            job_counts[job.name, "retried"] += 1
+        else:
+            Job.objects.filter(pk=job.pk).update(status=Job.FAILED, last_error=error)
+            job_counts[job.name, "failed"] += 1
+            logger.error("Job %s failed %d times:\n%s", job, job.attempts, error)
+    else:
+        Job.objects.filter(pk=job.pk).delete()
+        job_counts[job.name, "succeeded"] += 1
+    finally:
+        job_seconds[job.name] += time.monotonic() - started
+
+
+def requeue_stale_jobs() -> int:
+    """Queue again the jobs of workers which died while running them."""
+    stale = Job.objects.filter(
+        status=Job.RUNNING,
+        locked_at__lt=timezone.now() - timedelta(seconds=settings.JOBS_LOCK_TIMEOUT),
+    )
+    count = 0
+    for job in stale:
+        _requeue(job, timezone.now(), job.last_error)
+        count += 1
+    return count
+
+
+def work(worker, stopped: threading.Event):
+    """Run jobs until `stopped` is set."""
+    while not stopped.is_set():
+        try:
+            job = claim_job(worker)
+            if job is None:
+                stopped.wait(settings.JOBS_POLL_INTERVAL)
+            else:
+                run_job(job)
+        except Exception:
+            logger.exception("Job worker %s failed", worker)
+            stopped.wait(settings.JOBS_POLL_INTERVAL)
+        finally:
+            close_old_connections()
+
+
+def supervise(stopped: threading.Event):
+    """Queue the jobs of dead workers again until `stopped` is set."""
+    while not stopped.wait(settings.JOBS_LOCK_TIMEOUT / 2):
+        try:
+            count = requeue_stale_jobs()
+            if count:
+                logger.warning("Requeued %d stale jobs", count)
+        except Exception:
+            logger.exception("Failed to requeue stale jobs")
+        finally:
+            close_old_connections()
+
+
+_workers = None
+_workers_lock = threading.Lock()
+
+
+def start_workers() -> threading.Event | None:
+    """
+    Start the `JOBS_WORKER_THREADS` job workers of this process, once.
+    Return the event stopping them, `None` without workers.
+    """
+    global _workers
+    if not settings.JOBS_WORKER_THREADS:
+        return None
+    with _workers_lock:
+        if _workers is None:
+            _workers = threading.Event()
+            prefix = f"{socket.gethostname()}:{os.getpid()}"
+            for index in range(settings.JOBS_WORKER_THREADS):
+                threading.Thread(
+                    target=work,
+                    args=(f"{prefix}:{index}", _workers),
+                    name=f"job-worker-{index}",
+                    daemon=True,
+                ).start()
+            threading.Thread(
+                target=supervise,
+                args=(_workers,),
+                name="job-supervisor",
+                daemon=True,
+            ).start()
+    return _workers
+
+
+def get_job_stats() -> dict:
+    return {
+        "jobs": dict(
+            Job.objects.values_list("status").annotate(count=models.Count("pk"))
+        ),
+        "handled": {
+            f"{name}:{outcome}": count for (name, outcome), count in job_counts.items()
+        },
+        "seconds": dict(job_seconds),
+    }
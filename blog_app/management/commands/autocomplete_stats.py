@@ -0,0 +1,47 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog_app.autocomplete import SOURCES, get_autocomplete_stats, get_index
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the autocomplete indexes and report their size, memory and "
+        "lookup latency. A web process builds the same indexes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--lookups",
+            type=int,
+            default=10_000,
+            help="Lookups of random prefixes timed per index.",
+        )
+
+    def handle(self, *args, **options):
+        for name in SOURCES:
+            get_index(name)
+        for name, stats in get_autocomplete_stats().items():
+            index = get_index(name)
+            labels = [label for label, _, _ in index.entries.values()]
+            timings = []
+            for _ in range(options["lookups"] if labels else 0):
+                label = random.choice(labels)
+                prefix = label[: random.randint(1, min(len(label), 8))]
+                started = time.perf_counter()
+                index.lookup(prefix)
+                timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(
+                f"  {stats['entries']} entries, {stats['nodes']} nodes, "
+                f"{stats['bytes'] / 2**20:.1f} MiB, "
+                f"built in {stats['build_seconds']:.2f}s"
+            )
+            if timings:
+                self.stdout.write(
+                    f"  lookups: p50 {timings[len(timings) // 2] * 1e6:.0f}us, "
+                    f"p99 {timings[int(len(timings) * 0.99)] * 1e6:.0f}us"
+                )
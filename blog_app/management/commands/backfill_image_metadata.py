@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.images import process_image
+from blog_app.jobs import enqueue
+from blog_app.models import UploadedImage
+
+
+class Command(BaseCommand):
+    help = (
+        "Read the size, format, dominant colour and placeholder of the "
+        "uploaded images missing them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Process every image again, after changing the placeholders.",
+        )
+        parser.add_argument(
+            "--enqueue",
+            action="store_true",
+            help="Queue a job per image instead, for `manage.py run_workers`.",
+        )
+
+    def handle(self, *args, **options):
+        images = UploadedImage.objects.order_by("pk")
+        if not options["all"]:
+            images = images.filter(processed_at=None)
+        count = 0
+        for image_id in images.values_list("pk", flat=True).iterator():
+            if options["enqueue"]:
+                enqueue(
+                    process_image,
+                    image_id,
+                    dedup_key=f"process_image:{image_id}",
+                    always_queue=True,
+                )
+            else:
+                process_image(image_id)
+            count += 1
+            if count % 100 == 0:
+                self.stdout.write(f"{count} images")
+        verb = "Queued" if options["enqueue"] else "Processed"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {count} images"))
@@ -0,0 +1,46 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+
+from blog_app.compression import ENCODINGS, compress
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare bytes saved against CPU time spent for each compression "
+        "encoding and level on responses of this instance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "paths",
+            nargs="*",
+            default=["/api/articles/", "/api/articles/?expand=content"],
+        )
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--levels", default="1,4,6,9")
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST="localhost")
+        levels = [int(level) for level in options["levels"].split(",")]
+        self.stdout.write(
+            f"{'path':40} {'encoding':8} {'level':>5} {'bytes':>9} "
+            f"{'compressed':>10} {'saved':>6} {'ms':>7} {'MB/s':>7}"
+        )
+        for path in options["paths"]:
+            response = client.get(path, HTTP_ACCEPT_ENCODING="identity")
+            content = response.content
+            for encoding in ENCODINGS:
+                for level in levels:
+                    start = time.perf_counter()
+                    for _ in range(options["repeat"]):
+                        compressed = compress(content, encoding, level)
+                    elapsed = (time.perf_counter() - start) / options["repeat"]
+                    self.stdout.write(
+                        f"{path[:40]:40} {encoding:8} {level:>5} {len(content):>9} "
+                        f"{len(compressed):>10} "
+                        f"{1 - len(compressed) / max(len(content), 1):>6.1%} "
+                        f"{elapsed * 1000:>7.3f} "
+                        f"{len(content) / max(elapsed, 1e-9) / 1e6:>7.1f}"
+                    )
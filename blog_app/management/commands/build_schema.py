@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.schema import build_schema, get_code_version
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the OpenAPI schema of the current code version, served by "
+        "/api/schema/ without per-request generation."
+    )
+
+    def handle(self, *args, **options):
+        for path in build_schema():
+            self.stdout.write(f"Wrote {path}")
+        self.stdout.write(
+            self.style.SUCCESS(f"Schema built for code version {get_code_version()}")
+        )
@@ -0,0 +1,111 @@
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from blog_app.models import (
+    Article,
+    ArticleFavorite,
+    ArticleRate,
+    SimilarityChange,
+    SimilarityRun,
+)
+from blog_app.recommendations import chunked, compute_similar, save_similar
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute the articles most similar to each article from the users "
+        "who rated or favored them. Only articles whose rates or favorites "
+        "changed since the last run are recomputed, unless --full is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help=(
+                "Recompute every article, after changing the weights or the "
+                "number of similar articles kept."
+            ),
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=0,
+            help="Number of computing processes, none computes in this one.",
+        )
+        parser.add_argument("--chunk-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        last_run = (
+            SimilarityRun.objects.filter(finished_at__isnull=False)
+            .order_by("-started_at")
+            .first()
+        )
+        full = options["full"] or last_run is None
+        # Started before reading, interactions written meanwhile are picked
+        # up by the next run.
+        run = SimilarityRun.objects.create(started_at=timezone.now(), full=full)
+
+        if full:
+            article_ids = Article._base_manager.order_by("pk").values_list(
+                "pk", flat=True
+            )
+        else:
+            since = last_run.started_at
+            article_ids = (
+                ArticleRate.objects.filter(rated_at__gte=since)
+                .values_list("article_id", flat=True)
+                .union(
+                    ArticleFavorite.objects.filter(favored_at__gte=since)
+                    .order_by()
+                    .values_list("article_id", flat=True),
+                    SimilarityChange.objects.filter(changed_at__gte=since)
+                    .values_list("article_id", flat=True),
+                )
+                .order_by("article_id")
+            )
+        chunks = chunked(article_ids.iterator(), options["chunk_size"])
+
+        computed = written = 0
+        if options["workers"]:
+            pending = set()
+            max_pending = options["workers"] * 2
+            # Spawned, forked workers would share this process' connections.
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+            with executor:
+                for chunk in chunks:
+                    pending.add(executor.submit(compute_similar, chunk))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            computed += len(future.result())
+                            written += save_similar(
+                                future.result(), symmetric=not full
+                            )
+                for future in wait(pending).done:
+                    computed += len(future.result())
+                    written += save_similar(future.result(), symmetric=not full)
+        else:
+            for chunk in chunks:
+                similar = compute_similar(chunk)
+                computed += len(similar)
+                written += save_similar(similar, symmetric=not full)
+
+        run.finished_at = timezone.now()
+        run.articles_count = computed
+        run.save(update_fields=["finished_at", "articles_count"])
+        # The next run starts from this one.
+        SimilarityChange.objects.filter(changed_at__lt=run.started_at).delete()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Computed {computed} articles, wrote {written} similar lists"
+            )
+        )
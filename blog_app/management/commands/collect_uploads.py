@@ -0,0 +1,57 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from blog_app.uploads_gc import collect_uploads
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete the uploaded images no article, profile nor content refers to "
+        "anymore, and the files under the uploads directory without row, once "
+        "older than the grace period. Uploaded files are only linked to, and "
+        "may be linked from outside the site, see --include-files."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report what would be deleted, without deleting.",
+        )
+        parser.add_argument(
+            "--include-files",
+            action="store_true",
+            help=(
+                "Also delete the uploaded files no content links to, "
+                "including the ones linked from outside the site."
+            ),
+        )
+        parser.add_argument(
+            "--grace-seconds",
+            type=int,
+            default=settings.UPLOADS_GC_GRACE_SECONDS,
+            help="Age under which uploads are kept, they may be about to be used.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=settings.UPLOADS_GC_BATCH_SIZE,
+        )
+
+    def handle(self, *args, **options):
+        collected = collect_uploads(
+            grace_seconds=options["grace_seconds"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            include_linked_only=options["include_files"],
+        )
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        for label, count in sorted(collected.rows.items()):
+            self.stdout.write(f"{verb} {count} {label} rows")
+        self.stdout.write(f"{verb} {collected.files} files without row")
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{'Would reclaim' if options['dry_run'] else 'Reclaimed'} "
+                f"{collected.bytes / 2**20:.1f} MiB"
+            )
+        )
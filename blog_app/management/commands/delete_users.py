@@ -0,0 +1,23 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app.deletion import delete_user
+
+
+class Command(BaseCommand):
+    help = (
+        "Log users out and hide their profile and articles at once, then "
+        "delete them in a background job, a batch at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="+")
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(username__in=options["usernames"])
+        missing = set(options["usernames"]) - {user.username for user in users}
+        if missing:
+            raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+        for user in users:
+            deletion = delete_user(user)
+            self.stdout.write(f"{user.username}: deletion {deletion.pk} queued")
@@ -0,0 +1,241 @@
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, connections, models, transaction
+
+from blog_app.models import (
+    Article,
+    ArticleFavorite,
+    ArticleRate,
+    Category,
+    Comment,
+    CommentRate,
+    Profile,
+    ProfileSubscription,
+    Tag,
+    UploadedImage,
+)
+
+# Tables in the same level only reference tables of earlier levels, and so
+# can be loaded in parallel.
+LEVELS = [
+    {"users": User, "categories": Category, "tags": Tag},
+    {"images": UploadedImage},
+    {"profiles": Profile, "articles": Article},
+    {
+        "comments": Comment,
+        "article_rates": ArticleRate,
+        "favorites": ArticleFavorite,
+        "subscriptions": ProfileSubscription,
+    },
+    {"comment_rates": CommentRate},
+]
+
+
+def read_ndjson(path):
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if line.strip():
+                yield json.loads(line)
+
+
+def read_csv(path):
+    with open(path, encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            row = {
+                key: None
+                if value == ""
+                else {"true": True, "false": False}.get(value, value)
+                for key, value in row.items()
+            }
+            if "tags" in row:
+                row["tags"] = [tag for tag in (row["tags"] or "").split(",") if tag]
+            yield row
+
+
+def get_timestamp_fields(model) -> list:
+    """The `auto_now(_add)` fields, set to the current time by `bulk_create()`."""
+    return [
+        field
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Bulk load blog data from a directory of <table>.ndjson or <table>.csv "
+        "files, bypassing model signals, then rebuild derived data. Tables: "
+        + ", ".join(name for level in LEVELS for name in level)
+        + ". Rows hold model field values, with `<field>_id` keys for "
+        "relations and a `tags` list for articles."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("directory")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Tables loaded in parallel. Defaults to 1 on SQLite, "
+            "which allows a single writer, and 4 otherwise.",
+        )
+        parser.add_argument(
+            "--ignore-conflicts",
+            action="store_true",
+            help="Skip rows already in the database instead of failing.",
+        )
+
+    def handle(self, *args, **options):
+        directory = Path(options["directory"])
+        if not directory.is_dir():
+            raise CommandError(f"{directory} is not a directory")
+        workers = options["workers"]
+        if workers is None:
+            workers = 1 if connection.vendor == "sqlite" else 4
+        self.batch_size = options["batch_size"]
+        self.ignore_conflicts = options["ignore_conflicts"]
+
+        started = time.perf_counter()
+        loaded_models = []
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for level in LEVELS:
+                jobs = []
+                for name, model in level.items():
+                    path = self._find_file(directory, name)
+                    if path is not None:
+                        jobs.append((name, executor.submit(self._load, model, path)))
+                        loaded_models.append(model)
+                for name, job in jobs:
+                    rows, elapsed = job.result()
+                    self.stdout.write(
+                        f"{name}: {rows} rows in {elapsed:.1f}s "
+                        f"({rows / max(elapsed, 1e-6):.0f} rows/s)"
+                    )
+
+        self._reset_sequences(loaded_models)
+        self._rebuild_derived_data()
+        self.stdout.write(
+            self.style.SUCCESS(f"Imported in {time.perf_counter() - started:.1f}s")
+        )
+
+    @staticmethod
+    def _find_file(directory, name):
+        for suffix in (".ndjson", ".csv"):
+            path = directory / f"{name}{suffix}"
+            if path.exists():
+                return path
+        return None
+
+    def _load(self, model, path):
+        started = time.perf_counter()
+        rows = read_csv(path) if path.suffix == ".csv" else read_ndjson(path)
+        field_names = {
+            name
+            for field in model._meta.concrete_fields
+            for name in (field.name, field.attname)
+        }
+        count = 0
+        try:
+            # One transaction per table, so rows may reference rows of later
+            # batches, like replies to comments.
+            with transaction.atomic():
+                while batch := list(islice(rows, self.batch_size)):
+                    objects, tags = [], []
+                    for row in batch:
+                        if model is Article:
+                            tags.extend(
+                                Article.tags.through(
+                                    article_id=row["id"],
+                                    tag_id=tag,
+                                )
+                                for tag in row.get("tags") or ()
+                            )
+                        objects.append(
+                            model(
+                                **{
+                                    key: value
+                                    for key, value in row.items()
+                                    if key in field_names
+                                }
+                            )
+                        )
+                    self._create(model, objects)
+                    if tags:
+                        Article.tags.through.objects.bulk_create(
+                            tags,
+                            ignore_conflicts=self.ignore_conflicts,
+                        )
+                    count += len(objects)
+        finally:
+            connections.close_all()
+        return count, time.perf_counter() - started
+
+    def _create(self, model, objects):
+        fields = get_timestamp_fields(model)
+        # Read first, `bulk_create()` replaces them with the current time.
+        timestamps = [
+            [getattr(obj, field.attname) for field in fields] for obj in objects
+        ]
+        existing = set()
+        if fields and self.ignore_conflicts:
+            existing = set(
+                model._base_manager.filter(
+                    pk__in=[obj.pk for obj in objects if obj.pk is not None]
+                ).values_list("pk", flat=True)
+            )
+        model._base_manager.bulk_create(
+            objects,
+            ignore_conflicts=self.ignore_conflicts,
+        )
+        # Written back by an update, rather than by switching `auto_now` off
+        # on the fields, which are shared with the other threads.
+        given = []
+        for obj, values in zip(objects, timestamps):
+            if obj.pk is None or obj.pk in existing:
+                continue
+            if all(value is None for value in values):
+                continue
+            for field, value in zip(fields, values):
+                if value is not None:
+                    setattr(obj, field.attname, value)
+            given.append(obj)
+        if given:
+            model._base_manager.bulk_update(
+                given, [field.name for field in fields], batch_size=500
+            )
+
+    @staticmethod
+    def _reset_sequences(models):
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+
+    def _rebuild_derived_data(self):
+        # Profiles are created by a `post_save` receiver bypassed by the
+        # import, create the ones missing from the data.
+        missing = User.objects.filter(profile__isnull=True).values_list(
+            "pk", "username"
+        )
+        created = 0
+        # Created profiles drop out of `missing`, so the slice moves forward.
+        while batch := list(missing[: self.batch_size]):
+            Profile.objects.bulk_create(
+                Profile(user_id=pk, username=username) for pk, username in batch
+            )
+            created += len(batch)
+        self.stdout.write(f"profiles created for {created} users")
+        call_command("rebuild_article_content", stdout=self.stdout)
+        call_command("rebuild_related_articles", stdout=self.stdout)
+        call_command("build_similar_articles", full=True, stdout=self.stdout)
@@ -0,0 +1,142 @@
+import re
+from itertools import product
+from urllib.parse import urlencode
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.filters import OrderingFilter
+from rest_framework.settings import api_settings
+
+from blog_app.urls import router
+
+# Plan lines reporting a full table scan or a sort, by database vendor.
+FULL_SCAN = {
+    "sqlite": re.compile(r"\bSCAN (\w+)\b(?! USING)"),
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+}
+SORT = {
+    "sqlite": re.compile(r"USE TEMP B-TREE FOR (ORDER BY|GROUP BY|DISTINCT)"),
+    "postgresql": re.compile(r"\b(Sort|HashAggregate)\b"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Explain the list queries of the API for every filter and ordering "
+        "the viewsets allow, and report full table scans and sorts. SQL "
+        "statements can also be read from a file, one per line."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--queries",
+            help="File of SQL statements to explain instead, one per line.",
+        )
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Report every query, not only the ones with issues.",
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor not in FULL_SCAN:
+            raise CommandError(f"{connection.vendor} plans aren't supported.")
+        if options["queries"]:
+            with open(options["queries"], encoding="utf-8") as file:
+                queries = [(line.strip(), (line.strip(), ())) for line in file]
+            queries = [(label, query) for label, query in queries if label]
+        else:
+            queries = list(self._replay_viewsets())
+
+        reported = 0
+        for label, (sql, params) in queries:
+            plan = self._explain(sql, params)
+            issues = [
+                f"full scan of {match.group(1)}"
+                for match in FULL_SCAN[connection.vendor].finditer(plan)
+            ] + [
+                f"sort ({match.group(1)})"
+                for match in SORT[connection.vendor].finditer(plan)
+            ]
+            if issues or options["all"]:
+                reported += 1
+                self.stdout.write(self.style.MIGRATE_HEADING(label))
+                for issue in issues:
+                    self.stdout.write(self.style.WARNING(f"  {issue}"))
+                if options["verbosity"] > 1:
+                    self.stdout.write(plan)
+        self.stdout.write(f"{reported} of {len(queries)} queries reported")
+
+    def _replay_viewsets(self):
+        """
+        Yield the request and `(SQL, params)` of the list queries the
+        viewsets run for anonymous users.
+        """
+        factory = RequestFactory()
+        for prefix, viewset, _ in router.registry:
+            if not hasattr(viewset, "list"):
+                continue
+            filters = [None]
+            if DjangoFilterBackend in viewset.filter_backends:
+                filters += getattr(viewset, "filterset_fields", [])
+            orderings = [None]
+            if OrderingFilter in viewset.filter_backends:
+                for field in getattr(viewset, "ordering_fields", []):
+                    orderings += [field, f"-{field}"]
+            for filter_field, ordering in product(filters, orderings):
+                params = {}
+                if filter_field is not None:
+                    sample = self._get_sample(viewset, filter_field)
+                    if sample is None:
+                        continue
+                    params[filter_field] = sample
+                if ordering is not None:
+                    params[api_settings.ORDERING_PARAM] = ordering
+                label = f"GET /api/{prefix}/?{urlencode(params)}"
+                try:
+                    query = self._get_list_query(viewset, factory.get("/", params))
+                except Exception as error:
+                    self.stderr.write(f"{label}\n  fails: {error!r}")
+                    continue
+                if query is not None:
+                    yield label, query
+
+    @staticmethod
+    def _get_sample(viewset, field):
+        # Filtering on an existing value, the planner may pick other plans
+        # for values it knows to be rare.
+        value = (
+            viewset.queryset.model._base_manager.exclude(**{field: None})
+            .values_list(field, flat=True)
+            .first()
+        )
+        if isinstance(value, bool):
+            return str(value)
+        return value
+
+    @staticmethod
+    def _get_list_query(viewset, http_request):
+        view = viewset(
+            action_map={"get": "list"}, args=(), kwargs={}, format_kwarg=None
+        )
+        request = view.initialize_request(http_request)
+        request.user = AnonymousUser()
+        view.request = request
+        if not all(
+            permission.has_permission(request, view)
+            for permission in view.get_permissions()
+        ):
+            return None
+        queryset = view.filter_queryset(view.get_queryset())
+        limit = getattr(view.paginator, "default_limit", None) or api_settings.PAGE_SIZE
+        return queryset[:limit].query.sql_with_params()
+
+    @staticmethod
+    def _explain(sql, params):
+        prefix = "EXPLAIN QUERY PLAN " if connection.vendor == "sqlite" else "EXPLAIN "
+        with connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            return "\n".join(" ".join(map(str, row)) for row in cursor.fetchall())
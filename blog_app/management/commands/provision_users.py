@@ -0,0 +1,73 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog_app.management.commands.import_blog_data import read_csv, read_ndjson
+from blog_app.provisioning import create_hash_executor, provision_users
+from blog_app.serializers import ProvisionedUserSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        "Create users with their profile and token from a .ndjson or .csv "
+        "file of username, password or password_hash, email, first_name and "
+        "last_name, hashing passwords across processes. Model signals are "
+        "bypassed and existing usernames are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=4,
+            help="Password hashing processes, 0 to hash in this process.",
+        )
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        if not path.is_file():
+            raise CommandError(f"{path} is not a file")
+        rows = read_csv(path) if path.suffix == ".csv" else read_ndjson(path)
+        self.invalid = 0
+
+        started = time.perf_counter()
+        created = skipped = 0
+        executor = None
+        if options["workers"]:
+            executor = create_hash_executor(options["workers"])
+        try:
+            for batch_created, batch_skipped in provision_users(
+                self._validate(rows),
+                executor=executor,
+                batch_size=options["batch_size"],
+            ):
+                created += len(batch_created)
+                skipped += len(batch_skipped)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(
+                    f"{created} users created, {skipped} skipped in "
+                    f"{elapsed:.1f}s ({created / max(elapsed, 1e-6):.1f} users/s)"
+                )
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Created {created} users in {time.perf_counter() - started:.1f}s, "
+                f"{skipped} usernames taken, {self.invalid} invalid rows"
+            )
+        )
+
+    def _validate(self, rows):
+        for line, row in enumerate(rows, start=1):
+            serializer = ProvisionedUserSerializer(
+                data={key: value for key, value in row.items() if value is not None}
+            )
+            if serializer.is_valid():
+                yield dict(serializer.validated_data)
+            else:
+                self.invalid += 1
+                self.stderr.write(f"Row {line}: {serializer.errors}")
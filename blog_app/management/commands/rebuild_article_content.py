@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import django
+from django.core.management.base import BaseCommand
+
+from blog_app.models import Article
+from blog_app.rendering import get_renderer
+
+
+def render_batch(batch):
+    renderer = get_renderer()
+    return [(pk, renderer.render(content)) for pk, content in batch]
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-render the stored excerpt, word count, reading time, HTML and "
+        "outline of articles rendered by another renderer version."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Re-render every article, not only outdated ones.",
+        )
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count(),
+            help="Number of rendering processes, 0 to render in this process.",
+        )
+        parser.add_argument("--batch-size", type=int, default=200)
+
+    def handle(self, *args, **options):
+        renderer = get_renderer()
+        queryset = Article._base_manager.order_by("pk")
+        if not options["all"]:
+            queryset = queryset.exclude(renderer_version=renderer.version)
+        rows = queryset.values_list("pk", "content").iterator(
+            chunk_size=options["batch_size"]
+        )
+
+        rendered = 0
+        pending = set()
+        # Keep at most two batches per worker in flight to bound memory.
+        max_pending = options["workers"] * 2
+        batches = self._batches(rows, options["batch_size"])
+        if options["workers"]:
+            # Spawned, forked workers would share this process' connections.
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=django.setup,
+            )
+            with executor:
+                for batch in batches:
+                    pending.add(executor.submit(render_batch, batch))
+                    if len(pending) >= max_pending:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        rendered += self._save(
+                            [future.result() for future in done], renderer
+                        )
+                rendered += self._save(
+                    [future.result() for future in wait(pending).done], renderer
+                )
+        else:
+            for batch in batches:
+                rendered += self._save([render_batch(batch)], renderer)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Rendered {rendered} articles with {renderer.version}")
+        )
+
+    @staticmethod
+    def _batches(rows, size):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _save(results, renderer):
+        articles = []
+        for result in results:
+            for pk, content in result:
+                articles.append(
+                    Article(
+                        pk=pk,
+                        excerpt=content.excerpt,
+                        word_count=content.word_count,
+                        reading_time=content.reading_time,
+                        rendered_content=content.html,
+                        outline=content.outline,
+                        renderer_version=renderer.version,
+                    )
+                )
+        Article._base_manager.bulk_update(articles, Article.RENDERED_FIELDS)
+        return len(articles)
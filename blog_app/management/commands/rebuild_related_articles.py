@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from blog_app.models import Article
+from blog_app.related import refresh_related
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored related articles list of every article."
+
+    def handle(self, *args, **options):
+        article_ids = Article._base_manager.order_by("pk").values_list("pk", flat=True)
+        count = 0
+        for article_id in article_ids.iterator():
+            refresh_related(article_id, cascade=False)
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt related articles of {count} articles")
+        )
@@ -0,0 +1,92 @@
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# Worker processes import this module before setting Django up, so the
+# models are imported by the functions.
+
+
+def run_threads(threads, stopped):
+    """Run `threads` workers in this process until `stopped` is set."""
+    from blog_app.jobs import work
+
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    workers = [
+        threading.Thread(
+            target=work,
+            args=(f"{prefix}:{index}", stopped),
+            name=f"job-worker-{index}",
+        )
+        for index in range(threads)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
+def run_process(threads, stopped):
+    django.setup()
+    # Stopped by the parent, not by the terminal's Ctrl-C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_threads(threads, stopped)
+
+
+class Command(BaseCommand):
+    help = "Run the jobs queued with `blog_app.jobs.enqueue()`."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--threads",
+            type=int,
+            default=4,
+            help="Worker threads per process.",
+        )
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=1,
+            help="Worker processes, for jobs bound by the CPU.",
+        )
+        parser.add_argument(
+            "--stats",
+            action="store_true",
+            help="Print the queue statistics and exit.",
+        )
+
+    def handle(self, *args, **options):
+        from blog_app.jobs import get_job_stats, supervise
+
+        if options["stats"]:
+            self.stdout.write(json.dumps(get_job_stats(), indent=2))
+            return
+
+        context = multiprocessing.get_context("spawn")
+        stopped = context.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: stopped.set())
+
+        processes = [
+            context.Process(target=run_process, args=(options["threads"], stopped))
+            for _ in range(options["processes"] - 1)
+        ]
+        for process in processes:
+            process.start()
+        supervisor = threading.Thread(target=supervise, args=(stopped,))
+        supervisor.start()
+        self.stdout.write(
+            f"Running {options['processes']} x {options['threads']} job workers"
+        )
+        # This process is one of the worker processes.
+        run_threads(options["threads"], stopped)
+        supervisor.join()
+        for process in processes:
+            process.join()
+        self.stdout.write(json.dumps(get_job_stats()["handled"], indent=2))
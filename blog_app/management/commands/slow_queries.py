@@ -0,0 +1,102 @@
+import json
+from collections import Counter
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+SORTS = {
+    "total": lambda stats: stats["total"],
+    "max": lambda stats: stats["max"],
+    "count": lambda stats: stats["count"],
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Summarize the slow query logs of every process by query fingerprint, "
+        "worst first, with the views and code running them and their plan."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=10)
+        parser.add_argument(
+            "--sort",
+            choices=SORTS,
+            default="total",
+            help="Rank by total time, slowest run or number of runs.",
+        )
+        parser.add_argument(
+            "--hours",
+            type=float,
+            help="Only read the queries logged in the last hours.",
+        )
+
+    def handle(self, *args, **options):
+        since = None
+        if options["hours"] is not None:
+            since = timezone.now() - timedelta(hours=options["hours"])
+        fingerprints = {}
+        for entry in self._read(since):
+            stats = fingerprints.get(entry["fingerprint"])
+            if stats is None:
+                stats = fingerprints[entry["fingerprint"]] = {
+                    "statement": entry["statement"],
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "views": Counter(),
+                    "stacks": Counter(),
+                    "plan": None,
+                }
+            stats["count"] += 1
+            stats["total"] += entry["duration"]
+            stats["max"] = max(stats["max"], entry["duration"])
+            stats["views"][entry["view"] or "(no request)"] += 1
+            if entry["stack"]:
+                stats["stacks"][entry["stack"][-1]] += 1
+            # Entries are read oldest first, keep the latest plan.
+            stats["plan"] = entry["plan"] or stats["plan"]
+
+        rank = SORTS[options["sort"]]
+        ranked = sorted(fingerprints.items(), key=lambda item: -rank(item[1]))
+        for fingerprint, stats in ranked[: options["limit"]]:
+            self.stdout.write(
+                self.style.MIGRATE_HEADING(
+                    f"{fingerprint}: {stats['count']} runs, "
+                    f"{stats['total']:.2f}s total, "
+                    f"{stats['total'] / stats['count'] * 1000:.0f}ms mean, "
+                    f"{stats['max'] * 1000:.0f}ms max"
+                )
+            )
+            self.stdout.write(f"  {stats['statement'][:500]}")
+            for view, count in stats["views"].most_common(3):
+                self.stdout.write(f"  view: {view} ({count})")
+            for frame, count in stats["stacks"].most_common(3):
+                self.stdout.write(f"  from: {frame} ({count})")
+            if stats["plan"]:
+                for line in stats["plan"].splitlines():
+                    self.stdout.write(self.style.WARNING(f"  | {line}"))
+        self.stdout.write(
+            f"{sum(stats['count'] for stats in fingerprints.values())} slow queries, "
+            f"{len(fingerprints)} fingerprints"
+        )
+
+    def _read(self, since):
+        # Rotated logs first, they are older.
+        paths = sorted(
+            Path(settings.SLOW_QUERY_LOG_DIR).glob("slow-queries-*.jsonl*"),
+            key=lambda path: -int(path.suffix[1:]) if path.suffix[1:].isdigit() else 0,
+        )
+        for path in paths:
+            with open(path, encoding="utf-8") as log:
+                for line in log:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log.
+                        continue
+                    if since is None or datetime.fromisoformat(entry["at"]) >= since:
+                        yield entry
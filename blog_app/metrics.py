@@ -0,0 +1,395 @@
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.http import HttpResponse
+from django.urls import Resolver404, resolve
+from drf_spectacular.utils import extend_schema
+from rest_framework import authentication, permissions
+from rest_framework.views import APIView
+
+from blog_app.invalidation import invalidation_counts, invalidation_lags
+from blog_app.jobs import job_counts
+from blog_app.permissions import MetricsScraperPermission
+from blog_app.schema import get_schema
+from blog_app.throttling import shed_counts
+
+logger = logging.getLogger(__name__)
+
+# name -> (type, help), in the order they are exposed.
+METRICS = {
+    "blog_http_requests_total": ("counter", "Requests handled, by status."),
+    "blog_http_requests_in_flight": ("gauge", "Requests being handled."),
+    "blog_http_request_duration_seconds": ("histogram", "Request latency."),
+    "blog_http_request_db_queries": ("histogram", "Database queries by request."),
+    "blog_http_response_size_bytes": (
+        "histogram",
+        "Response body size, after compression. Streamed bodies aren't counted.",
+    ),
+    "blog_jobs_total": ("counter", "Jobs by outcome, see blog_app.jobs."),
+    "blog_requests_shed_total": ("counter", "Requests refused, by reason."),
+    "blog_invalidations_total": (
+        "counter",
+        "Cache invalidations sent and received, see blog_app.invalidation.",
+    ),
+    "blog_invalidation_lag_seconds": (
+        "gauge",
+        "Highest delay of the last invalidations received by a process.",
+    ),
+}
+
+# Gauges merged with `max()` across processes, the others are summed.
+MAX_GAUGES = {"blog_invalidation_lag_seconds"}
+
+
+class Registry:
+    """
+    Metrics of this process. Labels are tuples of (name, value) pairs.
+    Histograms are kept as counts by bucket, the last one for values above
+    every bound, and the sum of the values.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = defaultdict(float)
+        self.gauges = defaultdict(float)
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self.lock:
+            self.counters[name, labels] += value
+
+    def add(self, name, labels, value):
+        with self.lock:
+            self.gauges[name, labels] += value
+
+    def observe(self, name, labels, value, buckets):
+        index = bisect_left(buckets, value)
+        with self.lock:
+            histogram = self.histograms.get((name, labels))
+            if histogram is None:
+                histogram = self.histograms[name, labels] = [
+                    list(buckets),
+                    [0] * (len(buckets) + 1),
+                    0.0,
+                ]
+            histogram[1][index] += 1
+            histogram[2] += value
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            snapshot = {
+                "counters": [
+                    [name, labels, value]
+                    for (name, labels), value in self.counters.items()
+                ],
+                "gauges": [
+                    [name, labels, value]
+                    for (name, labels), value in self.gauges.items()
+                ],
+                "histograms": [
+                    [name, labels, bounds, list(counts), total]
+                    for (name, labels), (bounds, counts, total) in (
+                        self.histograms.items()
+                    )
+                ],
+            }
+        # Counted by their own modules, read as they are.
+        for (job, outcome), count in list(job_counts.items()):
+            snapshot["counters"].append(
+                ["blog_jobs_total", (("job", job), ("outcome", outcome)), count]
+            )
+        for reason, count in list(shed_counts.items()):
+            snapshot["counters"].append(
+                ["blog_requests_shed_total", (("reason", reason),), count]
+            )
+        for (topic, outcome), count in list(invalidation_counts.items()):
+            snapshot["counters"].append(
+                [
+                    "blog_invalidations_total",
+                    (("topic", topic), ("outcome", outcome)),
+                    count,
+                ]
+            )
+        lags = list(invalidation_lags)
+        if lags:
+            snapshot["gauges"].append(["blog_invalidation_lag_seconds", (), max(lags)])
+        return snapshot
+
+
+_registry = Registry()
+
+
+class MetricsStore:
+    """
+    Shares the metrics of the processes through `METRICS_DIR`, where each
+    process writes a snapshot of its registry every `METRICS_FLUSH_INTERVAL`
+    seconds. Counters and histograms of stopped processes are kept until
+    the directory is cleared, gauges only count for processes which wrote
+    recently.
+    """
+
+    def __init__(self, directory, flush_interval):
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+        self.path = self.directory / f"metrics-{os.getpid()}.json"
+        self.stopped = threading.Event()
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def start(self):
+        threading.Thread(target=self._run, name="metrics-flush", daemon=True).start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stopped.set()
+        self.flush()
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError:
+                logger.exception("Failed to write the metrics to %s", self.path)
+
+    def flush(self):
+        # Written aside and renamed, so readers never see a partial file.
+        temporary_path = self.path.with_suffix(".tmp")
+        temporary_path.write_text(json.dumps(_registry.snapshot()))
+        temporary_path.replace(self.path)
+
+    def read(self):
+        """Yield the snapshots of every process, this one read live."""
+        yield _registry.snapshot(), True
+        stale = time.time() - 3 * self.flush_interval
+        for path in self.directory.glob("metrics-*.json"):
+            if path == self.path:
+                continue
+            try:
+                live = path.stat().st_mtime > stale
+                snapshot = json.loads(path.read_text())
+            except (OSError, ValueError):
+                # Removed, or replaced while read.
+                continue
+            yield snapshot, live
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> MetricsStore:
+    """Return the process wide metrics store, writing from first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = MetricsStore(
+                    settings.METRICS_DIR, settings.METRICS_FLUSH_INTERVAL
+                )
+                store.start()
+                _store = store
+    return _store
+
+
+def normalize_route(route) -> str:
+    # Spectacular keeps the `^` anchors of nested patterns, the resolver
+    # strips them.
+    return route.replace("^", "")
+
+
+_PATH_PARAMETER = re.compile(r"\{[^}/]+\}")
+
+_operation_ids = None
+
+
+def get_operation_ids() -> dict:
+    """
+    Return the `operation_id` of the API operations, by route and method.
+    The routes are found by resolving the schema paths, with a value which
+    matches the default lookups for their parameters.
+    """
+    global _operation_ids
+    if _operation_ids is None:
+        operation_ids = {}
+        for path, operations in json.loads(get_schema("json"))["paths"].items():
+            try:
+                route = resolve(_PATH_PARAMETER.sub("1", path)).route
+            except Resolver404:
+                logger.warning("Can't resolve the API path %s", path)
+                continue
+            for method, operation in operations.items():
+                operation_ids[normalize_route(route), method.upper()] = operation[
+                    "operationId"
+                ]
+        _operation_ids = operation_ids
+    return _operation_ids
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, database queries, response size and status of
+    requests, and the requests in flight, by route and method. Routes are
+    named after the `operation_id` of their API operation when exposed.
+    Goes first, the latency includes the other middlewares.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        get_store()
+
+    def __call__(self, request):
+        started = time.perf_counter()
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        labels = None
+        try:
+            with connection.execute_wrapper(count_query):
+                response = self.get_response(request)
+        finally:
+            labels = getattr(request, "_metrics_labels", None)
+            if labels is not None:
+                _registry.add("blog_http_requests_in_flight", labels, -1)
+        if labels is None:
+            labels = (("route", ""), ("method", request.method))
+        _registry.inc(
+            "blog_http_requests_total",
+            labels + (("status", str(response.status_code)),),
+        )
+        _registry.observe(
+            "blog_http_request_duration_seconds",
+            labels,
+            time.perf_counter() - started,
+            settings.METRICS_LATENCY_BUCKETS,
+        )
+        _registry.observe(
+            "blog_http_request_db_queries",
+            labels,
+            queries[0],
+            settings.METRICS_QUERY_BUCKETS,
+        )
+        if not response.streaming:
+            _registry.observe(
+                "blog_http_response_size_bytes",
+                labels,
+                len(response.content),
+                settings.METRICS_SIZE_BUCKETS,
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        labels = (
+            ("route", request.resolver_match.route),
+            ("method", request.method),
+        )
+        request._metrics_labels = labels
+        _registry.add("blog_http_requests_in_flight", labels, 1)
+
+
+def _name_route(labels, operation_ids) -> tuple:
+    labels = dict(labels)
+    if "route" in labels:
+        route = labels.pop("route")
+        key = normalize_route(route), labels.get("method")
+        operation_id = operation_ids.get(key, "other") if route else "unmatched"
+        labels = {"operation_id": operation_id, **labels}
+    return tuple(labels.items())
+
+
+def _format_labels(labels, *extra) -> str:
+    pairs = [*labels, *extra]
+    if not pairs:
+        return ""
+    escaped = (
+        str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        for _, value in pairs
+    )
+    return (
+        "{"
+        + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped))
+        + "}"
+    )
+
+
+def _format_value(value) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_metrics() -> str:
+    """Merge the metrics of every process in the Prometheus text format."""
+    operation_ids = get_operation_ids()
+    values = defaultdict(float)
+    histograms = {}
+    for snapshot, live in get_store().read():
+        for name, labels, value in snapshot["counters"]:
+            values[name, _name_route(labels, operation_ids)] += value
+        for name, labels, value in snapshot["gauges"] if live else ():
+            key = name, _name_route(labels, operation_ids)
+            if name in MAX_GAUGES:
+                values[key] = max(values.get(key, value), value)
+            else:
+                values[key] += value
+        for name, labels, bounds, counts, total in snapshot["histograms"]:
+            key = name, _name_route(labels, operation_ids)
+            if key not in histograms or histograms[key][0] != bounds:
+                # Bounds changed with the settings, the latest process wins.
+                histograms[key] = [bounds, [0] * len(counts), 0.0]
+            merged = histograms[key]
+            merged[1] = [a + b for a, b in zip(merged[1], counts)]
+            merged[2] += total
+
+    lines = []
+    for name, (kind, help_text) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == "histogram":
+            for (metric, labels), (bounds, counts, total) in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip([*bounds, "+Inf"], counts):
+                    cumulative += count
+                    lines.append(
+                        f"{name}_bucket{_format_labels(labels, ('le', bound))} "
+                        f"{cumulative}"
+                    )
+                lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        else:
+            for (metric, labels), value in sorted(values.items()):
+                if metric == name:
+                    lines.append(
+                        f"{name}{_format_labels(labels)} {_format_value(value)}"
+                    )
+    return "\n".join(lines) + "\n"
+
+
+class MetricsView(APIView):
+    """Prometheus scrape endpoint, for `METRICS_ALLOWED_IPS` and staff."""
+
+    authentication_classes = [
+        authentication.TokenAuthentication,
+        authentication.SessionAuthentication,
+    ]
+    permission_classes = [MetricsScraperPermission | permissions.IsAdminUser]
+    # Scraped at a steady rate by a few servers.
+    throttle_classes = []
+
+    @extend_schema(exclude=True)
+    def get(self, request):
+        return HttpResponse(
+            render_metrics(),
+            content_type="text/plain; version=0.0.4; charset=utf-8",
+        )
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-19 07:30
+
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+from blog_app.rendering import make_excerpt
+
+
+def fill_excerpts(apps, schema_editor):
+    Article = apps.get_model('blog_app', 'Article')
+    articles = []
+    for article in Article.objects.only('content').iterator(chunk_size=500):
+        article.excerpt = make_excerpt(strip_tags(article.content))
+        articles.append(article)
+        if len(articles) == 500:
+            Article.objects.bulk_update(articles, ['excerpt'])
+            articles = []
+    Article.objects.bulk_update(articles, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0002_alter_article_tags_alter_comment_reply_to'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='excerpt',
+            field=models.CharField(blank=True, editable=False, max_length=300),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.0.4 on 2026-10-19 07:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0004_article_rendered_content'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedArticle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='related_articles', to='blog_app.article')),
+                ('related', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog_app.article')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['article', '-score'], name='blog_app_re_article_0b83c9_idx')],
+                'unique_together': {('article', 'related')},
+            },
+        ),
+    ]
@@ -0,0 +1,85 @@
+# Generated by Django 5.0.4 on 2026-10-19 07:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0005_relatedarticle'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SimilarArticle',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('article_id', models.BigIntegerField()),
+                ('changed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='SimilarityRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('full', models.BooleanField()),
+                ('articles_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='articlerate',
+            name='rated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AlterField(
+            model_name='commentrate',
+            name='rated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='articlefavorite',
+            index=models.Index(fields=['favored_at'], name='blog_app_ar_favored_1c7f0e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlefavorite',
+            index=models.Index(fields=['user', '-favored_at'], name='blog_app_ar_user_id_f5636c_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlerate',
+            index=models.Index(fields=['rated_at'], name='blog_app_ar_rated_a_ebaf35_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='articlerate',
+            index=models.Index(fields=['user', '-rated_at'], name='blog_app_ar_user_id_eab9c1_idx'),
+        ),
+        migrations.AddField(
+            model_name='similararticle',
+            name='article',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similar_articles', to='blog_app.article'),
+        ),
+        migrations.AddField(
+            model_name='similararticle',
+            name='similar',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog_app.article'),
+        ),
+        migrations.AddIndex(
+            model_name='similararticle',
+            index=models.Index(fields=['article', '-score'], name='blog_app_si_article_c65f1a_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='similararticle',
+            unique_together={('article', 'similar')},
+        ),
+    ]
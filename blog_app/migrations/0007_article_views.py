@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-19 07:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0006_similar_articles'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='article',
+            name='views',
+            field=models.PositiveBigIntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
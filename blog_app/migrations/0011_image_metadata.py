@@ -0,0 +1,48 @@
+# Generated by Django 5.0.4 on 2026-10-19 08:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0010_deletion'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='dominant_color',
+            field=models.CharField(blank=True, editable=False, help_text='#rrggbb', max_length=7),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='file_size',
+            field=models.PositiveBigIntegerField(blank=True, editable=False, help_text='Bytes', null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='format',
+            field=models.CharField(blank=True, editable=False, max_length=10),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='placeholder',
+            field=models.TextField(blank=True, editable=False, help_text='Data URI of a tiny JPEG of the image, shown blurred while it loads.'),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='uploadedimage',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-19 08:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog_app', '0011_image_metadata'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Invalidation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(max_length=50)),
+                ('payload', models.JSONField(default=dict)),
+                ('publisher', models.CharField(max_length=100)),
+                ('published_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+    ]
@@ -1,10 +1,116 @@
 from django.conf import settings
-from django.db import models
+from django.db import connections, models
+from django.db.models.functions import Coalesce
 from django.contrib.auth.models import User
+from django.dispatch import Signal
+
+from blog_app.rendering import get_renderer
 
 from typing import Literal
 
 
+# Sent after `UpsertManager.upsert()` inserted or changed a row.
+# Upserts bypass `pre_save`/`post_save`, receivers get the written values.
+row_upserted = Signal()
+# Sent once after many rows were upserted or deleted in bulk, with the
+# written values of every row in `rows`.
+rows_upserted = Signal()
+
+
+class UpsertManager(models.Manager):
+
+    def upsert(self, defaults=None, **lookup) -> bool:
+        """
+        Insert a row identified by `lookup` or update it with `defaults`
+        in a single `INSERT ... ON CONFLICT` statement.
+
+        Return whether a row was inserted or changed. Rows already holding
+        `defaults` are left untouched, changed ones get their `auto_now`
+        fields refreshed like `save()` does.
+        """
+        defaults = defaults or {}
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        opts = self.model._meta
+        obj = self.model(**lookup, **defaults)
+
+        fields = [
+            field
+            for field in opts.concrete_fields
+            if not (field.primary_key and isinstance(field, models.AutoField))
+        ]
+        params = [
+            field.get_db_prep_save(field.pre_save(obj, add=True), connection)
+            for field in fields
+        ]
+        conflict_columns = [opts.get_field(name).column for name in lookup]
+        update_columns = [opts.get_field(name).column for name in defaults]
+        touched_columns = [
+            field.column
+            for field in fields
+            if getattr(field, "auto_now", False) and field.name not in defaults
+        ]
+
+        table = quote(opts.db_table)
+        sql = "INSERT INTO %s (%s) VALUES (%s) ON CONFLICT (%s) " % (
+            table,
+            ", ".join(quote(field.column) for field in fields),
+            ", ".join(["%s"] * len(fields)),
+            ", ".join(quote(column) for column in conflict_columns),
+        )
+        if update_columns:
+            # Both compare NULLs as values, SQLite only has `IS DISTINCT FROM`
+            # from 3.39.
+            distinct = (
+                "NOT (%s.%s IS excluded.%s)"
+                if connection.vendor == "sqlite"
+                else "%s.%s IS DISTINCT FROM excluded.%s"
+            )
+            sql += "DO UPDATE SET %s WHERE %s" % (
+                ", ".join(
+                    "%s = excluded.%s" % (quote(column), quote(column))
+                    for column in update_columns + touched_columns
+                ),
+                " OR ".join(
+                    distinct % (table, quote(column), quote(column))
+                    for column in update_columns
+                ),
+            )
+        else:
+            sql += "DO NOTHING"
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            changed = cursor.rowcount > 0
+        if changed:
+            row_upserted.send(
+                sender=self.model,
+                values={**lookup, **defaults},
+                using=self.db,
+            )
+        return changed
+
+
+def count_subquery(model, field, outer="pk", **filters):
+    """
+    Count of `model` rows pointing to the `outer` field of the outer row
+    through `field`.
+
+    Used instead of `Count()` joins, which would multiply the rating sums
+    annotated by the article and comment managers.
+    """
+    return Coalesce(
+        models.Subquery(
+            model._base_manager.filter(**{field: models.OuterRef(outer)}, **filters)
+            .order_by()
+            .values(field)
+            .annotate(count=models.Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
 class UploadedImage(models.Model):
     image = models.ImageField(upload_to=settings.UPLOADS_DIR + "/images/")
     user = models.ForeignKey(
@@ -13,6 +119,29 @@ class UploadedImage(models.Model):
         related_name="uploaded_images",
     )
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # Read from the file after the upload, see `blog_app.images`. Width and
+    # height are the displayed ones, with the EXIF orientation applied.
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    format = models.CharField(max_length=10, blank=True, editable=False)
+    file_size = models.PositiveBigIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        help_text="Bytes",
+    )
+    dominant_color = models.CharField(
+        max_length=7,
+        blank=True,
+        editable=False,
+        help_text="#rrggbb",
+    )
+    placeholder = models.TextField(
+        blank=True,
+        editable=False,
+        help_text="Data URI of a tiny JPEG of the image, shown blurred while it loads.",
+    )
+    processed_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     def __str__(self):
         return f"{self.user} uploaded {self.image}"
@@ -66,19 +195,29 @@ class Tag(models.Model):
 class ArticleManager(models.Manager):
 
     def get_queryset(self):
-        return (
-            super()
-            .get_queryset()
+        # A correlated subquery rather than a join, as grouping the joined rows
+        # keeps the filters and orderings from using indexes.
+        rates = (
+            ArticleRate.objects.filter(article=models.OuterRef("pk"))
+            .values("article")
             .annotate(
                 rating=models.Sum(
                     models.Case(
-                        models.When(article_rates__is_positive=True, then=1),
-                        models.When(article_rates__is_positive=False, then=-1),
+                        models.When(is_positive=True, then=1),
+                        models.When(is_positive=False, then=-1),
                         default=0,
                         output_field=models.IntegerField(),
                     )
                 )
             )
+            .values("rating")
+        )
+        return (
+            super()
+            .get_queryset()
+            # Articles being deleted, see `blog_app.deletion`.
+            .filter(deleted_at=None)
+            .annotate(rating=Coalesce(models.Subquery(rates), 0))
         )
 
 
@@ -91,6 +230,17 @@ class Article(models.Model):
     )
     title = models.CharField(max_length=100)
     content = models.TextField()
+    # Derived from `content` on save by the `ARTICLE_RENDERER`.
+    excerpt = models.CharField(max_length=300, blank=True, editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        help_text="Minutes",
+    )
+    rendered_content = models.TextField(blank=True, editable=False)
+    outline = models.JSONField(default=list, blank=True, editable=False)
+    renderer_version = models.CharField(max_length=32, blank=True, editable=False)
     cover = models.ForeignKey(
         UploadedImage,
         on_delete=models.SET_NULL,
@@ -111,6 +261,20 @@ class Article(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     editor_choice = models.BooleanField(default=False)
+    # Only ever incremented with `F()` updates, see `blog_app.view_counter`.
+    views = models.PositiveBigIntegerField(default=0, db_index=True, editable=False)
+    # Set when the article is hidden until `blog_app.deletion` deletes it.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    class Meta:
+        # The filters and orderings of `ArticleViewSet`, see `index_advisor`.
+        indexes = [
+            models.Index(fields=["-created_at"]),
+            models.Index(fields=["-updated_at"]),
+            models.Index(fields=["editor_choice", "-created_at"]),
+            models.Index(fields=["category", "-created_at"]),
+            models.Index(fields=["author", "-created_at"]),
+        ]
 
     @property
     def ratings_count(
@@ -119,6 +283,12 @@ class Article(models.Model):
         Literal["positive"] | Literal["negative"],
         int,
     ]:
+        # Annotated for many articles at once, see `ArticleViewSet`.
+        if hasattr(self, "num_positive_rates"):
+            return {
+                "positive": self.num_positive_rates,
+                "negative": self.num_negative_rates,
+            }
         return self.article_rates.aggregate(
             positive=models.Count("pk", filter=models.Q(is_positive=True)),
             negative=models.Count("pk", filter=models.Q(is_positive=False)),
@@ -143,11 +313,129 @@ class Article(models.Model):
     def tags_names(self):
         return self.tags.values_list("name", flat=True)
 
+    RENDERED_FIELDS = (
+        "excerpt",
+        "word_count",
+        "reading_time",
+        "rendered_content",
+        "outline",
+        "renderer_version",
+    )
+
+    def render_content(self, renderer=None):
+        renderer = renderer or get_renderer()
+        rendered = renderer.render(self.content)
+        self.excerpt = rendered.excerpt
+        self.word_count = rendered.word_count
+        self.reading_time = rendered.reading_time
+        self.rendered_content = rendered.html
+        self.outline = rendered.outline
+        self.renderer_version = renderer.version
+
+    # Only written by `update()` queries, full saves leave them alone.
+    UPDATE_ONLY_FIELDS = ("views", "deleted_at")
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "content" in update_fields:
+            self.render_content()
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, *self.RENDERED_FIELDS}
+        if update_fields is None and not self._state.adding:
+            # Don't write back counters incremented, or a deletion requested,
+            # since the article was loaded.
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UPDATE_ONLY_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f'"{self.title}" by {self.author}'
 
 
+class RelatedArticle(models.Model):
+    """Precomputed "related articles" list entry, see `blog_app.related`."""
+
+    article = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        related_name="related_articles",
+    )
+    related = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("article", "related")
+        indexes = [models.Index(fields=["article", "-score"])]
+
+    def __str__(self):
+        return f"{self.related} related to {self.article}"
+
+
+class SimilarArticle(models.Model):
+    """
+    Precomputed neighbour of an article by the users who liked both,
+    see `blog_app.recommendations`.
+    """
+
+    article = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        related_name="similar_articles",
+    )
+    similar = models.ForeignKey(
+        Article,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ("article", "similar")
+        indexes = [models.Index(fields=["article", "-score"])]
+
+    def __str__(self):
+        return f"{self.similar} similar to {self.article}"
+
+
+class SimilarityChange(models.Model):
+    """
+    Article which lost rates or favorites, recomputed by the next
+    incremental `build_similar_articles` run. Rates and favorites written
+    are found by their own time.
+    """
+
+    # Not a foreign key, the article may be deleted meanwhile.
+    article_id = models.BigIntegerField()
+    changed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Interactions of article {self.article_id} removed"
+
+
+class SimilarityRun(models.Model):
+    """
+    Run of `manage.py build_similar_articles`, incremental runs start from
+    the last finished one.
+    """
+
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    full = models.BooleanField()
+    articles_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Similarity run of {self.started_at}"
+
+
 class ArticleRate(models.Model):
+    objects = UpsertManager()
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -159,10 +447,15 @@ class ArticleRate(models.Model):
         related_name="article_rates",
     )
     is_positive = models.BooleanField()
-    rated_at = models.DateTimeField(auto_now_add=True)
+    # Last changed, incremental exports and similarity runs start from it.
+    rated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "article")
+        indexes = [
+            models.Index(fields=["rated_at"]),
+            models.Index(fields=["user", "-rated_at"]),
+        ]
 
     def __str__(self):
         return (
@@ -173,19 +466,28 @@ class ArticleRate(models.Model):
 class CommentManager(models.Manager):
 
     def get_queryset(self):
-        return (
-            super()
-            .get_queryset()
+        # A correlated subquery rather than a join, as grouping the joined rows
+        # keeps the filters and orderings from using indexes.
+        rates = (
+            CommentRate.objects.filter(comment=models.OuterRef("pk"))
+            .values("comment")
             .annotate(
                 rating=models.Sum(
                     models.Case(
-                        models.When(comment_rates__is_positive=True, then=1),
-                        models.When(comment_rates__is_positive=False, then=-1),
+                        models.When(is_positive=True, then=1),
+                        models.When(is_positive=False, then=-1),
                         default=0,
                         output_field=models.IntegerField(),
                     )
                 )
             )
+            .values("rating")
+        )
+        return (
+            super()
+            .get_queryset()
+            .filter(article__deleted_at=None)
+            .annotate(rating=Coalesce(models.Subquery(rates), 0))
         )
 
 
@@ -213,6 +515,14 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # The filters and orderings of `CommentViewSet`, see `index_advisor`.
+        indexes = [
+            models.Index(fields=["article", "created_at"]),
+            models.Index(fields=["author", "-created_at"]),
+            models.Index(fields=["reply_to", "created_at"]),
+        ]
+
     @property
     def has_replies(self):
         return self.replies.count() > 0
@@ -247,6 +557,7 @@ class Comment(models.Model):
 
 
 class CommentRate(models.Model):
+    objects = UpsertManager()
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -258,7 +569,8 @@ class CommentRate(models.Model):
         related_name="comment_rates",
     )
     is_positive = models.BooleanField()
-    rated_at = models.DateTimeField(auto_now_add=True)
+    # Last changed, incremental exports start from it.
+    rated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ("user", "comment")
@@ -270,6 +582,7 @@ class CommentRate(models.Model):
 
 
 class ArticleFavorite(models.Model):
+    objects = UpsertManager()
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -283,12 +596,24 @@ class ArticleFavorite(models.Model):
     class Meta:
         ordering = ("-favored_at",)
         unique_together = ("user", "article")
+        indexes = [
+            models.Index(fields=["favored_at"]),
+            models.Index(fields=["user", "-favored_at"]),
+        ]
 
     def __str__(self):
         return f"{self.user} favored {self.article}"
 
 
+class ProfileManager(models.Manager):
+
+    def get_queryset(self):
+        # Profiles of users being deleted, see `blog_app.deletion`.
+        return super().get_queryset().filter(deleted_at=None)
+
+
 class Profile(models.Model):
+    objects = ProfileManager()
     user = models.OneToOneField(
         User,
         on_delete=models.CASCADE,
@@ -306,17 +631,28 @@ class Profile(models.Model):
         blank=True,
     )
     bio = models.TextField(blank=True)
+    # Set when the user is hidden until `blog_app.deletion` deletes them.
+    deleted_at = models.DateTimeField(null=True, blank=True, editable=False)
+
+    # The counts are annotated for many profiles at once, see
+    # `annotate_profiles()` in `blog_app.views`.
 
     @property
     def articles_count(self) -> int:
+        if hasattr(self, "num_articles"):
+            return self.num_articles
         return self.user.articles.count()
 
     @property
     def subscribers_count(self) -> int:
+        if hasattr(self, "num_subscribers"):
+            return self.num_subscribers
         return self.subscribers.count()
 
     @property
     def total_articles_rating(self) -> int:
+        if hasattr(self, "articles_rating"):
+            return self.articles_rating
         return (
             self.user.articles.aggregate(
                 rating=models.Sum(
@@ -334,6 +670,7 @@ class Profile(models.Model):
 
 
 class ProfileSubscription(models.Model):
+    objects = UpsertManager()
     user = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -351,3 +688,94 @@ class ProfileSubscription(models.Model):
 
     def __str__(self):
         return f"{self.user} subscribed to {self.profile}"
+
+
+class Job(models.Model):
+    """Deferred call of a function, run by `manage.py run_workers`."""
+
+    QUEUED = "queued"
+    RUNNING = "running"
+    FAILED = "failed"
+    STATUSES = [
+        (QUEUED, "Queued"),
+        (RUNNING, "Running"),
+        (FAILED, "Failed"),
+    ]
+
+    name = models.CharField(max_length=200)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    # A job isn't queued again while one with the same key is queued.
+    dedup_key = models.CharField(max_length=200, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField()
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "run_at"])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dedup_key"],
+                condition=models.Q(status="queued"),
+                name="unique_queued_job_dedup_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class Deletion(models.Model):
+    """Progress of an article or a user deleted by `blog_app.deletion`."""
+
+    ARTICLE = "article"
+    USER = "user"
+    KINDS = [
+        (ARTICLE, "Article"),
+        (USER, "User"),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.PositiveBigIntegerField()
+    requested_by = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="+",
+    )
+    requested_at = models.DateTimeField(auto_now_add=True)
+    # Index of the step running, in `blog_app.deletion.get_steps()`.
+    step = models.PositiveSmallIntegerField(default=0)
+    # Rows deleted or detached so far, by model.
+    rows = models.JSONField(default=dict, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["kind", "object_id"],
+                name="unique_deletion_object",
+            )
+        ]
+
+    def __str__(self):
+        return f"Deletion of {self.kind} {self.object_id}"
+
+
+class Invalidation(models.Model):
+    """Message of `blog_app.invalidation`, read by every other process."""
+
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    # The process which sent it, see `blog_app.invalidation.get_publisher()`.
+    publisher = models.CharField(max_length=100)
+    published_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.topic} from {self.publisher}"
@@ -1,3 +1,4 @@
+from django.conf import settings
 from rest_framework import permissions
 
 
@@ -31,8 +32,8 @@ class CommentPermission(permissions.BasePermission):
 
 class ProfilePermission(permissions.BasePermission):
     def has_permission(self, request, view):
-        # Only retrieve action is allowed.
-        if view.action == "retrieve":
+        # Only retrieve actions are allowed.
+        if view.action in ("retrieve", "batch", "autocomplete"):
             return True
         # List action is allowed only if subscribed query param is present.
         # (The user can see only its subscriptions)
@@ -51,3 +52,10 @@ class ProfilePermission(permissions.BasePermission):
         else:
             # The user can't delete its profile, but can update it.
             return request.method != "DELETE" and obj.user == request.user
+
+
+class MetricsScraperPermission(permissions.BasePermission):
+    """Requests from `METRICS_ALLOWED_IPS`, the Prometheus servers."""
+
+    def has_permission(self, request, view):
+        return request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
@@ -0,0 +1,137 @@
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from blog_app.autocomplete import reload_entries
+from blog_app.models import Profile
+from blog_app.recommendations import chunked
+
+# Passwords hashed by a worker at a time, small enough to spread a batch
+# over the workers.
+HASH_CHUNK_SIZE = 25
+
+
+def hash_passwords(passwords) -> list[str]:
+    return [make_password(password) for password in passwords]
+
+
+def create_hash_executor(workers) -> ProcessPoolExecutor:
+    # Spawned, forked workers would share this process' connections.
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=django.setup,
+    )
+
+
+_hash_executor = None
+_hash_executor_lock = threading.Lock()
+
+
+def get_hash_executor() -> ProcessPoolExecutor:
+    """Return the process wide hashing pool, started on first use."""
+    global _hash_executor
+    if _hash_executor is None:
+        with _hash_executor_lock:
+            if _hash_executor is None:
+                _hash_executor = create_hash_executor(settings.PROVISIONING_WORKERS)
+    return _hash_executor
+
+
+def _submit_hashes(users, executor):
+    """Return futures, or lists for the batch, of the hashes of `users`."""
+    # Users without a password get an unusable one, which is cheap.
+    passwords = [
+        None if user.get("password_hash") else user.get("password") or None
+        for user in users
+    ]
+    if executor is None:
+        return [hash_passwords(passwords)]
+    return [
+        executor.submit(hash_passwords, chunk)
+        for chunk in chunked(passwords, HASH_CHUNK_SIZE)
+    ]
+
+
+def _create_batch(users, hashes) -> tuple[list, list]:
+    usernames = [user["username"] for user in users]
+    existing = set(
+        User.objects.filter(username__in=usernames).values_list("username", flat=True)
+    )
+    now = timezone.now()
+    created = []
+    skipped = []
+    for user, password in zip(users, hashes):
+        if user["username"] in existing:
+            skipped.append(user["username"])
+            continue
+        existing.add(user["username"])
+        created.append(
+            User(
+                username=user["username"],
+                email=user.get("email", ""),
+                first_name=user.get("first_name", ""),
+                last_name=user.get("last_name", ""),
+                password=user.get("password_hash") or password,
+                date_joined=now,
+            )
+        )
+    if not created:
+        return created, skipped
+    with transaction.atomic():
+        User.objects.bulk_create(created)
+        if created[0].pk is None:
+            # The database doesn't return the ids of inserted rows.
+            ids = dict(
+                User.objects.filter(
+                    username__in=[user.username for user in created]
+                ).values_list("username", "pk")
+            )
+            for user in created:
+                user.pk = ids[user.username]
+        profiles = Profile.objects.bulk_create(
+            Profile(user=user, username=user.username) for user in created
+        )
+        Token.objects.bulk_create(
+            Token(user=user, key=Token.generate_key()) for user in created
+        )
+        if profiles and profiles[0].pk is not None:
+            reload_entries("usernames", [profile.pk for profile in profiles])
+    return created, skipped
+
+
+def provision_users(users, executor=None, batch_size=1000):
+    """
+    Create users with their profile and token, from dicts with a `username`
+    and optional `password` or `password_hash`, `email`, `first_name` and
+    `last_name`. Users without password can't log in.
+
+    Model signals are bypassed and rows are inserted in batches. Passwords
+    are hashed by `executor`, or in process without, a batch ahead of the
+    one being inserted. Existing usernames are skipped.
+
+    Yield the created users and the skipped usernames of every batch.
+    """
+    pending = deque()
+    for batch in chunked(users, batch_size):
+        pending.append((batch, _submit_hashes(batch, executor)))
+        if len(pending) > 1:
+            yield _create_batch(*_collect(*pending.popleft()))
+    while pending:
+        yield _create_batch(*_collect(*pending.popleft()))
+
+
+def _collect(batch, parts):
+    hashes = []
+    for part in parts:
+        hashes.extend(part if isinstance(part, list) else part.result())
+    return batch, hashes
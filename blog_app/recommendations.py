@@ -0,0 +1,257 @@
+import heapq
+import math
+from collections import defaultdict
+from itertools import islice
+
+from django.conf import settings
+from django.db import models, transaction
+
+from blog_app.models import (
+    ArticleFavorite,
+    ArticleRate,
+    SimilarArticle,
+    SimilarityChange,
+)
+
+# Weights of the interactions in the user/article matrix, a user's weight
+# for an article is the sum of their rate and favorite.
+FAVORITE_WEIGHT = 1.0
+POSITIVE_RATE_WEIGHT = 1.0
+NEGATIVE_RATE_WEIGHT = -1.0
+
+# Ids per `IN` lookup.
+LOOKUP_BATCH_SIZE = 500
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def rate_weight():
+    return models.Case(
+        models.When(is_positive=True, then=models.Value(POSITIVE_RATE_WEIGHT)),
+        default=models.Value(NEGATIVE_RATE_WEIGHT),
+        output_field=models.FloatField(),
+    )
+
+
+def iter_interactions(**lookup):
+    """Yield `(user id, article id, weight)` for each rate and favorite."""
+    rates = ArticleRate.objects.filter(**lookup).values_list(
+        "user_id", "article_id", "is_positive"
+    )
+    for user_id, article_id, is_positive in rates.iterator(chunk_size=2000):
+        yield (
+            user_id,
+            article_id,
+            POSITIVE_RATE_WEIGHT if is_positive else NEGATIVE_RATE_WEIGHT,
+        )
+    favorites = (
+        ArticleFavorite.objects.filter(**lookup)
+        .order_by()
+        .values_list("user_id", "article_id")
+    )
+    for user_id, article_id in favorites.iterator(chunk_size=2000):
+        yield user_id, article_id, FAVORITE_WEIGHT
+
+
+def get_norms(article_ids) -> dict[int, float]:
+    """Return the norm of the matrix column of each article, in SQL."""
+    squares = defaultdict(float)
+    favored = models.Exists(
+        ArticleFavorite.objects.filter(
+            user_id=models.OuterRef("user_id"),
+            article_id=models.OuterRef("article_id"),
+        )
+    )
+    weight = rate_weight()
+    for batch in chunked(article_ids, LOOKUP_BATCH_SIZE):
+        # (rate + favorite)² = rate² + 2 rate favorite + favorite²
+        rates = (
+            ArticleRate.objects.filter(article_id__in=batch)
+            .values("article_id")
+            .annotate(
+                squares=models.Sum(
+                    weight * weight
+                    + models.Case(
+                        models.When(favored, then=weight * (2 * FAVORITE_WEIGHT)),
+                        default=models.Value(0.0),
+                        output_field=models.FloatField(),
+                    )
+                )
+            )
+            .values_list("article_id", "squares")
+        )
+        for article_id, value in rates:
+            squares[article_id] += value
+        favorites = (
+            ArticleFavorite.objects.filter(article_id__in=batch)
+            .order_by()
+            .values("article_id")
+            .annotate(count=models.Count("pk"))
+            .values_list("article_id", "count")
+        )
+        for article_id, count in favorites:
+            squares[article_id] += count * FAVORITE_WEIGHT**2
+    return {
+        article_id: math.sqrt(value)
+        for article_id, value in squares.items()
+        if value > 0
+    }
+
+
+def compute_similar(article_ids) -> dict[int, dict[int, float]]:
+    """
+    Return the cosine similarity of each of the given articles to every
+    article sharing a user with it, leaving out non-positive ones.
+
+    Only the matrix columns of the given articles and the rows of their
+    users are loaded, so memory is bounded by the size of the chunk.
+    """
+    # The given articles' columns, indexed by user.
+    columns = defaultdict(lambda: defaultdict(float))
+    for user_id, article_id, weight in iter_interactions(article_id__in=article_ids):
+        columns[user_id][article_id] += weight
+
+    dots = defaultdict(lambda: defaultdict(float))
+    for batch in chunked(columns, LOOKUP_BATCH_SIZE):
+        for user_id, other_id, weight in iter_interactions(user_id__in=batch):
+            for article_id, article_weight in columns[user_id].items():
+                if other_id != article_id:
+                    dots[article_id][other_id] += article_weight * weight
+
+    norms = get_norms({other_id for scores in dots.values() for other_id in scores})
+    norms.update(get_norms(list(dots)))
+    similar = {}
+    for article_id in article_ids:
+        scores = {}
+        if article_id in norms:
+            for other_id, dot in dots[article_id].items():
+                if other_id in norms and dot > 0:
+                    scores[other_id] = dot / (norms[article_id] * norms[other_id])
+        similar[article_id] = scores
+    return similar
+
+
+def interactions_removed(article_ids):
+    """
+    Have the next incremental run recompute the articles which lost rates
+    or favorites, deleted rows leave no time to find them by.
+    """
+    SimilarityChange.objects.bulk_create(
+        SimilarityChange(article_id=article_id) for article_id in set(article_ids)
+    )
+
+
+def top(scores: dict, limit: int) -> list[tuple[int, float]]:
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def save_similar(similar: dict[int, dict[int, float]], symmetric=True) -> int:
+    """
+    Store the top neighbours of the articles computed by `compute_similar()`.
+
+    With `symmetric`, the new scores are also merged into the stored lists
+    of the neighbours, which is how incremental runs keep them up to date.
+    Return the number of lists written.
+    """
+    limit = settings.SIMILAR_ARTICLES_LIMIT
+    lists = {article_id: top(scores, limit) for article_id, scores in similar.items()}
+
+    if symmetric:
+        reverse = defaultdict(dict)
+        for article_id, scores in similar.items():
+            for other_id, score in scores.items():
+                reverse[other_id][article_id] = score
+        # Lists holding a computed article it isn't scored against anymore.
+        for article_id in SimilarArticle.objects.filter(
+            similar_id__in=list(similar)
+        ).values_list("article_id", flat=True):
+            reverse.setdefault(article_id, {})
+        stored = defaultdict(dict)
+        for batch in chunked(set(reverse) - set(similar), LOOKUP_BATCH_SIZE):
+            for article_id, similar_id, score in SimilarArticle.objects.filter(
+                article_id__in=batch
+            ).values_list("article_id", "similar_id", "score"):
+                stored[article_id][similar_id] = score
+
+        for other_id, scores in reverse.items():
+            if other_id in similar:
+                continue
+            old = stored[other_id]
+            new = {
+                similar_id: score
+                for similar_id, score in old.items()
+                if similar_id not in similar
+            }
+            new.update(scores)
+            new_list = top(new, limit)
+            if dict(new_list) != old:
+                lists[other_id] = new_list
+
+    with transaction.atomic():
+        for batch in chunked(lists, LOOKUP_BATCH_SIZE):
+            SimilarArticle.objects.filter(article_id__in=batch).delete()
+        SimilarArticle.objects.bulk_create(
+            (
+                SimilarArticle(
+                    article_id=article_id, similar_id=similar_id, score=score
+                )
+                for article_id, neighbours in lists.items()
+                for similar_id, score in neighbours
+            ),
+            batch_size=1000,
+        )
+    return len(lists)
+
+
+def get_recommended_ids(user_id) -> list[int]:
+    """
+    Return the ids of the articles recommended to a user, best first.
+
+    The neighbours of the articles the user rated or favored last are
+    summed up, weighted by the user's interaction. Every lookup is served
+    by an index.
+    """
+    history = settings.RECOMMENDATIONS_HISTORY
+    seeds = defaultdict(float)
+    for article_id, is_positive in (
+        ArticleRate.objects.filter(user_id=user_id)
+        .order_by("-rated_at")
+        .values_list("article_id", "is_positive")[:history]
+    ):
+        seeds[article_id] += (
+            POSITIVE_RATE_WEIGHT if is_positive else NEGATIVE_RATE_WEIGHT
+        )
+    for article_id in (
+        ArticleFavorite.objects.filter(user_id=user_id)
+        .order_by("-favored_at")
+        .values_list("article_id", flat=True)[:history]
+    ):
+        seeds[article_id] += FAVORITE_WEIGHT
+
+    scores = defaultdict(float)
+    for article_id, similar_id, score in SimilarArticle.objects.filter(
+        article_id__in=list(seeds)
+    ).values_list("article_id", "similar_id", "score"):
+        scores[similar_id] += seeds[article_id] * score
+
+    candidates = [article_id for article_id, score in scores.items() if score > 0]
+    # Older interactions aren't in the seeds, leave their articles out too.
+    seen = set(seeds)
+    seen.update(
+        ArticleRate.objects.filter(
+            user_id=user_id, article_id__in=candidates
+        ).values_list("article_id", flat=True)
+    )
+    seen.update(
+        ArticleFavorite.objects.filter(user_id=user_id, article_id__in=candidates)
+        .order_by()
+        .values_list("article_id", flat=True)
+    )
+    return sorted(
+        (article_id for article_id in candidates if article_id not in seen),
+        key=lambda article_id: (-scores[article_id], -article_id),
+    )
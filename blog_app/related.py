@@ -0,0 +1,124 @@
+import math
+
+from django.conf import settings
+from django.db import models, transaction
+
+from blog_app.jobs import enqueue_on_commit
+from blog_app.models import Article, RelatedArticle
+
+ArticleTag = Article.tags.through
+
+# Score of sharing the category, a shared tag scores 1 / log2(1 + articles).
+CATEGORY_WEIGHT = 0.3
+
+
+def tag_weight(articles_count: int) -> float:
+    """Rare tags say more about an article than popular ones."""
+    return 1 / math.log2(1 + articles_count)
+
+
+def compute_related(article_id, limit=None) -> list[tuple[int, float]]:
+    """
+    Return up to `limit` `(article id, score)` pairs of the articles most
+    related to the given one, scored by their shared tags and category.
+
+    Candidates are found through the article/tag table, which is the
+    tag -> articles inverted index, so only articles sharing something are
+    looked at.
+    """
+    limit = limit or settings.RELATED_ARTICLES_LIMIT
+    article = (
+        Article._base_manager.filter(pk=article_id).values("category_id").first()
+    )
+    if article is None:
+        return []
+    category_id = article["category_id"]
+
+    tag_ids = list(
+        ArticleTag.objects.filter(article_id=article_id).values_list(
+            "tag_id", flat=True
+        )
+    )
+    scores = []
+    if tag_ids:
+        weights = {
+            row["tag_id"]: tag_weight(row["count"])
+            for row in ArticleTag.objects.filter(tag_id__in=tag_ids)
+            .values("tag_id")
+            .annotate(count=models.Count("pk"))
+        }
+        score = models.Sum(
+            models.Case(
+                *(
+                    models.When(tag_id=tag_id, then=models.Value(weight))
+                    for tag_id, weight in weights.items()
+                ),
+                default=models.Value(0.0),
+                output_field=models.FloatField(),
+            )
+        )
+        if category_id is not None:
+            score += models.Max(
+                models.Case(
+                    models.When(
+                        article__category_id=category_id,
+                        then=models.Value(CATEGORY_WEIGHT),
+                    ),
+                    default=models.Value(0.0),
+                    output_field=models.FloatField(),
+                )
+            )
+        scores = list(
+            ArticleTag.objects.filter(tag_id__in=tag_ids, article__deleted_at=None)
+            .exclude(article_id=article_id)
+            .values("article_id")
+            .annotate(score=score)
+            .order_by("-score", "-article_id")
+            .values_list("article_id", "score")[:limit]
+        )
+
+    if len(scores) < limit and category_id is not None:
+        # Fill up with the latest articles of the same category.
+        scores += [
+            (pk, CATEGORY_WEIGHT)
+            for pk in Article._base_manager.filter(
+                category_id=category_id, deleted_at=None
+            )
+            .exclude(pk__in=[article_id, *(pk for pk, _ in scores)])
+            .order_by("-created_at")
+            .values_list("pk", flat=True)[: limit - len(scores)]
+        ]
+    return scores
+
+
+def refresh_related(article_id, cascade=True):
+    """
+    Recompute the stored related list of an article. With `cascade`, also
+    refresh the articles listed before and after, which are the ones most
+    likely to list the article themselves.
+    """
+    old_ids = set(
+        RelatedArticle.objects.filter(article_id=article_id).values_list(
+            "related_id", flat=True
+        )
+    )
+    scores = compute_related(article_id)
+    with transaction.atomic():
+        RelatedArticle.objects.filter(article_id=article_id).delete()
+        RelatedArticle.objects.bulk_create(
+            RelatedArticle(article_id=article_id, related_id=pk, score=score)
+            for pk, score in scores
+        )
+    if cascade:
+        for pk in old_ids | {pk for pk, _ in scores}:
+            refresh_related(pk, cascade=False)
+
+
+def schedule_refresh(article_id):
+    """
+    Refresh the related list of an article in a job, once for the changes
+    of the article made in a transaction.
+    """
+    enqueue_on_commit(
+        refresh_related, article_id, dedup_key=f"refresh_related:{article_id}"
+    )
@@ -0,0 +1,165 @@
+import math
+from dataclasses import dataclass, field
+from functools import cache
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+from django.utils.text import Truncator, slugify
+
+WORDS_PER_MINUTE = 200
+
+
+def make_excerpt(text: str, length: int = 300) -> str:
+    return Truncator(" ".join(text.split())).chars(length)
+
+
+@dataclass
+class RenderedContent:
+    excerpt: str
+    word_count: int
+    reading_time: int
+    html: str
+    outline: list = field(default_factory=list)
+
+
+class _SanitizingParser(HTMLParser):
+    def __init__(self, renderer):
+        super().__init__(convert_charrefs=True)
+        self.renderer = renderer
+        self.html = []
+        self.text = []
+        self.outline = []
+        self.heading = None
+        self.slugs = set()
+        # Depth inside tags whose content is dropped, like <script>.
+        self.skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.renderer.dropped_tags:
+            self.skipping += 1
+            return
+        if self.skipping or tag not in self.renderer.allowed_tags:
+            return
+        allowed = self.renderer.allowed_attributes.get(tag, ())
+        attrs = [
+            (name, value)
+            for name, value in attrs
+            if name in allowed
+            and value is not None
+            and (name not in ("href", "src") or self.renderer.is_safe_url(value))
+        ]
+        if tag in ("h1", "h2", "h3", "h4", "h5", "h6"):
+            self.heading = {
+                "level": int(tag[1]),
+                "title": "",
+                "html_index": len(self.html),
+            }
+        self.html.append(
+            "<%s%s>"
+            % (
+                tag,
+                "".join(f' {name}="{escape(value)}"' for name, value in attrs),
+            )
+        )
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag in self.renderer.dropped_tags:
+            self.skipping -= 1
+
+    def handle_endtag(self, tag):
+        if tag in self.renderer.dropped_tags:
+            self.skipping = max(self.skipping - 1, 0)
+            return
+        if self.skipping or tag not in self.renderer.allowed_tags:
+            return
+        if tag in self.renderer.void_tags:
+            return
+        if self.heading is not None and tag == f"h{self.heading['level']}":
+            self._close_heading()
+        self.html.append(f"</{tag}>")
+        if tag in self.renderer.block_tags:
+            self.text.append(" ")
+
+    def handle_data(self, data):
+        if self.skipping:
+            return
+        self.html.append(escape(data, quote=False))
+        self.text.append(data)
+        if self.heading is not None:
+            self.heading["title"] += data
+
+    def _close_heading(self):
+        heading, self.heading = self.heading, None
+        title = " ".join(heading["title"].split())
+        slug = base = slugify(title) or "section"
+        index = 1
+        while slug in self.slugs:
+            index += 1
+            slug = f"{base}-{index}"
+        self.slugs.add(slug)
+        # Give the heading an anchor the outline can link to.
+        position = heading["html_index"]
+        self.html[position] = self.html[position][:-1] + f' id="{slug}">'
+        self.outline.append({"level": heading["level"], "title": title, "id": slug})
+
+
+class HTMLRenderer:
+    """
+    Renders the HTML written by the article editor.
+
+    Tags and attributes outside of the allow lists are stripped, the
+    content of `dropped_tags` is removed entirely. Bump `version` whenever
+    the output changes, so `rebuild_article_content` re-renders articles.
+    """
+
+    version = "html-1"
+
+    allowed_tags = {
+        "a", "b", "blockquote", "br", "code", "em", "figcaption", "figure",
+        "h1", "h2", "h3", "h4", "h5", "h6", "hr", "i", "img", "li", "ol", "p",
+        "pre", "s", "span", "strong", "sub", "sup", "table", "tbody", "td",
+        "th", "thead", "tr", "u", "ul",
+    }  # fmt: skip
+    allowed_attributes = {
+        "a": ("href", "title"),
+        "img": ("src", "alt", "title", "width", "height"),
+        "td": ("colspan", "rowspan"),
+        "th": ("colspan", "rowspan"),
+    }
+    dropped_tags = {"script", "style", "iframe", "object", "embed", "template"}
+    void_tags = {"br", "hr", "img"}
+    block_tags = {
+        "blockquote", "figcaption", "h1", "h2", "h3", "h4", "h5", "h6", "li",
+        "p", "pre", "td", "th",
+    }  # fmt: skip
+    allowed_url_schemes = {"", "http", "https", "mailto"}
+
+    def is_safe_url(self, url: str) -> bool:
+        try:
+            return urlsplit(url.strip()).scheme.lower() in self.allowed_url_schemes
+        except ValueError:
+            return False
+
+    def render(self, content: str) -> RenderedContent:
+        parser = _SanitizingParser(self)
+        parser.feed(content)
+        parser.close()
+        text = " ".join("".join(parser.text).split())
+        word_count = len(text.split())
+        return RenderedContent(
+            excerpt=make_excerpt(text),
+            word_count=word_count,
+            reading_time=math.ceil(word_count / WORDS_PER_MINUTE),
+            html="".join(parser.html),
+            outline=parser.outline,
+        )
+
+
+@cache
+def get_renderer():
+    """Return the renderer configured by the `ARTICLE_RENDERER` setting."""
+    return import_string(settings.ARTICLE_RENDERER)()
@@ -0,0 +1,94 @@
+import hashlib
+import threading
+from functools import cache
+from importlib.metadata import version as package_version
+from pathlib import Path
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from drf_spectacular.generators import SchemaGenerator
+from drf_spectacular.renderers import OpenApiJsonRenderer, OpenApiYamlRenderer
+from drf_spectacular.utils import extend_schema
+from drf_spectacular.views import SCHEMA_KWARGS, SpectacularAPIView
+
+RENDERERS = {
+    "json": OpenApiJsonRenderer,
+    "yaml": OpenApiYamlRenderer,
+}
+
+
+@cache
+def get_code_version() -> str:
+    """
+    Hash of everything the schema is generated from: the project sources,
+    the spectacular settings and the library versions.
+    """
+    digest = hashlib.sha256()
+    for package in ("django", "djangorestframework", "drf-spectacular"):
+        digest.update(f"{package}=={package_version(package)}".encode())
+    digest.update(repr(sorted(settings.SPECTACULAR_SETTINGS.items())).encode())
+    for directory in ("blog_app", "blog_project"):
+        for path in sorted((Path(settings.BASE_DIR) / directory).rglob("*.py")):
+            digest.update(str(path.relative_to(settings.BASE_DIR)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()[:16]
+
+
+def get_schema_path(format: str) -> Path:
+    return Path(settings.SCHEMA_DIR) / f"schema-{get_code_version()}.{format}"
+
+
+def build_schema() -> list[Path]:
+    """Generate the schema of the current code version in every format."""
+    schema = SchemaGenerator().get_schema(request=None, public=True)
+    Path(settings.SCHEMA_DIR).mkdir(parents=True, exist_ok=True)
+    paths = []
+    for format, renderer_class in RENDERERS.items():
+        path = get_schema_path(format)
+        # Written aside and renamed, so readers never see a partial file.
+        temporary_path = path.with_suffix(f".{format}.tmp")
+        temporary_path.write_bytes(renderer_class().render(schema, renderer_context={}))
+        temporary_path.replace(path)
+        paths.append(path)
+    return paths
+
+
+_schemas = {}
+_build_lock = threading.Lock()
+
+
+def get_schema(format: str) -> bytes:
+    """Return the prebuilt schema, building it when the code version changed."""
+    path = get_schema_path(format)
+    if path not in _schemas:
+        with _build_lock:
+            if not path.exists():
+                build_schema()
+            _schemas[path] = path.read_bytes()
+    return _schemas[path]
+
+
+class PrebuiltSchemaView(SpectacularAPIView):
+    """
+    Serves the schema written by `manage.py build_schema` instead of
+    generating it on every request, with an ETag bound to the code version.
+    """
+
+    @extend_schema(**SCHEMA_KWARGS)
+    def get(self, request, *args, **kwargs):
+        if request.GET.get("lang"):
+            # Translated schemas aren't prebuilt.
+            return super().get(request, *args, **kwargs)
+        renderer, media_type = self.perform_content_negotiation(request)
+        format = "json" if renderer.format == "json" else "yaml"
+        etag = f'"{get_code_version()}-{format}"'
+        if etag in request.headers.get("If-None-Match", ""):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(get_schema(format), content_type=media_type)
+            response["Content-Disposition"] = (
+                f'inline; filename="{self._get_filename(request, None)}"'
+            )
+        response["ETag"] = etag
+        response["Cache-Control"] = f"public, max-age={settings.SCHEMA_MAX_AGE}"
+        return response
@@ -5,14 +5,61 @@ from blog_app.models import (
     Comment,
     CommentRate,
     Profile,
+    ProfileSubscription,
     Tag,
     UploadedFile,
     UploadedImage,
 )
-from rest_framework import serializers
+from rest_framework import permissions, serializers
+from django.contrib.auth.hashers import identify_hasher
 from django.contrib.auth.models import User
+from django.contrib.auth.validators import UnicodeUsernameValidator
 from drf_spectacular.utils import extend_schema_field
 
+from blog_app.view_counter import get_view_counter
+from blog_app.write_behind import get_rate_buffer
+
+
+def parse_field_names(value: str | None) -> set[str]:
+    return {name.strip() for name in (value or "").split(",") if name.strip()}
+
+
+class SparseFieldsMixin:
+    """
+    Lets clients pick the fields of read responses with `?fields=` and
+    `?omit=`. Fields in `Meta.list_expandable_fields` are left out of list
+    responses, and those of the view's other `many_actions`, unless requested
+    with `?expand=` or `?fields=`.
+
+    Only the serializer created by the view is trimmed, nested serializers
+    keep all their fields.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get("request")
+        if (
+            "context" in kwargs
+            and request is not None
+            and request.method in permissions.SAFE_METHODS
+        ):
+            selected = self.get_selected_field_names(request)
+            for name in list(self.fields):
+                if name not in selected:
+                    self.fields.pop(name)
+
+    def get_selected_field_names(self, request) -> set[str]:
+        names = set(self.fields)
+        fields = parse_field_names(request.query_params.get("fields"))
+        view = self.context.get("view")
+        if fields:
+            names &= fields
+        elif getattr(view, "action", None) in getattr(view, "many_actions", ("list",)):
+            names -= set(getattr(self.Meta, "list_expandable_fields", ())) - (
+                parse_field_names(request.query_params.get("expand"))
+            )
+        return names - parse_field_names(request.query_params.get("omit"))
+
 
 class UserSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
@@ -22,10 +69,8 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ["id", "username", "password"]
 
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        user.set_password(validated_data["password"])
-        user.save()
-        return user
+        # Hashes the password, once, hashing is slow on purpose.
+        return User.objects.create_user(**validated_data)
 
 
 class CategorySerializer(serializers.ModelSerializer):
@@ -44,16 +89,58 @@ class TagSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class ProfileSerializer(serializers.ModelSerializer):
+class ImageMetadataSerializer(serializers.ModelSerializer):
+    """What clients need to lay out an image before it loads."""
+
+    class Meta:
+        model = UploadedImage
+        fields = [
+            "width",
+            "height",
+            "format",
+            "file_size",
+            "dominant_color",
+            "placeholder",
+        ]
+
+
+class PublicProfileSerializer(serializers.ModelSerializer):
+    """The fields of a profile which are the same for every viewer."""
+
     articles_count = serializers.ReadOnlyField()
     subscribers_count = serializers.ReadOnlyField()
     avatar_url = serializers.ImageField(
         source="avatar.image",
         read_only=True,
     )
+    avatar_metadata = ImageMetadataSerializer(
+        source="avatar",
+        read_only=True,
+        allow_null=True,
+    )
     total_articles_rating = serializers.ReadOnlyField()
     date_joined = serializers.ReadOnlyField(source="user.date_joined")
     is_staff = serializers.ReadOnlyField(source="user.is_staff")
+
+    class Meta:
+        model = Profile
+        fields = [
+            "username",
+            "public_name",
+            "avatar",
+            "avatar_url",
+            "avatar_metadata",
+            "bio",
+            "articles_count",
+            "subscribers_count",
+            "total_articles_rating",
+            "date_joined",
+            "is_staff",
+        ]
+        read_only_fields = ["username"]
+
+
+class ProfileSerializer(SparseFieldsMixin, PublicProfileSerializer):
     is_you = serializers.SerializerMethodField()
     email = serializers.SerializerMethodField()
 
@@ -74,16 +161,39 @@ class ProfileSerializer(serializers.ModelSerializer):
     def get_are_you_subscribed(self, obj) -> bool:
         request = self.context.get("request")
         if request.user.is_authenticated:
+            # Annotated for many profiles at once, see `annotate_profiles()`.
+            if hasattr(obj, "are_you_subscribed"):
+                return obj.are_you_subscribed
             return obj.subscribers.filter(user=request.user).exists()
         return False
 
-    class Meta:
-        model = Profile
+    @staticmethod
+    def get_viewer_data(request, profile_id, user_id) -> dict:
+        """
+        The viewer dependent fields, computed without the profile so they
+        can be added to a cached `PublicProfileSerializer` document.
+        """
+        is_you = request.user.is_authenticated and request.user.pk == user_id
+        return {
+            "email": (
+                request.user.email
+                if is_you and request.query_params.get("include_email")
+                else None
+            ),
+            "is_you": is_you,
+            "are_you_subscribed": request.user.is_authenticated
+            and ProfileSubscription.objects.filter(
+                user=request.user, profile_id=profile_id
+            ).exists(),
+        }
+
+    class Meta(PublicProfileSerializer.Meta):
         fields = [
             "username",
             "public_name",
             "avatar",
             "avatar_url",
+            "avatar_metadata",
             "bio",
             "email",
             "articles_count",
@@ -94,10 +204,9 @@ class ProfileSerializer(serializers.ModelSerializer):
             "is_you",
             "are_you_subscribed",
         ]
-        read_only_fields = ["username"]
 
 
-class ArticleSerializer(serializers.ModelSerializer):
+class ArticleSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     rating = serializers.IntegerField(read_only=True)
     ratings_count = serializers.ReadOnlyField()
     tags = serializers.SlugRelatedField(
@@ -111,6 +220,11 @@ class ArticleSerializer(serializers.ModelSerializer):
         allow_null=True,
         required=False,
     )
+    cover_metadata = ImageMetadataSerializer(
+        source="cover",
+        read_only=True,
+        allow_null=True,
+    )
     # author_username = serializers.ReadOnlyField(source="author.username")
     # author_avatar_url = serializers.ImageField(
     #     source="author.profile.avatar.image",
@@ -139,6 +253,14 @@ class ArticleSerializer(serializers.ModelSerializer):
     def get_your_rate(self, obj) -> bool | None:
         user = self.context.get("request").user
         if user.is_authenticated:
+            rate_buffer = get_rate_buffer()
+            if rate_buffer is not None:
+                pending, rate = rate_buffer.get_rate(user.id, obj.id)
+                if pending:
+                    return rate
+            # Annotated for many articles at once, see `ArticleViewSet`.
+            if hasattr(obj, "your_rate"):
+                return obj.your_rate
             rate = obj.article_rates.filter(user=user).first()
             if rate:
                 return rate.is_positive
@@ -155,20 +277,44 @@ class ArticleSerializer(serializers.ModelSerializer):
     def get_is_your_bookmark(self, obj) -> bool | None:
         user = self.context.get("request").user
         if user.is_authenticated:
+            if hasattr(obj, "is_your_bookmark"):
+                return obj.is_your_bookmark
             return obj.favors.filter(user=user).exists()
         return None
 
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        rate_buffer = get_rate_buffer()
+        if rate_buffer is not None:
+            # Merge the rates not yet written to the database.
+            delta = rate_buffer.get_ratings_delta(instance.id)
+            if "rating" in data:
+                data["rating"] = (data["rating"] or 0) + (
+                    delta["positive"] - delta["negative"]
+                )
+            if "ratings_count" in data:
+                data["ratings_count"] = {
+                    key: data["ratings_count"][key] + delta[key]
+                    for key in ("positive", "negative")
+                }
+        if "views" in data:
+            data["views"] += get_view_counter().get_pending(instance.id)
+        return data
+
     class Meta:
         model = Article
-        fields = "__all__"
+        # Internal to the deletion and the rendering.
+        exclude = ["deleted_at", "renderer_version"]
         read_only_fields = [
             "author",
+            "excerpt",
             "created_at",
             "updated_at",
         ]
+        list_expandable_fields = ["content", "rendered_content"]
 
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     rating = serializers.IntegerField(read_only=True)
     ratings_count = serializers.ReadOnlyField()
     # author_username = serializers.ReadOnlyField(source="author.username")
@@ -226,6 +372,8 @@ class UploadedImageSerializer(serializers.ModelSerializer):
         read_only_fields = [
             "user",
             "uploaded_at",
+            *ImageMetadataSerializer.Meta.fields,
+            "processed_at",
         ]
 
 
@@ -247,3 +395,72 @@ class UserTokenSerializer(serializers.Serializer):
 class UsernamePasswordSerializer(serializers.Serializer):
     username = serializers.CharField()
     password = serializers.CharField()
+
+
+class ProvisionedUserSerializer(serializers.Serializer):
+    username = serializers.CharField(
+        max_length=150,
+        validators=[UnicodeUsernameValidator()],
+    )
+    password = serializers.CharField(required=False, write_only=True)
+    password_hash = serializers.CharField(
+        required=False,
+        write_only=True,
+        help_text="Hash in a format of the `PASSWORD_HASHERS`, for migrations.",
+    )
+    email = serializers.EmailField(required=False, allow_blank=True)
+    first_name = serializers.CharField(
+        required=False, allow_blank=True, max_length=150
+    )
+    last_name = serializers.CharField(
+        required=False, allow_blank=True, max_length=150
+    )
+
+    def validate_password_hash(self, value):
+        try:
+            identify_hasher(value)
+        except ValueError:
+            raise serializers.ValidationError("Unknown password hash format.")
+        return value
+
+    def validate(self, attrs):
+        if "password" in attrs and "password_hash" in attrs:
+            raise serializers.ValidationError(
+                "Set either a password or a password hash."
+            )
+        return attrs
+
+
+class ProvisioningResultSerializer(serializers.Serializer):
+    created = serializers.IntegerField()
+    skipped = serializers.ListField(
+        child=serializers.CharField(),
+        help_text="Usernames already taken.",
+    )
+
+
+class BatchArticleSerializer(serializers.Serializer):
+    key = serializers.CharField()
+    found = serializers.BooleanField()
+    data = ArticleSerializer(allow_null=True)
+
+
+class BatchProfileSerializer(serializers.Serializer):
+    key = serializers.CharField()
+    found = serializers.BooleanField()
+    data = ProfileSerializer(allow_null=True)
+
+
+class TagSuggestionSerializer(serializers.Serializer):
+    name = serializers.CharField(source="label")
+    articles_count = serializers.IntegerField(source="weight")
+
+
+class ArticleSuggestionSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    title = serializers.CharField(source="label")
+
+
+class ProfileSuggestionSerializer(serializers.Serializer):
+    username = serializers.CharField(source="label")
+    subscribers_count = serializers.IntegerField(source="weight")
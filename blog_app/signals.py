@@ -1,8 +1,26 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
 from django.db.models import signals
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 
-from blog_app.models import Profile
+from blog_app.autocomplete import reload_entries
+from blog_app.caching import bump_version
+from blog_app.images import process_image
+from blog_app.jobs import enqueue
+from blog_app.models import (
+    Article,
+    ArticleRate,
+    Profile,
+    ProfileSubscription,
+    RelatedArticle,
+    Tag,
+    UploadedImage,
+    row_upserted,
+    rows_upserted,
+)
+from blog_app.related import schedule_refresh
+from blog_app.slow_queries import install as install_slow_query_log
 
 
 @receiver(signals.post_save, sender=User)
@@ -12,3 +30,170 @@ def create_user_profile(sender, instance, created, **kwargs):
             user=instance,
             username=instance.username,
         )
+
+
+def invalidate_article(article_id, author_id=None):
+    if author_id is None:
+        author_id = (
+            Article._base_manager.filter(pk=article_id)
+            .values_list("author_id", flat=True)
+            .first()
+        )
+    bump_version("article", article_id)
+    if author_id is not None:
+        bump_version("author", author_id)
+
+
+def invalidate_profile(profile_id):
+    user_id = (
+        Profile.objects.filter(pk=profile_id).values_list("user_id", flat=True).first()
+    )
+    if user_id is not None:
+        bump_version("author", user_id)
+
+
+@receiver(signals.post_save, sender=Article)
+@receiver(signals.post_delete, sender=Article)
+def article_changed(sender, instance, **kwargs):
+    invalidate_article(instance.pk, instance.author_id)
+
+
+@receiver(signals.m2m_changed, sender=Article.tags.through)
+def article_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith("post_"):
+        return
+    if reverse:
+        for article_id in pk_set or ():
+            bump_version("article", article_id)
+            schedule_refresh(article_id)
+    else:
+        bump_version("article", instance.pk)
+        schedule_refresh(instance.pk)
+
+
+@receiver(signals.post_save, sender=Article)
+def article_saved(sender, instance, created, update_fields, raw, **kwargs):
+    # Tag changes are handled by `article_tags_changed`.
+    if raw:
+        return
+    if created or update_fields is None or "category" in update_fields:
+        schedule_refresh(instance.pk)
+
+
+@receiver(signals.pre_delete, sender=Article)
+def article_deleted(sender, instance, **kwargs):
+    # Their lists lose the article with the cascade, fill them up again.
+    for article_id in RelatedArticle.objects.filter(related=instance).values_list(
+        "article_id", flat=True
+    ):
+        schedule_refresh(article_id)
+
+
+@receiver(signals.post_save, sender=ArticleRate)
+@receiver(signals.post_delete, sender=ArticleRate)
+def article_rate_changed(sender, instance, **kwargs):
+    invalidate_article(instance.article_id)
+
+
+@receiver(signals.post_save, sender=Profile)
+def profile_changed(sender, instance, **kwargs):
+    bump_version("author", instance.user_id)
+
+
+@receiver(signals.post_save, sender=User)
+def user_changed(sender, instance, **kwargs):
+    bump_version("author", instance.pk)
+
+
+@receiver(signals.post_save, sender=ProfileSubscription)
+@receiver(signals.post_delete, sender=ProfileSubscription)
+def subscription_changed(sender, instance, **kwargs):
+    invalidate_profile(instance.profile_id)
+
+
+@receiver(row_upserted, sender=ArticleRate)
+def article_rate_upserted(sender, values, **kwargs):
+    article = values.get("article", values.get("article_id"))
+    invalidate_article(getattr(article, "pk", article))
+
+
+@receiver(rows_upserted, sender=ArticleRate)
+def article_rates_upserted(sender, rows, **kwargs):
+    authors = dict(
+        Article._base_manager.filter(
+            pk__in={row["article_id"] for row in rows}
+        ).values_list("pk", "author_id")
+    )
+    # Published at once on commit, see `blog_app.invalidation`.
+    with transaction.atomic():
+        for article_id in authors:
+            bump_version("article", article_id)
+        for author_id in set(authors.values()):
+            bump_version("author", author_id)
+
+
+@receiver(row_upserted, sender=ProfileSubscription)
+def subscription_upserted(sender, values, **kwargs):
+    profile = values["profile"]
+    bump_version("author", profile.user_id)
+
+
+@receiver(signals.post_save, sender=Article)
+@receiver(signals.post_delete, sender=Article)
+def article_title_changed(sender, instance, **kwargs):
+    reload_entries("titles", [instance.pk])
+
+
+@receiver(signals.pre_delete, sender=Article)
+def article_tags_deleted(sender, instance, **kwargs):
+    # The cascade doesn't send `m2m_changed`.
+    reload_entries("tags", instance.tags.values_list("name", flat=True))
+
+
+@receiver(signals.m2m_changed, sender=Article.tags.through)
+def tag_articles_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and not reverse:
+        # `pk_set` is `None` for clears, reload the tags about to be removed.
+        reload_entries("tags", instance.tags.values_list("name", flat=True))
+    elif action.startswith("post_"):
+        reload_entries("tags", [instance.pk] if reverse else pk_set or ())
+
+
+@receiver(signals.post_save, sender=Tag)
+@receiver(signals.post_delete, sender=Tag)
+def tag_changed(sender, instance, **kwargs):
+    reload_entries("tags", [instance.pk])
+
+
+@receiver(signals.post_save, sender=Profile)
+@receiver(signals.post_delete, sender=Profile)
+def profile_username_changed(sender, instance, **kwargs):
+    reload_entries("usernames", [instance.pk])
+
+
+@receiver(signals.post_save, sender=ProfileSubscription)
+@receiver(signals.post_delete, sender=ProfileSubscription)
+def profile_subscribers_changed(sender, instance, **kwargs):
+    reload_entries("usernames", [instance.profile_id])
+
+
+@receiver(row_upserted, sender=ProfileSubscription)
+def profile_subscribers_upserted(sender, values, **kwargs):
+    reload_entries("usernames", [values["profile"].pk])
+
+
+@receiver(signals.post_save, sender=UploadedImage)
+def image_uploaded(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        # Decoding the image takes too long for the upload's request.
+        enqueue(
+            process_image,
+            instance.pk,
+            dedup_key=f"process_image:{instance.pk}",
+            always_queue=True,
+        )
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_slow_query_log(connection)
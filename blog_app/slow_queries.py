@@ -0,0 +1,185 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+import traceback
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+# Written a JSON document per line, see `get_log()`.
+slow_query_log = logging.getLogger("blog_app.slow_queries")
+
+# The view running the queries of the current request, see
+# `SlowQueryMiddleware`.
+current_view = ContextVar("current_view", default="")
+# Set while explaining, the EXPLAIN goes through the wrapper too.
+_explaining = ContextVar("explaining", default=False)
+
+EXPLAIN_PREFIX = {"sqlite": "EXPLAIN QUERY PLAN ", "postgresql": "EXPLAIN "}
+EXPLAINABLE = re.compile(r"\s*(SELECT|WITH)\b", re.IGNORECASE)
+
+# Frames of the instrumentation, left out of the stacks.
+IGNORED_FILES = {__file__, str(Path(__file__).with_name("metrics.py"))}
+
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LIST = re.compile(r"\bIN \((?:\s*(?:%s|\?)\s*,)*\s*(?:%s|\?)\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(sql) -> str:
+    """The statement without its values, the same for every call site."""
+    sql = _LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    return _SPACES.sub(" ", sql).strip()
+
+
+def get_fingerprint(statement) -> str:
+    return hashlib.sha1(statement.encode()).hexdigest()[:12]
+
+
+_log_lock = threading.Lock()
+
+
+def get_log() -> logging.Logger:
+    """
+    Return the slow query log, writing to a log per process rotated in
+    `SLOW_QUERY_LOG_DIR`, as processes can't share a rotating log.
+    """
+    if not slow_query_log.handlers:
+        with _log_lock:
+            if not slow_query_log.handlers:
+                directory = Path(settings.SLOW_QUERY_LOG_DIR)
+                directory.mkdir(parents=True, exist_ok=True)
+                handler = RotatingFileHandler(
+                    directory / f"slow-queries-{os.getpid()}.jsonl",
+                    maxBytes=settings.SLOW_QUERY_LOG_MAX_BYTES,
+                    backupCount=settings.SLOW_QUERY_LOG_BACKUPS,
+                    encoding="utf-8",
+                )
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                slow_query_log.addHandler(handler)
+                slow_query_log.setLevel(logging.INFO)
+                slow_query_log.propagate = False
+    return slow_query_log
+
+
+def get_stack_summary() -> list[str]:
+    """The innermost frames of the project code, where the query comes from."""
+    base_dir = str(settings.BASE_DIR) + os.sep
+    frames = [
+        f"{frame.filename[len(base_dir):]}:{frame.lineno} in {frame.name}"
+        for frame in traceback.extract_stack()
+        if frame.filename.startswith(base_dir)
+        and "site-packages" not in frame.filename
+        and frame.filename not in IGNORED_FILES
+    ]
+    return frames[-settings.SLOW_QUERY_STACK_DEPTH :]
+
+
+def explain(connection, sql, params) -> str | None:
+    prefix = EXPLAIN_PREFIX.get(connection.vendor)
+    if prefix is None or not EXPLAINABLE.match(sql):
+        return None
+    token = _explaining.set(True)
+    try:
+        # In a savepoint, a failed statement would abort the transaction.
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(prefix + sql, params)
+            # The detail is the last column with both databases.
+            return "\n".join(str(row[-1]) for row in cursor.fetchall())
+    except Exception as error:
+        return f"EXPLAIN failed: {error!r}"
+    finally:
+        _explaining.reset(token)
+
+
+class SlowQueryWrapper:
+    """
+    Execute wrapper of the database connections, logging the queries taking
+    more than `SLOW_QUERY_THRESHOLD` seconds with the view and the code
+    running them. Their plan is logged the first time a process sees them,
+    then for `SLOW_QUERY_EXPLAIN_RATE` of them.
+    """
+
+    # Fingerprints explained by this process, kept up to this many.
+    max_explained = 10_000
+
+    def __init__(self):
+        self.explained = set()
+
+    def __call__(self, execute, sql, params, many, context):
+        if _explaining.get():
+            return execute(sql, params, many, context)
+        started = time.perf_counter()
+        result = execute(sql, params, many, context)
+        duration = time.perf_counter() - started
+        if duration >= settings.SLOW_QUERY_THRESHOLD:
+            try:
+                self.log(sql, params, many, context["connection"], duration)
+            except Exception:
+                logging.getLogger(__name__).exception("Failed to log a slow query")
+        return result
+
+    def log(self, sql, params, many, connection, duration):
+        statement = normalize(sql)
+        fingerprint = get_fingerprint(statement)
+        plan = None
+        if not many and (
+            fingerprint not in self.explained
+            or random.random() < settings.SLOW_QUERY_EXPLAIN_RATE
+        ):
+            if len(self.explained) >= self.max_explained:
+                self.explained.clear()
+            self.explained.add(fingerprint)
+            plan = explain(connection, sql, params)
+        get_log().info(
+            json.dumps(
+                {
+                    "at": timezone.now().isoformat(),
+                    "duration": round(duration, 6),
+                    "fingerprint": fingerprint,
+                    "statement": statement,
+                    "database": connection.alias,
+                    "view": current_view.get(),
+                    "stack": get_stack_summary(),
+                    "plan": plan,
+                }
+            )
+        )
+
+
+_wrapper = SlowQueryWrapper()
+
+
+def install(connection):
+    """Log the slow queries of `connection`, unless `SLOW_QUERY_THRESHOLD` is None."""
+    if settings.SLOW_QUERY_THRESHOLD is not None and _wrapper not in (
+        connection.execute_wrappers
+    ):
+        connection.execute_wrappers.append(_wrapper)
+
+
+class SlowQueryMiddleware:
+    """Names the view of the slow queries of requests, by method and URL name."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = current_view.set(f"{request.method} {request.path}")
+        try:
+            return self.get_response(request)
+        finally:
+            current_view.reset(token)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_view.set(f"{request.method} {request.resolver_match.view_name}")
@@ -1,3 +1,1471 @@
-from django.test import TestCase
+import gzip
+import json
+import tempfile
+import threading
+import zlib
+from collections import Counter
+from datetime import timedelta
+from io import BytesIO, StringIO
+from multiprocessing import shared_memory
+from pathlib import Path
+from unittest import mock
+from uuid import uuid4
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import ExifTags, Image
+from rest_framework.authtoken.models import Token
+
+from blog_app.models import (
+    Article,
+    ArticleFavorite,
+    ArticleRate,
+    Comment,
+    CommentRate,
+    Deletion,
+    Invalidation,
+    Job,
+    ProfileSubscription,
+    RelatedArticle,
+    SimilarArticle,
+    Tag,
+    UploadedFile,
+    UploadedImage,
+)
+from blog_app.autocomplete import PrefixIndex, _indexes, title_keys
+from blog_app.caching import bump_version
+from blog_app.compression import negotiate_encoding
+from blog_app.images import analyze_image
+from blog_app.invalidation import Transport, batched_publishes, get_transport
+from blog_app.jobs import claim_job, enqueue, job_counts, run_job
+from blog_app.related import refresh_related
+from blog_app.rendering import HTMLRenderer
+from blog_app.slow_queries import _wrapper, get_fingerprint, normalize, slow_query_log
+from blog_app.throttling import TokenBuckets, _buckets, shed_counts
+from blog_app.uploads_gc import collect_uploads
+from blog_app.view_counter import SharedCounters, ViewCounter
+from blog_app.write_behind import RateBuffer
+
+
+def create_user(username) -> User:
+    # Token authenticated, hashing passwords would only slow the tests.
+    return User.objects.create(username=username)
+
+
+calls = []
+
+
+def failing_job(value):
+    calls.append(value)
+    raise ValueError(value)
+
+
+class PublishOnlyTransport(Transport):
+    def publish(self, messages):
+        pass
+
+
+def reset():
+    # Cached responses and throttling buckets outlive the tests.
+    cache.clear()
+    _buckets.buckets.clear()
+
+
+def auth(user) -> dict:
+    token, _ = Token.objects.get_or_create(user=user)
+    return {"HTTP_AUTHORIZATION": f"Token {token.key}"}
+
+
+class BatchRetrieveTests(TestCase):
+    def setUp(self):
+        reset()
+        self.reader = create_user("reader")
+        self.articles = []
+        for index in range(20):
+            author = create_user(f"author{index}")
+            self.articles.append(
+                Article.objects.create(
+                    author=author, title=f"Title {index}", content="Content"
+                )
+            )
+        ArticleRate.objects.create(
+            user=self.reader, article=self.articles[0], is_positive=True
+        )
+        ArticleRate.objects.create(
+            user=self.articles[1].author, article=self.articles[0], is_positive=False
+        )
+        ArticleFavorite.objects.create(user=self.reader, article=self.articles[0])
+        ProfileSubscription.objects.create(
+            user=self.reader, profile=self.articles[0].author.profile
+        )
+
+    def get_batch(self, articles):
+        ids = ",".join(str(article.pk) for article in articles)
+        headers = auth(self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(f"/api/articles/batch/?ids={ids}", **headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_queries_dont_grow_with_the_batch(self):
+        _, one = self.get_batch(self.articles[:1])
+        _, many = self.get_batch(self.articles)
+        self.assertEqual(one, many)
+
+    def test_viewer_fields_and_counts(self):
+        missing = Article(pk=self.articles[-1].pk + 1000)
+        results, _ = self.get_batch([self.articles[1], self.articles[0], missing])
+        self.assertEqual(
+            [(result["key"], result["found"]) for result in results],
+            [
+                (str(self.articles[1].pk), True),
+                (str(self.articles[0].pk), True),
+                (str(missing.pk), False),
+            ],
+        )
+        rated, unrated = results[1]["data"], results[0]["data"]
+        self.assertEqual(rated["rating"], 0)
+        self.assertEqual(rated["ratings_count"], {"positive": 1, "negative": 1})
+        self.assertIs(rated["your_rate"], True)
+        self.assertIs(rated["is_your_bookmark"], True)
+        self.assertEqual(rated["author_details"]["articles_count"], 1)
+        self.assertEqual(rated["author_details"]["subscribers_count"], 1)
+        self.assertEqual(rated["author_details"]["total_articles_rating"], 0)
+        self.assertIs(rated["author_details"]["are_you_subscribed"], True)
+        self.assertIsNone(unrated["your_rate"])
+        self.assertIs(unrated["is_your_bookmark"], False)
+        self.assertEqual(unrated["ratings_count"], {"positive": 0, "negative": 0})
+        self.assertIs(unrated["author_details"]["are_you_subscribed"], False)
+
+    def test_profile_queries_dont_grow_with_the_batch(self):
+        headers = auth(self.reader)
+        counts = []
+        for articles in (self.articles[:1], self.articles):
+            usernames = ",".join(article.author.username for article in articles)
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    f"/api/profiles/batch/?usernames={usernames}", **headers
+                )
+            self.assertEqual(response.status_code, 200)
+            counts.append(len(queries))
+        self.assertEqual(counts[0], counts[1])
+        data = response.json()[0]["data"]
+        self.assertEqual(data["articles_count"], 1)
+        self.assertEqual(data["subscribers_count"], 1)
+        self.assertIs(data["are_you_subscribed"], True)
+
+    def test_expandable_fields_are_left_out(self):
+        results, _ = self.get_batch(self.articles[:1])
+        self.assertNotIn("content", results[0]["data"])
+        RelatedArticle.objects.create(
+            article=self.articles[0], related=self.articles[1], score=1
+        )
+        url = f"/api/articles/{self.articles[0].pk}/related/"
+        response = self.client.get(url, **auth(self.reader))
+        self.assertNotIn("content", response.json()[0])
+        response = self.client.get(f"{url}?expand=content", **auth(self.reader))
+        self.assertEqual(response.json()[0]["content"], "Content")
+
+
+class ConcurrentUpsertTests(TransactionTestCase):
+    threads = 8
+    rounds = 20
+
+    def test_only_changed_rows_are_updated(self):
+        user = create_user("reader")
+        article = Article.objects.create(author=user, title="Title", content="")
+        rate = {"user": user, "article": article}
+        positive = {"is_positive": True}
+        self.assertTrue(ArticleRate.objects.upsert(**rate, defaults=positive))
+        self.assertFalse(ArticleRate.objects.upsert(**rate, defaults=positive))
+        self.assertTrue(
+            ArticleRate.objects.upsert(**rate, defaults={"is_positive": False})
+        )
+        self.assertTrue(ArticleFavorite.objects.upsert(**rate))
+        self.assertFalse(ArticleFavorite.objects.upsert(**rate))
+
+    def test_one_row_per_user_and_article(self):
+        author = create_user("author")
+        article = Article.objects.create(author=author, title="Title", content="")
+        users = [create_user(f"reader{index}") for index in range(2)]
+        barrier = threading.Barrier(self.threads)
+        errors = []
+
+        def run(index):
+            user = users[index % len(users)]
+            try:
+                barrier.wait()
+                for round in range(self.rounds):
+                    ArticleRate.objects.upsert(
+                        user=user,
+                        article=article,
+                        defaults={"is_positive": index % 2 == 0},
+                    )
+                    ArticleFavorite.objects.upsert(user=user, article=article)
+                    ProfileSubscription.objects.upsert(
+                        user=user, profile=author.profile
+                    )
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=run, args=(index,))
+            for index in range(self.threads)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        for user in users:
+            self.assertEqual(
+                ArticleRate.objects.filter(user=user, article=article).count(), 1
+            )
+            self.assertEqual(
+                ArticleFavorite.objects.filter(user=user, article=article).count(), 1
+            )
+            self.assertEqual(
+                ProfileSubscription.objects.filter(
+                    user=user, profile=author.profile
+                ).count(),
+                1,
+            )
+        # Threads of the first user rate up, those of the second rate down.
+        self.assertEqual(
+            Article.objects.get(pk=article.pk).ratings_count,
+            {"positive": 1, "negative": 1},
+        )
+        self.assertEqual(author.profile.subscribers_count, len(users))
+
+
+class RateBufferTests(TestCase):
+    def setUp(self):
+        self.author = create_user("author")
+        self.articles = [
+            Article.objects.create(author=self.author, title="Title", content="")
+            for _ in range(2)
+        ]
+        self.readers = [create_user(f"reader{index}") for index in range(3)]
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        # Flushed by the tests only.
+        self.buffer = RateBuffer(log_dir.name, flush_interval=3600)
+        self.buffer.start()
+        self.addCleanup(self.buffer.stop)
+
+    def test_flush_writes_the_last_rates(self):
+        first, second = self.articles
+        ArticleRate.objects.create(
+            user=self.readers[2], article=first, is_positive=True
+        )
+        self.buffer.add(self.readers[0].pk, first.pk, True)
+        self.buffer.add(self.readers[1].pk, first.pk, True)
+        self.buffer.add(self.readers[1].pk, first.pk, False)
+        self.buffer.add(self.readers[2].pk, first.pk, None)
+        self.buffer.add(self.readers[0].pk, second.pk, False)
+        self.assertEqual(
+            self.buffer.get_ratings_delta(first.pk), {"positive": 0, "negative": 1}
+        )
+        self.assertEqual(
+            self.buffer.get_rate(self.readers[1].pk, first.pk), (True, False)
+        )
+
+        self.buffer.flush()
+
+        self.assertEqual(
+            set(ArticleRate.objects.values_list("user", "article", "is_positive")),
+            {
+                (self.readers[0].pk, first.pk, True),
+                (self.readers[1].pk, first.pk, False),
+                (self.readers[0].pk, second.pk, False),
+            },
+        )
+        self.assertEqual(
+            self.buffer.get_rate(self.readers[1].pk, first.pk), (False, None)
+        )
+
+    def test_failed_flush_keeps_the_rates_pending(self):
+        first, second = self.articles
+        self.buffer.add(self.readers[0].pk, first.pk, True)
+        self.buffer.add(self.readers[1].pk, second.pk, False)
+        with mock.patch.object(self.buffer, "_apply", side_effect=RuntimeError):
+            with self.assertLogs("blog_app.write_behind", "ERROR"):
+                self.buffer.flush()
+        self.assertEqual(
+            self.buffer.get_ratings_delta(first.pk), {"positive": 1, "negative": 0}
+        )
+        self.assertEqual(
+            self.buffer.get_ratings_delta(second.pk), {"positive": 0, "negative": 1}
+        )
+        self.buffer.flush()
+        self.assertEqual(ArticleRate.objects.count(), 2)
+        self.assertEqual(
+            self.buffer.get_ratings_delta(first.pk), {"positive": 0, "negative": 0}
+        )
+
+    def test_flush_invalidates_each_article_and_author_once(self):
+        for reader in self.readers:
+            for article in self.articles:
+                self.buffer.add(reader.pk, article.pk, True)
+        with mock.patch("blog_app.signals.bump_version") as bump_version:
+            self.buffer.flush()
+        self.assertEqual(
+            Counter(call.args for call in bump_version.call_args_list),
+            {
+                ("article", self.articles[0].pk): 1,
+                ("article", self.articles[1].pk): 1,
+                ("author", self.author.pk): 1,
+            },
+        )
+
+
+class RenderingTests(TestCase):
+    content = (
+        '<h2>Intro</h2><p onclick="x">Hello <script>alert(1)</script>'
+        '<a href="javascript:alert(1)">the</a> <a href="/a" rel="x">world</a></p>'
+        "<h2>Intro</h2>"
+    )
+
+    def test_content_is_sanitized_and_outlined(self):
+        rendered = HTMLRenderer().render(self.content)
+        self.assertEqual(
+            rendered.html,
+            '<h2 id="intro">Intro</h2><p>Hello <a>the</a> <a href="/a">world</a></p>'
+            '<h2 id="intro-2">Intro</h2>',
+        )
+        self.assertEqual(
+            rendered.outline,
+            [
+                {"level": 2, "title": "Intro", "id": "intro"},
+                {"level": 2, "title": "Intro", "id": "intro-2"},
+            ],
+        )
+        self.assertEqual(rendered.excerpt, "Intro Hello the world Intro")
+        self.assertEqual(rendered.word_count, 5)
+        self.assertEqual(rendered.reading_time, 1)
+        self.assertEqual(HTMLRenderer().render("word " * 401).reading_time, 3)
+
+    def test_saved_articles_are_rendered(self):
+        author = create_user("author")
+        article = Article.objects.create(
+            author=author, title="Title", content=self.content
+        )
+        self.assertEqual(article.excerpt, "Intro Hello the world Intro")
+        self.assertEqual(article.renderer_version, HTMLRenderer.version)
+        article.content = "<p>Changed</p>"
+        article.save(update_fields=["content"])
+        article.refresh_from_db()
+        self.assertEqual(article.rendered_content, "<p>Changed</p>")
+        self.assertEqual(article.outline, [])
+
+    def test_outdated_articles_are_rebuilt(self):
+        author = create_user("author")
+        articles = [
+            Article.objects.create(author=author, title="Title", content=self.content)
+            for _ in range(3)
+        ]
+        Article._base_manager.update(
+            excerpt="", rendered_content="", outline=[], renderer_version=""
+        )
+        for workers in (0, 1):
+            Article._base_manager.filter(pk=articles[0].pk).update(renderer_version="")
+            call_command(
+                "rebuild_article_content",
+                workers=workers,
+                batch_size=2,
+                stdout=StringIO(),
+            )
+        for article in Article._base_manager.all():
+            self.assertEqual(article.renderer_version, HTMLRenderer.version)
+            self.assertEqual(article.excerpt, "Intro Hello the world Intro")
+            self.assertEqual(len(article.outline), 2)
+
+
+class CompressionTests(TestCase):
+    def setUp(self):
+        reset()
+        self.author = create_user("author")
+        self.article = Article.objects.create(
+            author=self.author, title="Title", content="<p>Word</p>" * 300
+        )
+        self.url = f"/api/articles/{self.article.pk}/"
+
+    def test_encoding_is_negotiated(self):
+        factory = RequestFactory()
+        for header, encoding in (
+            ("", None),
+            ("br", None),
+            ("gzip, deflate", "gzip"),
+            ("gzip;q=0.5, deflate", "deflate"),
+            ("gzip;q=0, *", "deflate"),
+            ("identity, gzip;q=0", None),
+        ):
+            request = factory.get("/", HTTP_ACCEPT_ENCODING=header)
+            self.assertEqual(negotiate_encoding(request), encoding, header)
+
+    def test_large_responses_are_compressed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertIn("Accept-Encoding", response["Vary"])
+        self.assertEqual(int(response["Content-Length"]), len(response.content))
+        data = json.loads(gzip.decompress(response.content))
+        self.assertEqual(data["title"], "Title")
+        response = self.client.get(self.url)
+        self.assertFalse(response.has_header("Content-Encoding"))
+        self.assertEqual(response.json()["title"], "Title")
+
+    def test_small_responses_are_sent_as_they_are(self):
+        response = self.client.get("/api/tags/", HTTP_ACCEPT_ENCODING="gzip")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("Content-Encoding"))
+
+    def test_compressed_details_are_cached_until_changed(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="deflate")
+        compressed = response.content
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="deflate")
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response["Content-Encoding"], "deflate")
+        self.assertEqual(response.content, compressed)
+        self.article.title = "Changed"
+        self.article.save()
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="deflate")
+        data = json.loads(zlib.decompress(response.content))
+        self.assertEqual(data["title"], "Changed")
+        bump_version("author", self.author.pk)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, HTTP_ACCEPT_ENCODING="deflate")
+        self.assertGreater(len(queries), 0)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        reset()
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.article = Article.objects.create(
+            author=self.staff, title="Title", content=""
+        )
+        ArticleRate.objects.create(
+            user=self.staff, article=self.article, is_positive=True
+        )
+
+    def export(self, name, **params) -> list[dict]:
+        response = self.client.get(f"/api/export/{name}/", params, **auth(self.staff))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        return [json.loads(line) for line in response.streaming_content]
+
+    def test_exports_are_for_staff_only(self):
+        headers = auth(create_user("user"))
+        response = self.client.get("/api/export/articles/", **headers)
+        self.assertEqual(response.status_code, 403)
+
+    def test_rows_changed_since(self):
+        self.assertEqual(
+            [row["id"] for row in self.export("articles")], [self.article.pk]
+        )
+        later = timezone.now() + timedelta(minutes=1)
+        self.assertEqual(self.export("articles", since=later.isoformat()), [])
+        self.assertEqual(
+            [row["article_id"] for row in self.export("article_rates")],
+            [self.article.pk],
+        )
+
+
+class ImportTests(TransactionTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        self.write(
+            "users.ndjson",
+            [{"id": 1, "username": "author", "date_joined": "2020-01-01T00:00:00Z"}],
+        )
+        with open(f"{self.directory}/tags.csv", "w", encoding="utf-8") as file:
+            file.write("name\npython\ndjango\n")
+        self.write(
+            "articles.ndjson",
+            [
+                {
+                    "id": 1,
+                    "author_id": 1,
+                    "title": "Title",
+                    "content": "<p>Imported content</p>",
+                    "tags": ["python", "django"],
+                    "created_at": "2020-01-02T00:00:00Z",
+                    "updated_at": "2020-01-03T00:00:00Z",
+                },
+                {"id": 2, "author_id": 1, "title": "New", "content": ""},
+            ],
+        )
+
+    def write(self, name, rows):
+        with open(f"{self.directory}/{name}", "w", encoding="utf-8") as file:
+            for row in rows:
+                file.write(json.dumps(row) + "\n")
+
+    def test_rows_are_imported_with_their_timestamps(self):
+        started = timezone.now()
+        call_command("import_blog_data", self.directory, stdout=StringIO())
+        article = Article.objects.get(pk=1)
+        self.assertEqual(article.created_at.isoformat(), "2020-01-02T00:00:00+00:00")
+        self.assertEqual(article.updated_at.isoformat(), "2020-01-03T00:00:00+00:00")
+        self.assertGreaterEqual(Article.objects.get(pk=2).created_at, started)
+        self.assertEqual(
+            sorted(article.tags.values_list("name", flat=True)), ["django", "python"]
+        )
+        self.assertEqual(article.excerpt, "Imported content")
+        self.assertEqual(User.objects.get(pk=1).profile.username, "author")
+        # The fields of the models are left alone.
+        self.assertTrue(Article._meta.get_field("created_at").auto_now_add)
+
+    def test_existing_rows_keep_their_timestamps(self):
+        call_command("import_blog_data", self.directory, stdout=StringIO())
+        self.write(
+            "articles.ndjson",
+            [{"id": 1, "author_id": 1, "title": "Title", "created_at": "2021-01-01"}],
+        )
+        call_command(
+            "import_blog_data",
+            self.directory,
+            ignore_conflicts=True,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Article.objects.get(pk=1).created_at.year, 2020)
+
+
+class PrebuiltSchemaTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+        patcher = override_settings(SCHEMA_DIR=self.directory)
+        patcher.enable()
+        self.addCleanup(patcher.disable)
+        self.version = "first"
+        patcher = mock.patch(
+            "blog_app.schema.get_code_version", side_effect=lambda: self.version
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_command_builds_every_format(self):
+        call_command("build_schema", stdout=StringIO())
+        self.assertEqual(
+            sorted(path.name for path in self.directory.iterdir()),
+            ["schema-first.json", "schema-first.yaml"],
+        )
+        schema = json.loads((self.directory / "schema-first.json").read_text())
+        self.assertIn("/api/articles/", schema["paths"])
+
+    def test_schema_is_served_with_its_version(self):
+        response = self.client.get("/api/schema/?format=json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"first-json"')
+        self.assertIn("/api/articles/", json.loads(response.content)["paths"])
+        response = self.client.get(
+            "/api/schema/?format=json", HTTP_IF_NONE_MATCH='"first-json"'
+        )
+        self.assertEqual(response.status_code, 304)
+
+    def test_stale_schema_is_rebuilt(self):
+        call_command("build_schema", stdout=StringIO())
+        (self.directory / "schema-first.yaml").write_text("stale")
+        self.assertEqual(self.client.get("/api/schema/").content, b"stale")
+        self.version = "second"
+        response = self.client.get("/api/schema/", HTTP_IF_NONE_MATCH='"first-yaml"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], '"second-yaml"')
+        self.assertIn(b"/api/articles/", response.content)
+        self.assertTrue((self.directory / "schema-second.yaml").exists())
+
+
+class RelatedArticlesTests(TestCase):
+    def setUp(self):
+        reset()
+        author = create_user("author")
+        for name in ("python", "django", "rust"):
+            Tag.objects.create(name=name)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first, self.second, self.third = [
+                Article.objects.create(author=author, title="Title", content="")
+                for _ in range(3)
+            ]
+            self.first.tags.set(["python", "django"])
+            self.second.tags.set(["python"])
+            self.third.tags.set(["rust"])
+        self.run_jobs()
+
+    def run_jobs(self):
+        while job := claim_job("test"):
+            self.assertEqual(job.name, "blog_app.related.refresh_related")
+            run_job(job)
+
+    def get_related(self, article) -> list[int]:
+        return list(
+            RelatedArticle.objects.filter(article=article)
+            .order_by("-score")
+            .values_list("related_id", flat=True)
+        )
+
+    def test_articles_sharing_tags_are_related(self):
+        self.assertEqual(self.get_related(self.first), [self.second.pk])
+        self.assertEqual(self.get_related(self.second), [self.first.pk])
+        self.assertEqual(self.get_related(self.third), [])
+
+    def test_related_lists_follow_tag_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.third.tags.set(["python", "django"])
+        self.assertEqual(Job.objects.count(), 1)
+        self.run_jobs()
+        # Sharing the rarer "django" scores more than sharing "python".
+        self.assertEqual(self.get_related(self.first), [self.third.pk, self.second.pk])
+        # Ties go to the latest article.
+        self.assertEqual(self.get_related(self.second), [self.third.pk, self.first.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.first.tags.clear()
+        self.run_jobs()
+        self.assertEqual(self.get_related(self.first), [])
+        self.assertEqual(self.get_related(self.third), [self.second.pk])
+
+    def test_tagging_from_the_tag_side_refreshes_the_article(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.get(name="rust").articles.add(self.second)
+        self.assertEqual(
+            list(Job.objects.values_list("args", flat=True)), [[self.second.pk]]
+        )
+        self.run_jobs()
+        self.assertEqual(self.get_related(self.third), [self.second.pk])
+
+
+class SimilarArticlesTests(TestCase):
+    def setUp(self):
+        reset()
+        self.reader = create_user("reader")
+        self.articles = [
+            Article.objects.create(author=self.reader, title="Title", content="")
+            for _ in range(3)
+        ]
+        for article in self.articles:
+            ArticleRate.objects.upsert(
+                user=self.reader, article=article, defaults={"is_positive": True}
+            )
+        call_command("build_similar_articles", stdout=StringIO())
+
+    def get_similar(self, article) -> set[int]:
+        return set(
+            SimilarArticle.objects.filter(article=article).values_list(
+                "similar_id", flat=True
+            )
+        )
+
+    def test_changed_rates_are_recomputed(self):
+        first, second, third = self.articles
+        self.assertEqual(self.get_similar(first), {second.pk, third.pk})
+        rated_at = ArticleRate.objects.get(article=second).rated_at
+        self.assertTrue(
+            ArticleRate.objects.upsert(
+                user=self.reader, article=second, defaults={"is_positive": False}
+            )
+        )
+        self.assertGreater(ArticleRate.objects.get(article=second).rated_at, rated_at)
+        call_command("build_similar_articles", stdout=StringIO())
+        self.assertEqual(self.get_similar(first), {third.pk})
+
+    def test_removed_rates_are_recomputed(self):
+        first, second, third = self.articles
+        response = self.client.delete(
+            f"/api/articles/{third.pk}/rate/", **auth(self.reader)
+        )
+        self.assertEqual(response.status_code, 200)
+        call_command("build_similar_articles", stdout=StringIO())
+        self.assertEqual(self.get_similar(first), {second.pk})
+        self.assertEqual(self.get_similar(third), set())
+
+
+class ViewCounterTests(TestCase):
+    def setUp(self):
+        reset()
+        author = create_user("author")
+        self.articles = [
+            Article.objects.create(author=author, title="Title", content="")
+            for _ in range(3)
+        ]
+
+    def get_views(self) -> list[int]:
+        return [
+            Article._base_manager.get(pk=article.pk).views for article in self.articles
+        ]
+
+    def test_repeated_views_count_once(self):
+        counter = ViewCounter(dedup_window=60)
+        first, second, _ = self.articles
+        with mock.patch("blog_app.view_counter.time.monotonic", return_value=100.0):
+            self.assertTrue(counter.add(first.pk, "ip:1"))
+            self.assertFalse(counter.add(first.pk, "ip:1"))
+            self.assertTrue(counter.add(first.pk, "user:1"))
+            self.assertTrue(counter.add(second.pk, "ip:1"))
+        with mock.patch("blog_app.view_counter.time.monotonic", return_value=160.0):
+            self.assertTrue(counter.add(first.pk, "ip:1"))
+        self.assertEqual(counter.get_pending(first.pk), 3)
+        self.assertEqual(self.get_views(), [0, 0, 0])
+        with CaptureQueriesContext(connection) as queries:
+            counter.flush()
+        # One update per distinct increment.
+        self.assertEqual(len(queries), 2)
+        self.assertEqual(self.get_views(), [3, 1, 0])
+        self.assertEqual(counter.get_pending(first.pk), 0)
+
+    def test_failed_flush_keeps_the_views_pending(self):
+        counter = ViewCounter()
+        counter.add(self.articles[0].pk, "ip:1")
+        with mock.patch.object(
+            QuerySet, "update", side_effect=DatabaseError("locked")
+        ), self.assertLogs("blog_app.view_counter", "ERROR"):
+            counter.flush()
+        counter.add(self.articles[0].pk, "ip:2")
+        self.assertEqual(counter.get_pending(self.articles[0].pk), 2)
+        counter.flush()
+        self.assertEqual(self.get_views(), [2, 0, 0])
+
+    def test_processes_add_up_their_views(self):
+        name = f"blog_app_tests_{uuid4().hex[:8]}"
+        counters = [ViewCounter(shared=SharedCounters(name, slots=2)) for _ in range(2)]
+        # Attaching registers the segment again, for `unlink()` to unregister.
+        self.addCleanup(lambda: shared_memory.SharedMemory(name=name).unlink())
+        for counter in counters:
+            for article in self.articles:
+                counter.add(article.pk, "ip:1")
+        # Views past the full table are kept by the process.
+        self.assertEqual(counters[0].get_pending(self.articles[2].pk), 1)
+        counters[0].flush()
+        self.assertEqual(self.get_views(), [2, 2, 1])
+        counters[1].flush()
+        self.assertEqual(self.get_views(), [2, 2, 2])
+
+    def test_detail_views_are_counted(self):
+        counter = ViewCounter()
+        url = f"/api/articles/{self.articles[0].pk}/"
+        with mock.patch(
+            "blog_app.views.get_view_counter", return_value=counter
+        ), mock.patch("blog_app.serializers.get_view_counter", return_value=counter):
+            self.client.get(url)
+            self.client.get(url)
+            response = self.client.get(url, **auth(self.articles[0].author))
+        # Pending views are shown, this one is counted after the response.
+        self.assertEqual(response.json()["views"], 1)
+        counter.flush()
+        self.assertEqual(self.get_views(), [2, 0, 0])
+
+
+class ThrottlingTests(TestCase):
+    def setUp(self):
+        reset()
+        self.reader = create_user("reader")
+
+    def test_token_bucket_refills(self):
+        buckets = TokenBuckets()
+        with mock.patch("blog_app.throttling.time.monotonic", return_value=100.0):
+            self.assertEqual(buckets.consume("client", 2, 1), 0)
+            self.assertEqual(buckets.consume("client", 2, 1), 0)
+            self.assertEqual(buckets.consume("client", 2, 1), 0.5)
+            self.assertEqual(buckets.consume("other", 2, 1), 0)
+        with mock.patch("blog_app.throttling.time.monotonic", return_value=100.5):
+            self.assertEqual(buckets.consume("client", 2, 1), 0)
+
+    def test_least_recently_used_buckets_are_dropped(self):
+        buckets = TokenBuckets(max_clients=2)
+        for key in ("first", "second", "first", "third"):
+            buckets.consume(key, 1, 60)
+        self.assertEqual(list(buckets.buckets), ["first", "third"])
+
+    @override_settings(
+        REST_FRAMEWORK={
+            **settings.REST_FRAMEWORK,
+            "DEFAULT_THROTTLE_RATES": {
+                **settings.REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"],
+                "search": "2/m",
+            },
+        }
+    )
+    def test_searches_are_throttled_on_their_own(self):
+        headers = auth(self.reader)
+        statuses = [
+            self.client.get("/api/articles/?search=title", **headers).status_code
+            for _ in range(3)
+        ]
+        self.assertEqual(statuses, [200, 200, 429])
+        response = self.client.get("/api/articles/?search=title", **headers)
+        self.assertEqual(int(response["Retry-After"]), 30)
+        self.assertEqual(self.client.get("/api/articles/", **headers).status_code, 200)
+        # Other clients have their own bucket.
+        response = self.client.get("/api/articles/?search=title")
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(ADMISSION_MAX_IN_FLIGHT=0, ADMISSION_MAX_QUEUE=0)
+    def test_requests_past_the_queue_are_shed(self):
+        shed = shed_counts["queue_full"]
+        response = self.client.get("/api/articles/")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], str(settings.ADMISSION_RETRY_AFTER))
+        self.assertEqual(shed_counts["queue_full"], shed + 1)
+
+
+class JobTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_jobs_are_deduplicated_and_dont_raise(self):
+        name = "blog_app.tests.failing_job"
+        failed = job_counts[name, "failed"]
+        with self.assertLogs("blog_app.jobs", "ERROR") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    enqueue(failing_job, 1, dedup_key="failing")
+                    enqueue(failing_job, 2, dedup_key="failing")
+                    enqueue(failing_job, 3)
+        self.assertEqual(calls, [1, 3])
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(job_counts[name, "failed"], failed + 2)
+
+    @override_settings(JOBS_EAGER=True)
+    def test_rolled_back_keys_dont_skip_later_jobs(self):
+        with self.assertLogs("blog_app.jobs", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        enqueue(failing_job, 1, dedup_key="failing")
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                enqueue(failing_job, 2, dedup_key="failing")
+        self.assertEqual(calls, [2])
+
+
+class ArticleJobTests(TransactionTestCase):
+    def setUp(self):
+        reset()
+        self.author = create_user("author")
+
+    def test_saving_an_article_queues_one_refresh(self):
+        response = self.client.post(
+            "/api/articles/",
+            {"title": "Title", "content": "Content", "tags": ["a", "b"]},
+            content_type="application/json",
+            **auth(self.author),
+        )
+        self.assertEqual(response.status_code, 201)
+        article_id = response.json()["id"]
+        Job.objects.all().delete()
+        with mock.patch.object(
+            Job.objects, "create", wraps=Job.objects.create
+        ) as create:
+            response = self.client.put(
+                f"/api/articles/{article_id}/",
+                {"title": "Title", "content": "Content", "tags": ["b", "c"]},
+                content_type="application/json",
+                **auth(self.author),
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(create.call_count, 1)
+        self.assertEqual(
+            list(Job.objects.values_list("name", "args")),
+            [(f"{refresh_related.__module__}.refresh_related", [article_id])],
+        )
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        reset()
+        self.owner = User.objects.create(username="owner", email="owner@example.com")
+        self.reader = create_user("reader")
+        self.url = "/api/profiles/owner/?include_email=1"
+
+    def test_viewer_fields_dont_leak_between_viewers(self):
+        response = self.client.get(self.url, **auth(self.owner))
+        self.assertEqual(response.json()["email"], "owner@example.com")
+        self.assertIs(response.json()["is_you"], True)
+        self.assertEqual(
+            set(cache.get("blog_app:profile:owner")["data"])
+            & {"email", "is_you", "are_you_subscribed"},
+            set(),
+        )
+        ProfileSubscription.objects.create(user=self.reader, profile=self.owner.profile)
+        response = self.client.get(self.url, **auth(self.reader))
+        self.assertIsNone(response.json()["email"])
+        self.assertIs(response.json()["is_you"], False)
+        self.assertIs(response.json()["are_you_subscribed"], True)
+        response = self.client.get(self.url)
+        self.assertIsNone(response.json()["email"])
+        self.assertIs(response.json()["is_you"], False)
+        self.assertIs(response.json()["are_you_subscribed"], False)
+
+    def test_public_fields_are_cached_until_changed(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(response.json()["subscribers_count"], 0)
+        response = self.client.post(
+            "/api/profiles/owner/subscribe/", **auth(self.reader)
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.url, **auth(self.reader))
+        self.assertEqual(response.json()["subscribers_count"], 1)
+        self.assertIs(response.json()["are_you_subscribed"], True)
+        self.owner.profile.bio = "Changed"
+        self.owner.profile.save()
+        self.assertEqual(self.client.get(self.url).json()["bio"], "Changed")
+
+
+class IndexAdvisorTests(TestCase):
+    def setUp(self):
+        reset()
+        author = create_user("author")
+        Article.objects.create(author=author, title="Title", content="")
+
+    def advise(self, **options) -> list[str]:
+        stdout = StringIO()
+        call_command("index_advisor", stdout=stdout, stderr=StringIO(), **options)
+        return stdout.getvalue().splitlines()
+
+    def test_list_queries_are_explained(self):
+        lines = self.advise(all=True)
+        author_id = Article.objects.get().author_id
+        index = lines.index(
+            f"GET /api/articles/?author__id={author_id}&ordering=-created_at"
+        )
+        # Served by the author and creation date index.
+        self.assertTrue(lines[index + 1].startswith("GET "))
+        index = lines.index("GET /api/articles/?ordering=-rating")
+        self.assertEqual(
+            lines[index + 1 : index + 3],
+            ["  full scan of blog_app_article", "  sort (ORDER BY)"],
+        )
+        self.assertRegex(lines[-1], r"^(\d+) of \1 queries reported$")
+
+    def test_only_queries_with_issues_are_reported(self):
+        lines = self.advise()
+        self.assertIn("GET /api/articles/?ordering=-rating", lines)
+        self.assertNotIn("GET /api/articles/?ordering=-created_at", lines)
+
+    def test_statements_are_read_from_a_file(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".sql") as file:
+            file.write(
+                "SELECT id FROM blog_app_article WHERE id = 1\n\n"
+                "SELECT id FROM blog_app_article ORDER BY title\n"
+            )
+            file.flush()
+            lines = self.advise(queries=file.name)
+        self.assertEqual(
+            lines,
+            [
+                "SELECT id FROM blog_app_article ORDER BY title",
+                "  full scan of blog_app_article",
+                "  sort (ORDER BY)",
+                "1 of 2 queries reported",
+            ],
+        )
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        reset()
+        self.addCleanup(_indexes.clear)
+        self.author = create_user("author")
+
+    def test_heaviest_matches_first(self):
+        index = PrefixIndex(size=2)
+        index.load(
+            [
+                (1, "Python", 5, None),
+                (2, "Pyramid", 7, None),
+                (3, "Perl", 9, None),
+                (4, "pytest", 1, None),
+            ]
+        )
+        self.assertEqual(index.lookup("py"), [(2, "Pyramid", 7), (1, "Python", 5)])
+        self.assertEqual(index.lookup("P", limit=1), [(3, "Perl", 9)])
+        self.assertEqual(index.lookup("pyt"), [(1, "Python", 5), (4, "pytest", 1)])
+        self.assertEqual(index.lookup("ruby"), [])
+        index.set(4, "pytest", 8)
+        self.assertEqual(index.lookup("py"), [(4, "pytest", 8), (2, "Pyramid", 7)])
+        index.remove(2)
+        self.assertEqual(index.lookup("py"), [(4, "pytest", 8), (1, "Python", 5)])
+        index.remove(4)
+        index.remove(1)
+        self.assertEqual(index.lookup("py"), [])
+        self.assertEqual(index.root.children.keys(), {"p"})
+
+    def test_keys_are_normalized_and_filtered_past_the_depth(self):
+        index = PrefixIndex(max_depth=3)
+        title = "Écrire  du Python"
+        index.set(1, title, 1, title_keys(title))
+        index.set(2, "Pythonic code", 2, title_keys("Pythonic code"))
+        self.assertEqual(index.lookup("ecr"), [(1, title, 1)])
+        self.assertEqual(index.lookup("DU PY"), [(1, title, 1)])
+        self.assertEqual([entry_id for entry_id, _, _ in index.lookup("pyth")], [2, 1])
+        self.assertEqual(index.lookup("pythonic"), [(2, "Pythonic code", 2)])
+        self.assertEqual(index.lookup("code"), [(2, "Pythonic code", 2)])
+
+    def test_endpoints_suggest_from_the_database(self):
+        Tag.objects.create(name="python")
+        Tag.objects.create(name="pytest")
+        article = Article.objects.create(
+            author=self.author, title="Learning Python", content=""
+        )
+        article.tags.set(["python"])
+        response = self.client.get("/api/tags/autocomplete/?q=PY")
+        self.assertEqual(
+            response.json(),
+            [
+                {"name": "python", "articles_count": 1},
+                {"name": "pytest", "articles_count": 0},
+            ],
+        )
+        response = self.client.get("/api/articles/autocomplete/?q=pyth")
+        self.assertEqual(
+            response.json(), [{"id": article.pk, "title": "Learning Python"}]
+        )
+        response = self.client.get("/api/profiles/autocomplete/?q=auth&limit=1")
+        self.assertEqual(
+            response.json(), [{"username": "author", "subscribers_count": 0}]
+        )
+        response = self.client.get("/api/tags/autocomplete/?q=py&limit=x")
+        self.assertEqual(response.status_code, 400)
+
+    def test_indexes_follow_changes(self):
+        Tag.objects.create(name="python")
+        self.client.get("/api/tags/autocomplete/?q=py")
+        self.client.get("/api/articles/autocomplete/?q=py")
+        with self.captureOnCommitCallbacks(execute=True):
+            article = Article.objects.create(
+                author=self.author, title="Python", content=""
+            )
+            article.tags.set(["python"])
+        response = self.client.get("/api/articles/autocomplete/?q=py")
+        self.assertEqual(response.json(), [{"id": article.pk, "title": "Python"}])
+        response = self.client.get("/api/tags/autocomplete/?q=py")
+        self.assertEqual(response.json()[0]["articles_count"], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            article.title = "Django"
+            article.save()
+        response = self.client.get("/api/articles/autocomplete/?q=py")
+        self.assertEqual(response.json(), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            article.delete()
+        response = self.client.get("/api/tags/autocomplete/?q=py")
+        self.assertEqual(response.json()[0]["articles_count"], 0)
+        response = self.client.get("/api/articles/autocomplete/?q=dj")
+        self.assertEqual(response.json(), [])
+
+
+class ProvisioningTests(TestCase):
+    def setUp(self):
+        reset()
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        # Hashed in this process, spawning workers would only slow the tests.
+        executor = mock.patch("blog_app.views.get_hash_executor", return_value=None)
+        executor.start()
+        self.addCleanup(executor.stop)
+
+    def provision(self, users, user=None):
+        return self.client.post(
+            "/api/auth/provision/",
+            users,
+            content_type="application/json",
+            **auth(user or self.staff),
+        )
+
+    def test_users_are_created_with_profile_and_token(self):
+        response = self.provision(
+            [
+                {"username": "first", "password": "secret", "email": "a@example.com"},
+                {"username": "second", "password_hash": make_password("hashed")},
+                {"username": "staff"},
+            ]
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"created": 2, "skipped": ["staff"]})
+        for username, password in (("first", "secret"), ("second", "hashed")):
+            response = self.client.post(
+                "/api/auth/login/",
+                {"username": username, "password": password},
+                content_type="application/json",
+            )
+            self.assertEqual(response.status_code, 200, username)
+        self.assertEqual(self.client.get("/api/profiles/first/").status_code, 200)
+        self.assertEqual(Token.objects.filter(user__username="first").count(), 1)
+
+    def test_large_batches_and_non_staff_are_refused(self):
+        users = [{"username": f"user{index}"} for index in range(101)]
+        self.assertEqual(self.provision(users).status_code, 400)
+        user = create_user("user")
+        self.assertEqual(self.provision(users[:1], user).status_code, 403)
+        self.assertFalse(User.objects.filter(username="user0").exists())
+
+    def test_command_creates_users_in_batches(self):
+        with tempfile.NamedTemporaryFile("w", suffix=".ndjson") as file:
+            for index in range(5):
+                file.write(json.dumps({"username": f"user{index}"}) + "\n")
+            file.write(json.dumps({"username": "not valid"}) + "\n")
+            file.flush()
+            call_command(
+                "provision_users",
+                file.name,
+                batch_size=2,
+                workers=0,
+                stdout=StringIO(),
+                stderr=StringIO(),
+            )
+        self.assertEqual(User.objects.filter(username__startswith="user").count(), 5)
+        self.assertEqual(Token.objects.count(), 5)
+
+
+class SoftDeleteTests(TestCase):
+    def setUp(self):
+        reset()
+        self.author = create_user("author")
+        self.reader = create_user("reader")
+        self.article = Article.objects.create(
+            author=self.author, title="Title", content="Content"
+        )
+        Comment.objects.create(author=self.reader, article=self.article, content="")
+        ArticleRate.objects.create(
+            user=self.reader, article=self.article, is_positive=True
+        )
+        ArticleFavorite.objects.create(user=self.reader, article=self.article)
+
+    def test_deleted_article_is_hidden_then_deleted_in_a_job(self):
+        url = f"/api/articles/{self.article.pk}/"
+        response = self.client.get(url)
+        self.assertNotIn("deleted_at", response.json())
+        self.assertNotIn("renderer_version", response.json())
+        response = self.client.delete(url, **auth(self.author))
+        self.assertEqual(response.status_code, 204)
+
+        self.assertEqual(self.client.get(url).status_code, 404)
+        self.assertEqual(self.client.get("/api/articles/").json()["count"], 0)
+        self.assertEqual(self.client.get("/api/comments/").json()["count"], 0)
+        self.assertTrue(Article._base_manager.filter(pk=self.article.pk).exists())
+
+        # Queued rather than run by the request, even when jobs are eager.
+        job = claim_job("test")
+        self.assertEqual(job.name, "blog_app.deletion.run_deletion")
+        run_job(job)
+        self.assertFalse(Article._base_manager.filter(pk=self.article.pk).exists())
+        self.assertFalse(Comment._base_manager.exists())
+        self.assertFalse(ArticleRate.objects.exists())
+        self.assertFalse(ArticleFavorite.objects.exists())
+        deletion = Deletion.objects.get()
+        self.assertIsNotNone(deletion.finished_at)
+        self.assertEqual(deletion.rows["blog_app.comment"], 1)
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_EAGER=True, DELETION_JOB_SECONDS=0)
+    def test_long_deletions_are_queued_again(self):
+        response = self.client.delete(
+            f"/api/articles/{self.article.pk}/", **auth(self.author)
+        )
+        self.assertEqual(response.status_code, 204)
+        # A batch per run, each run queues the next.
+        runs = 0
+        while job := claim_job("test"):
+            run_job(job)
+            runs += 1
+        self.assertGreater(runs, 1)
+        self.assertFalse(Article._base_manager.filter(pk=self.article.pk).exists())
+
+
+class UserDeletionTests(TestCase):
+    def setUp(self):
+        reset()
+        self.staff = User.objects.create(username="staff", is_staff=True)
+        self.user = create_user("user")
+        self.other = create_user("other")
+        own = Article.objects.create(author=self.user, title="Own", content="")
+        self.article = Article.objects.create(
+            author=self.other, title="Other", content=""
+        )
+        ArticleRate.objects.create(user=self.other, article=own, is_positive=True)
+        ArticleRate.objects.create(
+            user=self.user, article=self.article, is_positive=True
+        )
+        ArticleFavorite.objects.create(user=self.user, article=self.article)
+        self.comment = Comment.objects.create(
+            author=self.user, article=self.article, content=""
+        )
+        other_comment = Comment.objects.create(
+            author=self.other, article=self.article, content=""
+        )
+        CommentRate.objects.create(
+            user=self.user, comment=other_comment, is_positive=True
+        )
+        ProfileSubscription.objects.create(user=self.user, profile=self.other.profile)
+        ProfileSubscription.objects.create(user=self.other, profile=self.user.profile)
+        self.user_token = auth(self.user)
+
+    def export(self, name) -> list[dict]:
+        response = self.client.get(f"/api/export/{name}/", **auth(self.staff))
+        return [json.loads(line) for line in response.streaming_content]
+
+    def assert_exports_left_out_the_user(self):
+        self.assertEqual(
+            [row["id"] for row in self.export("articles")], [self.article.pk]
+        )
+        self.assertEqual(
+            [row["author_id"] for row in self.export("comments")], [self.other.pk]
+        )
+        for name in ("article_rates", "comment_rates", "favorites", "subscriptions"):
+            self.assertEqual(self.export(name), [], name)
+
+    def test_deleted_user_is_hidden_then_deleted_in_a_job(self):
+        call_command("delete_users", "user", stdout=StringIO())
+
+        response = self.client.get("/api/articles/", **self.user_token)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.get("/api/profiles/user/").status_code, 404)
+        results = self.client.get("/api/articles/").json()["results"]
+        self.assertEqual([article["id"] for article in results], [self.article.pk])
+        # The rates of the deleted articles and the rows of the user.
+        self.assert_exports_left_out_the_user()
+
+        while job := claim_job("test"):
+            run_job(job)
+        self.assertFalse(User.objects.filter(pk=self.user.pk).exists())
+        self.assertEqual(list(Article._base_manager.all()), [self.article])
+        self.comment.refresh_from_db()
+        self.assertIsNone(self.comment.author)
+        self.assertFalse(ArticleRate.objects.filter(article=self.article).exists())
+        self.assertFalse(ArticleFavorite.objects.exists())
+        self.assertFalse(CommentRate.objects.exists())
+        self.assertFalse(ProfileSubscription.objects.exists())
+        self.assertIsNotNone(Deletion.objects.get().finished_at)
+        # Comments stay, without author.
+        self.assertEqual(
+            sorted(row["author_id"] or 0 for row in self.export("comments")),
+            [0, self.other.pk],
+        )
+
+    def test_admin_deletes_in_the_background(self):
+        self.client.force_login(
+            User.objects.create(username="admin", is_staff=True, is_superuser=True)
+        )
+        response = self.client.post(
+            "/admin/auth/user/",
+            {
+                "action": "delete_selected",
+                "_selected_action": [self.user.pk],
+                "post": "yes",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(User.objects.filter(pk=self.user.pk, is_active=False).exists())
+        response = self.client.post(
+            f"/admin/blog_app/article/{self.article.pk}/delete/", {"post": "yes"}
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertIsNotNone(Article._base_manager.get(pk=self.article.pk).deleted_at)
+        self.assertEqual(
+            set(Deletion.objects.values_list("kind", "object_id")),
+            {(Deletion.USER, self.user.pk), (Deletion.ARTICLE, self.article.pk)},
+        )
+        self.assertEqual(Job.objects.count(), 2)
+
+
+class ImageProcessingTests(TestCase):
+    def get_image(self, mode, color, format, exif=None) -> BytesIO:
+        file = BytesIO()
+        image = Image.new(mode, (40, 20), color)
+        if exif is not None:
+            image.save(file, format, exif=exif)
+        else:
+            image.save(file, format)
+        file.seek(0)
+        return file
+
+    def test_transparent_parts_are_laid_on_white(self):
+        metadata = analyze_image(self.get_image("RGBA", (255, 0, 0, 0), "PNG"))
+        self.assertEqual(
+            (metadata["width"], metadata["height"], metadata["format"]),
+            (40, 20, "PNG"),
+        )
+        self.assertEqual(metadata["dominant_color"], "#ffffff")
+        self.assertTrue(metadata["placeholder"].startswith("data:image/jpeg;base64,"))
+
+    def test_displayed_size_follows_the_orientation(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        metadata = analyze_image(
+            self.get_image("RGB", (0, 0, 255), "JPEG", exif=exif.tobytes())
+        )
+        self.assertEqual((metadata["width"], metadata["height"]), (20, 40))
+        self.assertEqual(metadata["format"], "JPEG")
+
+    @override_settings(JOBS_EAGER=True)
+    def test_uploaded_images_are_processed_in_the_background(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = UploadedImage.objects.create(
+                image="images/missing.png", user=create_user("user")
+            )
+        image.refresh_from_db()
+        self.assertIsNone(image.processed_at)
+        job = claim_job("test")
+        self.assertEqual(job.name, "blog_app.images.process_image")
+        with self.assertLogs("blog_app.images", "WARNING"):
+            run_job(job)
+        image.refresh_from_db()
+        self.assertIsNotNone(image.processed_at)
+
+
+class CollectUploadsTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        user = create_user("user")
+        UploadedImage.objects.create(image="uploads/images/a.png", user=user)
+        self.file = UploadedFile.objects.create(file="uploads/files/a.pdf", user=user)
+        old = timezone.now() - timedelta(days=30)
+        UploadedImage.objects.update(uploaded_at=old)
+        UploadedFile.objects.update(uploaded_at=old)
+
+    def test_uploaded_files_are_only_collected_on_request(self):
+        collected = collect_uploads()
+        self.assertEqual(dict(collected.rows), {"blog_app.UploadedImage": 1})
+        self.assertTrue(UploadedFile.objects.filter(pk=self.file.pk).exists())
+
+        Article.objects.create(
+            author=self.file.user, title="Title", content="/uploads/files/a.pdf"
+        )
+        collected = collect_uploads(include_linked_only=True)
+        self.assertEqual(collected.rows["blog_app.UploadedFile"], 0)
+        self.assertTrue(UploadedFile.objects.filter(pk=self.file.pk).exists())
+
+        Article.objects.all().delete()
+        collected = collect_uploads(include_linked_only=True)
+        self.assertEqual(dict(collected.rows), {"blog_app.UploadedFile": 1})
+        self.assertFalse(UploadedFile.objects.exists())
+
+
+class InvalidationTests(TransactionTestCase):
+    def test_publishes_of_a_block_are_sent_at_once(self):
+        with CaptureQueriesContext(connection) as queries:
+            with batched_publishes():
+                # Committed each, in autocommit.
+                bump_version("article", 1)
+                bump_version("article", 2)
+                with transaction.atomic():
+                    bump_version("profile", 1)
+                self.assertFalse(Invalidation.objects.exists())
+        inserts = [
+            query
+            for query in queries
+            if query["sql"].startswith('INSERT INTO "blog_app_invalidation"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Invalidation.objects.count(), 3)
+
+    @override_settings(INVALIDATION_TRANSPORT="blog_app.tests.PublishOnlyTransport")
+    def test_incomplete_transports_fail_when_created(self):
+        with mock.patch("blog_app.invalidation._transport", None):
+            with self.assertRaises(TypeError):
+                get_transport()
+
+
+class MetricsTests(TestCase):
+    def setUp(self):
+        reset()
+
+    def test_scrapes_are_allowed_by_address_or_for_staff(self):
+        self.client.get("/api/articles/")
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('operation_id="getArticles"', response.content.decode())
+
+        outside = {"REMOTE_ADDR": "192.0.2.1"}
+        user = create_user("user")
+        response = self.client.get("/api/metrics/", **outside, **auth(user))
+        self.assertEqual(response.status_code, 403)
+        User.objects.filter(pk=user.pk).update(is_staff=True)
+        response = self.client.get("/api/metrics/", **outside, **auth(user))
+        self.assertEqual(response.status_code, 200)
+
+
+class SlowQueryTests(TestCase):
+    def setUp(self):
+        reset()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def test_statements_are_fingerprinted_without_their_values(self):
+        first = normalize("SELECT * FROM t WHERE a = 'it''s' AND b IN (%s, %s)")
+        second = normalize("SELECT *  FROM t\nWHERE a = 'x' AND b IN (%s)")
+        self.assertEqual(first, "SELECT * FROM t WHERE a = ? AND b IN (...)")
+        self.assertEqual(first, second)
+        self.assertEqual(get_fingerprint(first), get_fingerprint(second))
+        self.assertNotEqual(
+            get_fingerprint(first), get_fingerprint(normalize("SELECT * FROM u"))
+        )
+
+    @override_settings(SLOW_QUERY_THRESHOLD=0, SLOW_QUERY_EXPLAIN_RATE=0)
+    def test_slow_queries_are_logged_with_their_view_and_plan(self):
+        # Installed on the connection when it was opened.
+        self.assertIn(_wrapper, connection.execute_wrappers)
+        with mock.patch.object(_wrapper, "explained", set()), mock.patch(
+            "blog_app.slow_queries.get_log", return_value=slow_query_log
+        ), self.assertLogs(slow_query_log, "INFO") as logs:
+            self.client.get("/api/articles/?limit=1")
+            self.client.get("/api/articles/?limit=2")
+        entries = [json.loads(record.getMessage()) for record in logs.records]
+        counts = [
+            entry
+            for entry in entries
+            if entry["statement"].startswith('SELECT COUNT(*) AS "__count"')
+        ]
+        self.assertEqual(len(counts), 2)
+        self.assertEqual(counts[0]["fingerprint"], counts[1]["fingerprint"])
+        self.assertEqual(counts[0]["view"], "GET article-list")
+        self.assertTrue(counts[0]["stack"])
+        # Explained the first time only.
+        self.assertIn("SCAN", counts[0]["plan"])
+        self.assertIsNone(counts[1]["plan"])
+
+    def test_logs_are_summarized_by_fingerprint(self):
+        entries = [
+            {
+                "at": timezone.now().isoformat(),
+                "duration": duration,
+                "fingerprint": fingerprint,
+                "statement": f"SELECT {fingerprint}",
+                "view": "GET article-list",
+                "stack": ["blog_app/views.py:1 in list"],
+                "plan": None,
+            }
+            for fingerprint, duration in (("a", 0.5), ("b", 0.2), ("b", 0.2))
+        ]
+        with open(self.directory / "slow-queries-1.jsonl", "w") as log:
+            log.writelines(json.dumps(entry) + "\n" for entry in entries)
+            log.write('{"torn')
+        stdout = StringIO()
+        with override_settings(SLOW_QUERY_LOG_DIR=self.directory):
+            call_command("slow_queries", sort="count", stdout=stdout)
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(lines[0], "b: 2 runs, 0.40s total, 200ms mean, 200ms max")
+        self.assertIn("  view: GET article-list (2)", lines)
+        self.assertEqual(lines[-1], "3 slow queries, 2 fingerprints")
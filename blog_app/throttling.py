@@ -0,0 +1,194 @@
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+# Requests refused since the process started, by reason.
+shed_counts = Counter()
+
+
+def get_admission_stats() -> dict:
+    return {"in_flight": _in_flight.count, "shed": dict(shed_counts)}
+
+
+class TokenBuckets:
+    """
+    Token buckets by client, in process memory. A bucket holds up to
+    `capacity` tokens and gains `capacity` tokens every `period` seconds.
+
+    Up to `max_clients` buckets are kept, the least recently used are
+    dropped first, which refills them.
+    """
+
+    def __init__(self, max_clients=100_000):
+        self.max_clients = max_clients
+        self.lock = threading.Lock()
+        # key -> (tokens, monotonic time of the last update)
+        self.buckets = OrderedDict()
+
+    def consume(self, key, capacity, period) -> float:
+        """Take a token, return 0 or the seconds to wait for one."""
+        now = time.monotonic()
+        rate = capacity / period
+        with self.lock:
+            tokens, updated = self.buckets.pop(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                wait = (1 - tokens) / rate
+            self.buckets[key] = (tokens, now)
+            while len(self.buckets) > self.max_clients:
+                self.buckets.popitem(last=False)
+        return wait
+
+
+_buckets = TokenBuckets()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles clients, by user or by address, with a token bucket per
+    scope. Rates are taken from `DEFAULT_THROTTLE_RATES` and use the
+    DRF format, `"20/s"` allows bursts of 20 requests.
+
+    Subclasses throttling part of the requests override `applies()`.
+    """
+
+    scope = None
+
+    def applies(self, request, view) -> bool:
+        return True
+
+    def parse_rate(self, rate):
+        count, period = rate.split("/")
+        return int(count), {"s": 1, "m": 60, "h": 3600, "d": 86400}[period[0]]
+
+    def allow_request(self, request, view):
+        self.wait_time = 0.0
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+        if rate is None or not self.applies(request, view):
+            return True
+        if request.user and request.user.is_authenticated:
+            client = f"user:{request.user.pk}"
+        else:
+            client = f"ip:{self.get_ident(request)}"
+        self.wait_time = _buckets.consume(
+            f"{self.scope}:{client}", *self.parse_rate(rate)
+        )
+        if self.wait_time:
+            shed_counts[f"throttled:{self.scope}"] += 1
+            return False
+        return True
+
+    def wait(self):
+        return self.wait_time
+
+
+class ClientRateThrottle(TokenBucketThrottle):
+    scope = "client"
+
+
+class SearchRateThrottle(TokenBucketThrottle):
+    """Throttles `?search=` listings, which scan the articles."""
+
+    scope = "search"
+
+    def applies(self, request, view):
+        return bool(request.query_params.get(api_settings.SEARCH_PARAM))
+
+
+class DeepOffsetRateThrottle(TokenBucketThrottle):
+    """Throttles pages past `THROTTLE_DEEP_OFFSET`, which scan the rows before."""
+
+    scope = "deep_offset"
+
+    def applies(self, request, view):
+        try:
+            offset = int(request.query_params.get("offset", 0))
+        except ValueError:
+            return False
+        return offset >= settings.THROTTLE_DEEP_OFFSET
+
+
+class UploadRateThrottle(TokenBucketThrottle):
+    """Throttles uploads to views with `throttle_scope = "uploads"`."""
+
+    scope = "uploads"
+
+    def applies(self, request, view):
+        return (
+            request.method == "POST"
+            and getattr(view, "throttle_scope", None) == self.scope
+        )
+
+
+class _InFlight:
+    def __init__(self):
+        self.condition = threading.Condition()
+        self.count = 0
+        self.waiting = 0
+
+
+_in_flight = _InFlight()
+
+
+class AdmissionControlMiddleware:
+    """
+    Limits the requests handled at once by the process to
+    `ADMISSION_MAX_IN_FLIGHT`.
+
+    Requests past the limit wait for up to `ADMISSION_QUEUE_TIMEOUT`
+    seconds. When `ADMISSION_MAX_QUEUE` requests are already waiting, or
+    the wait times out, the request is shed with a 503 and `Retry-After`,
+    which is cheaper than letting every request get slow.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._admit():
+            return self._shed()
+        try:
+            return self.get_response(request)
+        finally:
+            with _in_flight.condition:
+                _in_flight.count -= 1
+                _in_flight.condition.notify()
+
+    def _admit(self) -> bool:
+        state = _in_flight
+        with state.condition:
+            if state.count < settings.ADMISSION_MAX_IN_FLIGHT:
+                state.count += 1
+                return True
+            if state.waiting >= settings.ADMISSION_MAX_QUEUE:
+                shed_counts["queue_full"] += 1
+                return False
+            state.waiting += 1
+            try:
+                admitted = state.condition.wait_for(
+                    lambda: state.count < settings.ADMISSION_MAX_IN_FLIGHT,
+                    timeout=settings.ADMISSION_QUEUE_TIMEOUT,
+                )
+            finally:
+                state.waiting -= 1
+            if not admitted:
+                shed_counts["queue_timeout"] += 1
+                return False
+            state.count += 1
+            return True
+
+    def _shed(self):
+        response = JsonResponse(
+            {"detail": "Server overloaded, retry later."},
+            status=503,
+        )
+        response["Retry-After"] = str(settings.ADMISSION_RETRY_AFTER)
+        return response
@@ -0,0 +1,198 @@
+import logging
+import os
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import timedelta
+from urllib.parse import unquote
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.utils import timezone
+
+from blog_app.models import Article, Comment, Profile, UploadedFile, UploadedImage
+from blog_app.recommendations import chunked
+
+logger = logging.getLogger(__name__)
+
+# The uploads and the name of their file field.
+UPLOAD_MODELS = {UploadedImage: "image", UploadedFile: "file"}
+# Uploads no foreign key ever points to, only links. They may be linked from
+# outside the site too, rows are only collected on request.
+LINKED_ONLY_MODELS = {UploadedFile}
+
+# Texts where users may link uploads, by their URL.
+CONTENT_FIELDS = [(Article, "content"), (Comment, "content"), (Profile, "bio")]
+
+
+@dataclass
+class Collected:
+    """What a collection deleted, or would delete with `dry_run`."""
+
+    rows: Counter = field(default_factory=Counter)
+    # Files without a row.
+    files: int = 0
+    bytes: int = 0
+
+
+def get_linked_names(batch_size) -> set[str]:
+    """
+    Return the names of the uploads linked from contents, which have no
+    foreign key to keep them. Only texts linking uploads are read, a batch
+    at a time.
+    """
+    url = settings.UPLOADS_URL.strip("/") + "/"
+    pattern = re.compile(re.escape(url) + r"[^\s\"'()<>\[\]?#]+")
+    directory = settings.UPLOADS_DIR.strip("/") + "/"
+    names = set()
+    for model, field_name in CONTENT_FIELDS:
+        texts = model._base_manager.filter(**{f"{field_name}__contains": url})
+        for text in texts.values_list(field_name, flat=True).iterator(batch_size):
+            names.update(
+                directory + unquote(link[len(url) :])
+                for link in pattern.findall(text)
+            )
+    return names
+
+
+def unreferenced(queryset) -> models.QuerySet:
+    """Filter the uploads of `queryset` no foreign key points to."""
+    for relation in queryset.model._meta.related_objects:
+        queryset = queryset.filter(
+            ~models.Exists(
+                relation.related_model._base_manager.filter(
+                    **{relation.field.name: models.OuterRef("pk")}
+                )
+            )
+        )
+    return queryset
+
+
+def get_size(name) -> int:
+    try:
+        return default_storage.size(name)
+    except OSError:
+        return 0
+
+
+def delete_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError as error:
+            # Left for the next collection, as a file without row.
+            logger.warning("Can't delete %s: %s", name, error)
+
+
+def collect_rows(model, cutoff, linked, batch_size, dry_run, collected):
+    """Delete the uploads of `model` older than `cutoff` nothing refers to."""
+    field_name = UPLOAD_MODELS[model]
+    candidates = (
+        unreferenced(model.objects.filter(uploaded_at__lt=cutoff))
+        .order_by("pk")
+        .values_list("pk", field_name)
+    )
+    last_pk = 0
+    while True:
+        # A query per batch, rows are deleted between them.
+        batch = list(candidates.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        last_pk = batch[-1][0]
+        rows = [(pk, name) for pk, name in batch if name not in linked]
+        if not dry_run:
+            with transaction.atomic():
+                # Checked again, locked where supported, they may be used now.
+                ids = [pk for pk, _ in rows]
+                rows = list(
+                    unreferenced(model.objects.filter(pk__in=ids))
+                    .select_for_update()
+                    .values_list("pk", field_name)
+                )
+                model.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+        names = [name for _, name in rows if name]
+        collected.rows[model._meta.label] += len(rows)
+        collected.bytes += sum(get_size(name) for name in names)
+        if not dry_run:
+            delete_files(names)
+
+
+def iter_stored_files(directory):
+    """
+    Yield the name and `os.stat_result` of the files under `directory` of
+    the storage, reading the directories entry by entry.
+    """
+    location = default_storage.path("")
+    pending = [default_storage.path(directory)]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    name = os.path.relpath(entry.path, location)
+                    name = name.replace(os.sep, "/")
+                    yield name, entry.stat(follow_symlinks=False)
+
+
+def collect_files(cutoff, linked, batch_size, dry_run, collected):
+    """Delete the files under `UPLOADS_DIR` older than `cutoff` without row."""
+    cutoff = cutoff.timestamp()
+    # Files are written before their row, young ones may be uploading.
+    files = (
+        (name, stat)
+        for name, stat in iter_stored_files(settings.UPLOADS_DIR)
+        if stat.st_mtime < cutoff and name not in linked
+    )
+    for batch in chunked(files, batch_size):
+        names = [name for name, _ in batch]
+        kept = set()
+        for model, field_name in UPLOAD_MODELS.items():
+            kept.update(
+                model.objects.filter(**{f"{field_name}__in": names}).values_list(
+                    field_name, flat=True
+                )
+            )
+        orphans = [(name, stat) for name, stat in batch if name not in kept]
+        collected.files += len(orphans)
+        collected.bytes += sum(stat.st_size for _, stat in orphans)
+        if not dry_run:
+            delete_files(name for name, _ in orphans)
+
+
+def collect_uploads(
+    grace_seconds=None, batch_size=None, dry_run=False, include_linked_only=False
+) -> Collected:
+    """
+    Delete the uploads no article, profile nor content refers to anymore
+    with their files, then the files under `UPLOADS_DIR` without row, once
+    older than `grace_seconds`. Rows and files are read in batches, memory
+    only grows with the uploads linked from contents.
+
+    The rows of `LINKED_ONLY_MODELS` are kept unless `include_linked_only`
+    is set, nothing tells whether they are used outside the contents.
+    """
+    if grace_seconds is None:
+        grace_seconds = settings.UPLOADS_GC_GRACE_SECONDS
+    batch_size = batch_size or settings.UPLOADS_GC_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(seconds=grace_seconds)
+    linked = get_linked_names(batch_size)
+    collected = Collected()
+    for model in UPLOAD_MODELS:
+        if model in LINKED_ONLY_MODELS and not include_linked_only:
+            continue
+        collect_rows(model, cutoff, linked, batch_size, dry_run, collected)
+    collect_files(cutoff, linked, batch_size, dry_run, collected)
+    logger.info(
+        "%s %s rows and %s files, %s bytes",
+        "Would delete" if dry_run else "Deleted",
+        sum(collected.rows.values()),
+        collected.files,
+        collected.bytes,
+    )
+    return collected
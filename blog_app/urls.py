@@ -3,12 +3,13 @@ from django.urls import include, path
 from rest_framework import routers
 from django.conf.urls.static import static
 from drf_spectacular.views import (
-    SpectacularAPIView,
     SpectacularRedocView,
     SpectacularSwaggerView,
 )
 
 from blog_app import views
+from blog_app.metrics import MetricsView
+from blog_app.schema import PrebuiltSchemaView
 from blog_app.views import ArticleViewSet, CategoryViewSet, TagViewSet
 
 router = routers.DefaultRouter()
@@ -20,10 +21,12 @@ router.register("comments", views.CommentViewSet)
 router.register("profiles", views.ProfileViewSet)
 router.register("uploaded_images", views.UploadedImageViewSet)
 router.register("uploaded_files", views.UploadedFileViewSet)
+router.register("export", views.ExportViewSet, basename="export")
 
 urlpatterns = [
     path("", include(router.urls)),
-    path("schema/", SpectacularAPIView.as_view(), name="schema"),
+    path("metrics/", MetricsView.as_view(), name="metrics"),
+    path("schema/", PrebuiltSchemaView.as_view(), name="schema"),
     path(
         "schema/swagger-ui/",
         SpectacularSwaggerView.as_view(url_name="schema"),
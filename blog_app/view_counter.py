@@ -0,0 +1,206 @@
+import atexit
+import fcntl
+import logging
+import struct
+import tempfile
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from multiprocessing import resource_tracker, shared_memory
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, models
+from rest_framework.throttling import BaseThrottle
+
+from blog_app.models import Article
+
+logger = logging.getLogger(__name__)
+
+
+class SharedCounters:
+    """
+    Table of `(article id, count)` slots in shared memory, guarded by a
+    `flock()`, so that processes of one host add up their views and a
+    single flush writes them all.
+
+    Slots are addressed by open addressing, `add()` returns `False` when the
+    table is full.
+    """
+
+    slot = struct.Struct("qq")
+
+    def __init__(self, name, slots):
+        try:
+            self.memory = shared_memory.SharedMemory(
+                name=name, create=True, size=slots * self.slot.size
+            )
+        except FileExistsError:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.slots = self.memory.size // self.slot.size
+        # The segment outlives the processes using it, counts left by a
+        # process are flushed by the next one.
+        resource_tracker.unregister(self.memory._name, "shared_memory")
+        self.lock_file = open(Path(tempfile.gettempdir()) / f"{name}.lock", "a")
+
+    def add(self, article_id, count) -> bool:
+        buffer = self.memory.buf
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            index = hash(article_id) % self.slots
+            for _ in range(self.slots):
+                offset = index * self.slot.size
+                key, value = self.slot.unpack_from(buffer, offset)
+                if key == article_id or key == 0:
+                    self.slot.pack_into(buffer, offset, article_id, value + count)
+                    return True
+                index = (index + 1) % self.slots
+            return False
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            del buffer
+
+    def drain(self) -> dict[int, int]:
+        """Return the counts and reset the table."""
+        counts = {}
+        buffer = self.memory.buf
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        try:
+            for key, value in self.slot.iter_unpack(buffer):
+                if key:
+                    counts[key] = value
+            buffer[:] = bytes(len(buffer))
+        finally:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            del buffer
+        return counts
+
+
+class ViewCounter:
+    """
+    Counts article views in memory and adds them to `Article.views` in
+    batches, from a background thread and on shutdown.
+
+    Repeated views of an article by the same viewer within `dedup_window`
+    seconds count once. Viewers are remembered per process, up to
+    `dedup_size` of them.
+    """
+
+    def __init__(
+        self,
+        flush_interval=5.0,
+        dedup_window=30 * 60,
+        dedup_size=100_000,
+        shared=None,
+    ):
+        self.flush_interval = flush_interval
+        self.dedup_window = dedup_window
+        self.dedup_size = dedup_size
+        self.shared = shared
+        self.lock = threading.Lock()
+        self.pending = defaultdict(int)
+        # (viewer, article_id) -> expiry, in expiry order.
+        self.seen = OrderedDict()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self._run,
+            name="view-counter",
+            daemon=True,
+        )
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    def add(self, article_id, viewer) -> bool:
+        """Count a view, return whether it wasn't a repeated one."""
+        now = time.monotonic()
+        key = (viewer, article_id)
+        with self.lock:
+            while self.seen and (
+                len(self.seen) >= self.dedup_size
+                or next(iter(self.seen.values())) <= now
+            ):
+                self.seen.popitem(last=False)
+            if key in self.seen:
+                return False
+            self.seen[key] = now + self.dedup_window
+            if self.shared is None or not self.shared.add(article_id, 1):
+                self.pending[article_id] += 1
+        return True
+
+    def get_pending(self, article_id) -> int:
+        # Views counted by other processes aren't known before the flush.
+        return self.pending.get(article_id, 0)
+
+    def flush(self):
+        with self.lock:
+            pending, self.pending = self.pending, defaultdict(int)
+        if self.shared is not None:
+            for article_id, count in self.shared.drain().items():
+                pending[article_id] += count
+        if not pending:
+            return
+        # One UPDATE per distinct increment, most articles get the same.
+        by_count = defaultdict(list)
+        for article_id, count in pending.items():
+            by_count[count].append(article_id)
+        try:
+            for count, article_ids in by_count.items():
+                Article._base_manager.filter(pk__in=article_ids).update(
+                    views=models.F("views") + count
+                )
+        except Exception:
+            logger.exception("Failed to flush views of %d articles", len(pending))
+            with self.lock:
+                for article_id, count in pending.items():
+                    self.pending[article_id] += count
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+def get_viewer(request) -> str:
+    if request.user.is_authenticated:
+        return f"user:{request.user.pk}"
+    # Client address, with the `NUM_PROXIES` setting applied.
+    return f"ip:{BaseThrottle().get_ident(request)}"
+
+
+_view_counter = None
+_view_counter_lock = threading.Lock()
+
+
+def get_view_counter() -> ViewCounter:
+    """Return the process wide view counter, started on first use."""
+    global _view_counter
+    if _view_counter is None:
+        with _view_counter_lock:
+            if _view_counter is None:
+                shared = None
+                if settings.VIEW_COUNTER_SHARED_MEMORY:
+                    shared = SharedCounters(
+                        settings.VIEW_COUNTER_SHARED_MEMORY,
+                        settings.VIEW_COUNTER_SHARED_SLOTS,
+                    )
+                counter = ViewCounter(
+                    flush_interval=settings.VIEW_COUNTER_FLUSH_INTERVAL,
+                    dedup_window=settings.VIEW_COUNTER_DEDUP_WINDOW,
+                    shared=shared,
+                )
+                counter.start()
+                _view_counter = counter
+    return _view_counter
@@ -7,20 +7,38 @@ from blog_app.models import (
     CommentRate,
     Profile,
     ProfileSubscription,
+    RelatedArticle,
     Tag,
     Comment,
     UploadedFile,
     UploadedImage,
+    count_subquery,
 )
+from blog_app.autocomplete import get_index
+from blog_app.caching import get_versions, version_key
+from blog_app.compression import ResponseCache
+from blog_app.deletion import delete_article
+from blog_app.provisioning import get_hash_executor, provision_users
+from blog_app.recommendations import get_recommended_ids, interactions_removed
+from blog_app.view_counter import get_view_counter, get_viewer
+from blog_app.write_behind import get_rate_buffer
 from blog_app.permissions import CommentPermission, ArticlePermission, ProfilePermission
 from blog_app.serializers import (
     ArticleRateSerializer,
     ArticleSerializer,
+    ArticleSuggestionSerializer,
+    BatchArticleSerializer,
+    BatchProfileSerializer,
     CategorySerializer,
     CommentRateSerializer,
     CommentSerializer,
     ProfileSerializer,
+    ProfileSuggestionSerializer,
+    ProvisionedUserSerializer,
+    ProvisioningResultSerializer,
+    PublicProfileSerializer,
     TagSerializer,
+    TagSuggestionSerializer,
     UploadedFileSerializer,
     UploadedImageSerializer,
     UserTokenSerializer,
@@ -43,7 +61,202 @@ from drf_spectacular.utils import (
 from drf_spectacular.types import OpenApiTypes
 from rest_framework import parsers
 from drf_spectacular.authentication import TokenScheme
-from django.db import models
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+
+
+SPARSE_FIELDS_PARAMETERS = [
+    OpenApiParameter(
+        "fields",
+        OpenApiTypes.STR,
+        OpenApiParameter.QUERY,
+        description="Comma separated fields to return.",
+    ),
+    OpenApiParameter(
+        "omit",
+        OpenApiTypes.STR,
+        OpenApiParameter.QUERY,
+        description="Comma separated fields to leave out.",
+    ),
+    OpenApiParameter(
+        "expand",
+        OpenApiTypes.STR,
+        OpenApiParameter.QUERY,
+        description="Comma separated fields left out of lists by default to return.",
+    ),
+]
+
+AUTOCOMPLETE_PARAMETERS = [
+    OpenApiParameter(
+        "q",
+        OpenApiTypes.STR,
+        OpenApiParameter.QUERY,
+        description="Prefix typed so far, of any word for titles.",
+    ),
+    OpenApiParameter(
+        "limit",
+        OpenApiTypes.INT,
+        OpenApiParameter.QUERY,
+        description=f"At most {settings.AUTOCOMPLETE_LIMIT}.",
+    ),
+]
+
+
+# Trims the queryset of read requests down to the fields selected with
+# `?fields=`, `?omit=` and `?expand=`, see `SparseFieldsMixin`.
+# (View mixins have no docstring, views would show it in the schema.)
+class SparseFieldsViewMixin:
+    # Actions returning many objects, which leave out the
+    # `list_expandable_fields` unless requested.
+    many_actions = ("list", "batch", "recommended", "related")
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method in permissions.SAFE_METHODS:
+            queryset = self.trim_queryset(queryset, set(self.get_serializer().fields))
+        return queryset
+
+    def trim_queryset(self, queryset, fields):
+        return queryset
+
+
+def annotate_profiles(queryset, fields, user):
+    """
+    Annotate the `ProfileSerializer` fields among `fields` which would
+    otherwise take a query per profile.
+    """
+    if "articles_count" in fields:
+        queryset = queryset.annotate(
+            num_articles=count_subquery(
+                Article, "author", outer="user", deleted_at=None
+            )
+        )
+    if "subscribers_count" in fields:
+        queryset = queryset.annotate(
+            num_subscribers=count_subquery(ProfileSubscription, "profile")
+        )
+    if "total_articles_rating" in fields:
+        rating = (
+            ArticleRate.objects.filter(
+                article__author=models.OuterRef("user"),
+                article__deleted_at=None,
+            )
+            .order_by()
+            .values("article__author")
+            .annotate(
+                rating=models.Sum(
+                    models.Case(
+                        models.When(is_positive=True, then=1),
+                        models.When(is_positive=False, then=-1),
+                        output_field=models.IntegerField(),
+                    )
+                )
+            )
+            .values("rating")
+        )
+        queryset = queryset.annotate(
+            articles_rating=Coalesce(models.Subquery(rating), 0)
+        )
+    if "are_you_subscribed" in fields and user.is_authenticated:
+        queryset = queryset.annotate(
+            are_you_subscribed=models.Exists(
+                ProfileSubscription.objects.filter(
+                    profile=models.OuterRef("pk"), user=user
+                )
+            )
+        )
+    return queryset
+
+
+# Adds a `batch` list action fetching many objects by lookup in one query.
+#
+# Results keep the order of the requested keys, keys without an object are
+# returned with `found` set to false.
+class BatchRetrieveMixin:
+    batch_param = "ids"
+    batch_max_size = 100
+    batch_key_type = str
+
+    def get_batch_keys(self):
+        raw = self.request.query_params.get(self.batch_param, "")
+        keys = list(dict.fromkeys(key.strip() for key in raw.split(",") if key.strip()))
+        if not keys:
+            raise ValidationError({self.batch_param: "This parameter is required."})
+        if len(keys) > self.batch_max_size:
+            raise ValidationError(
+                {self.batch_param: f"At most {self.batch_max_size} values are allowed."}
+            )
+        try:
+            return [self.batch_key_type(key) for key in keys]
+        except ValueError:
+            raise ValidationError({self.batch_param: "Invalid value."})
+
+    def get_batch_queryset(self):
+        return self.get_queryset()
+
+    @decorators.action(detail=False, methods=["get"])
+    def batch(self, request):
+        keys = self.get_batch_keys()
+        objects = {}
+        for obj in self.get_batch_queryset().filter(
+            **{f"{self.lookup_field}__in": keys}
+        ):
+            self.check_object_permissions(request, obj)
+            objects[getattr(obj, self.lookup_field)] = obj
+        found = [objects[key] for key in keys if key in objects]
+        data = iter(self.get_serializer(found, many=True).data)
+        return Response(
+            [
+                {
+                    "key": str(key),
+                    "found": key in objects,
+                    "data": next(data) if key in objects else None,
+                }
+                for key in keys
+            ]
+        )
+
+
+# Adds an `autocomplete` list action returning the heaviest matches of the
+# `?q=` prefix from the in memory index `autocomplete_index`, see
+# `blog_app.autocomplete`. The database isn't queried.
+class AutocompleteMixin:
+    autocomplete_index = None
+    autocomplete_serializer_class = None
+
+    @decorators.action(
+        detail=False,
+        methods=["get"],
+        pagination_class=None,
+        filter_backends=[],
+    )
+    def autocomplete(self, request):
+        try:
+            limit = int(request.query_params.get("limit", settings.AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "A valid integer is required."})
+        matches = get_index(self.autocomplete_index).lookup(
+            request.query_params.get("q", ""),
+            max(limit, 1),
+        )
+        return Response(
+            self.autocomplete_serializer_class(
+                [
+                    {"id": entry_id, "label": label, "weight": weight}
+                    for entry_id, label, weight in matches
+                ],
+                many=True,
+            ).data
+        )
 
 
 @extend_schema(tags=["Auth"])
@@ -59,8 +272,7 @@ class AuthViewSet(viewsets.ViewSet):
     def register(self, request):
         serializer = UserSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save()
-        user = User.objects.get(username=request.data["username"])
+        user = serializer.save()
         token = Token.objects.create(user=user)
         return Response(
             UserTokenSerializer(
@@ -71,6 +283,39 @@ class AuthViewSet(viewsets.ViewSet):
             ).data,
         )
 
+    @extend_schema(
+        operation_id="provisionUsers",
+        request=ProvisionedUserSerializer(many=True),
+        responses=ProvisioningResultSerializer,
+    )
+    @decorators.action(
+        ["POST"],
+        detail=False,
+        permission_classes=[permissions.IsAdminUser],
+    )
+    def provision(self, request):
+        # Bulk creation of users, see `blog_app.provisioning`.
+        serializer = ProvisionedUserSerializer(
+            data=request.data,
+            many=True,
+            max_length=settings.PROVISIONING_MAX_USERS,
+        )
+        serializer.is_valid(raise_exception=True)
+        created = 0
+        skipped = []
+        for batch_created, batch_skipped in provision_users(
+            serializer.validated_data,
+            executor=get_hash_executor(),
+        ):
+            created += len(batch_created)
+            skipped += batch_skipped
+        return Response(
+            ProvisioningResultSerializer(
+                {"created": created, "skipped": skipped}
+            ).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
     @extend_schema(
         operation_id="login",
         request=UsernamePasswordSerializer,
@@ -82,7 +327,9 @@ class AuthViewSet(viewsets.ViewSet):
         request_serializer.is_valid(raise_exception=True)
         request_data = request_serializer.data
 
-        user = get_object_or_404(User, username=request_data["username"])
+        user = get_object_or_404(
+            User, username=request_data["username"], is_active=True
+        )
         if not user.check_password(request_data["password"]):
             return Response(
                 {"error": "Wrong password"},
@@ -120,10 +367,17 @@ class CategoryViewSet(viewsets.ReadOnlyModelViewSet):
 @extend_schema_view(
     list=extend_schema(operation_id="getTags"),
     retrieve=extend_schema(operation_id="getTag"),
+    autocomplete=extend_schema(
+        operation_id="autocompleteTags",
+        parameters=AUTOCOMPLETE_PARAMETERS,
+        responses=TagSuggestionSerializer(many=True),
+    ),
 )
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(AutocompleteMixin, viewsets.ReadOnlyModelViewSet):
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
+    autocomplete_index = "tags"
+    autocomplete_serializer_class = TagSuggestionSerializer
     filter_backends = [
         filters.SearchFilter,
         filters.OrderingFilter,
@@ -152,17 +406,58 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
                 OpenApiTypes.BOOL,
                 OpenApiParameter.QUERY,
             ),
+            *SPARSE_FIELDS_PARAMETERS,
         ],
     ),
-    retrieve=extend_schema(operation_id="getArticle"),
+    retrieve=extend_schema(
+        operation_id="getArticle",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+    ),
+    batch=extend_schema(
+        operation_id="getArticlesBatch",
+        parameters=[
+            OpenApiParameter(
+                "ids",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                required=True,
+                description="Comma separated article ids.",
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
+        responses=BatchArticleSerializer(many=True),
+    ),
+    recommended=extend_schema(
+        operation_id="getRecommendedArticles",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+        responses=ArticleSerializer(many=True),
+    ),
+    related=extend_schema(
+        operation_id="getRelatedArticles",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+        responses=ArticleSerializer(many=True),
+    ),
+    autocomplete=extend_schema(
+        operation_id="autocompleteArticles",
+        parameters=AUTOCOMPLETE_PARAMETERS,
+        responses=ArticleSuggestionSerializer(many=True),
+    ),
     create=extend_schema(operation_id="createArticle"),
     update=extend_schema(operation_id="updateArticle"),
     partial_update=extend_schema(operation_id="partialUpdateArticle"),
     destroy=extend_schema(operation_id="deleteArticle"),
 )
-class ArticleViewSet(viewsets.ModelViewSet):
+class ArticleViewSet(
+    AutocompleteMixin,
+    BatchRetrieveMixin,
+    SparseFieldsViewMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Article.objects.all()
     serializer_class = ArticleSerializer
+    batch_key_type = int
+    autocomplete_index = "titles"
+    autocomplete_serializer_class = ArticleSuggestionSerializer
     # parser_classes = [parsers.JSONParser]
     filter_backends = [
         filters.SearchFilter,
@@ -182,6 +477,7 @@ class ArticleViewSet(viewsets.ModelViewSet):
         "created_at",
         "updated_at",
         "rating",
+        "views",
         "favors__favored_at",
     ]
     search_fields = [
@@ -215,18 +511,149 @@ class ArticleViewSet(viewsets.ModelViewSet):
 
         return queryset
 
+    def trim_queryset(self, queryset, fields):
+        if "rating" not in fields and "rating" not in self.request.query_params.get(
+            "ordering", ""
+        ):
+            # Skip the rating annotation and its subquery.
+            queryset = Article._base_manager.filter(deleted_at=None)
+        for name in ("content", "rendered_content", "outline"):
+            if name not in fields:
+                queryset = queryset.defer(name)
+        if "cover_url" in fields or "cover_metadata" in fields:
+            queryset = queryset.select_related("cover")
+        if "author_details" in fields:
+            # Nested serializers keep all their fields.
+            profiles = annotate_profiles(
+                Profile._base_manager.select_related("avatar"),
+                ProfileSerializer.Meta.fields,
+                self.request.user,
+            )
+            queryset = queryset.select_related("author").prefetch_related(
+                models.Prefetch("author__profile", queryset=profiles)
+            )
+        elif "you_author" in fields:
+            queryset = queryset.select_related("author")
+        if "tags" in fields:
+            queryset = queryset.prefetch_related("tags")
+        if "ratings_count" in fields:
+            queryset = queryset.annotate(
+                num_positive_rates=count_subquery(
+                    ArticleRate, "article", is_positive=True
+                ),
+                num_negative_rates=count_subquery(
+                    ArticleRate, "article", is_positive=False
+                ),
+            )
+        user = self.request.user
+        if "your_rate" in fields and user.is_authenticated:
+            queryset = queryset.annotate(
+                your_rate=models.Subquery(
+                    ArticleRate.objects.filter(
+                        article=models.OuterRef("pk"), user=user
+                    ).values("is_positive")[:1]
+                )
+            )
+        if "is_your_bookmark" in fields and user.is_authenticated:
+            queryset = queryset.annotate(
+                is_your_bookmark=models.Exists(
+                    ArticleFavorite.objects.filter(
+                        article=models.OuterRef("pk"), user=user
+                    )
+                )
+            )
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        response = self._retrieve(request, *args, **kwargs)
+        if response.status_code == 200:
+            get_view_counter().add(int(kwargs["pk"]), get_viewer(request))
+        return response
+
+    def _retrieve(self, request, *args, **kwargs):
+        # Only anonymous responses are the same for every viewer.
+        if (
+            request.user.is_authenticated
+            or request.accepted_renderer.format != "json"
+            or not str(kwargs.get("pk")).isdigit()
+        ):
+            return super().retrieve(request, *args, **kwargs)
+        article_id = int(kwargs["pk"])
+        response_cache = ResponseCache(request, f"article:{article_id}")
+        response = response_cache.get()
+        if response is not None:
+            return response
+        author_id = (
+            Article._base_manager.filter(pk=article_id)
+            .values_list("author_id", flat=True)
+            .first()
+        )
+        response_cache.track(
+            version_key("article", article_id),
+            version_key("author", author_id),
+        )
+        return response_cache.mark(super().retrieve(request, *args, **kwargs))
+
     @staticmethod
     def _create_unexistent_tags(tags):
         return Tag.objects.bulk_create(tags, ignore_conflicts=True)
 
+    # The article and its tags are saved in one transaction, so their
+    # signals queue a single refresh of the related articles.
+    @transaction.atomic
     def perform_create(self, serializer):
         self._create_unexistent_tags(serializer.validated_data["tags"])
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
     def perform_update(self, serializer):
         self._create_unexistent_tags(serializer.validated_data["tags"])
         return super().perform_update(serializer)
 
+    def perform_destroy(self, instance):
+        # Hidden now, its comments, rates and so on are deleted in batches.
+        delete_article(instance, requested_by=self.request.user)
+
+    @decorators.action(
+        detail=False,
+        methods=["get"],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def recommended(self, request):
+        # Ranked from the stored neighbours, see `blog_app.recommendations`.
+        article_ids = get_recommended_ids(request.user.id)
+        page = self.paginate_queryset(article_ids)
+        if page is not None:
+            article_ids = page
+        articles = self.get_queryset().in_bulk(article_ids)
+        serializer = self.get_serializer(
+            [articles[pk] for pk in article_ids if pk in articles],
+            many=True,
+        )
+        if page is not None:
+            return self.get_paginated_response(serializer.data)
+        return Response(serializer.data)
+
+    @decorators.action(detail=True, methods=["get"], pagination_class=None)
+    def related(self, request, pk=None):
+        # Only reads the list stored by `blog_app.related`.
+        if (
+            not str(pk).isdigit()
+            or not Article._base_manager.filter(pk=pk, deleted_at=None).exists()
+        ):
+            raise NotFound()
+        related_ids = list(
+            RelatedArticle.objects.filter(article_id=pk)
+            .order_by("-score")
+            .values_list("related_id", flat=True)
+        )
+        articles = self.get_queryset().in_bulk(related_ids)
+        serializer = self.get_serializer(
+            [articles[pk] for pk in related_ids if pk in articles],
+            many=True,
+        )
+        return Response(serializer.data)
+
     @extend_schema(operation_id="favoriteArticle", methods=["post"])
     @extend_schema(operation_id="unfavoriteArticle", methods=["delete"])
     @decorators.action(
@@ -238,10 +665,14 @@ class ArticleViewSet(viewsets.ModelViewSet):
         article = self.get_object()
         user = request.user
         if request.method == "POST":
-            ArticleFavorite.objects.update_or_create(user=user, article=article)
+            ArticleFavorite.objects.upsert(user=user, article=article)
             return Response({"detail": "Article added to favorites"})
         elif request.method == "DELETE":
-            ArticleFavorite.objects.filter(user=user, article=article).delete()
+            deleted, _ = ArticleFavorite.objects.filter(
+                user=user, article=article
+            ).delete()
+            if deleted:
+                interactions_removed([article.id])
             return Response({"detail": "Article removed from favorites"})
 
     @extend_schema(operation_id="rateArticle", methods=["post"])
@@ -254,32 +685,51 @@ class ArticleViewSet(viewsets.ModelViewSet):
     def rate(self, request, pk=None):
         article = self.get_object()
         user = request.user
+        rate_buffer = get_rate_buffer()
         if request.method == "POST":
-            oldRate = ArticleRate.objects.filter(
-                user=user,
-                article=article,
-            )
-            if oldRate.exists():
-                oldRate.delete()
             serializer = ArticleRateSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            serializer.save(user=user, article=article)
+            if rate_buffer is not None:
+                rate_buffer.add(
+                    user.id,
+                    article.id,
+                    serializer.validated_data["is_positive"],
+                )
+            else:
+                ArticleRate.objects.upsert(
+                    user=user,
+                    article=article,
+                    defaults=serializer.validated_data,
+                )
             return Response({"detail": "Article rated"})
         elif request.method == "DELETE":
-            ArticleRate.objects.filter(user=user, article=article).delete()
+            if rate_buffer is not None:
+                rate_buffer.add(user.id, article.id, None)
+            else:
+                deleted, _ = ArticleRate.objects.filter(
+                    user=user, article=article
+                ).delete()
+                if deleted:
+                    interactions_removed([article.id])
             return Response({"detail": "Article un-rated"})
 
 
 @extend_schema(tags=["Comments"])
 @extend_schema_view(
-    list=extend_schema(operation_id="getComments"),
-    retrieve=extend_schema(operation_id="getComment"),
+    list=extend_schema(
+        operation_id="getComments",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+    ),
+    retrieve=extend_schema(
+        operation_id="getComment",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+    ),
     create=extend_schema(operation_id="createComment"),
     update=extend_schema(operation_id="updateComment"),
     partial_update=extend_schema(operation_id="partialUpdateComment"),
     destroy=extend_schema(operation_id="deleteComment"),
 )
-class CommentViewSet(viewsets.ModelViewSet):
+class CommentViewSet(SparseFieldsViewMixin, viewsets.ModelViewSet):
     queryset = Comment.objects.all()
     serializer_class = CommentSerializer
     filter_backends = [
@@ -298,6 +748,18 @@ class CommentViewSet(viewsets.ModelViewSet):
     ]
     permission_classes = [CommentPermission]
 
+    def trim_queryset(self, queryset, fields):
+        if "rating" not in fields and "rating" not in self.request.query_params.get(
+            "ordering", ""
+        ):
+            # Skip the rating annotation and its subquery.
+            queryset = Comment._base_manager.filter(article__deleted_at=None)
+        if "author_details" in fields:
+            queryset = queryset.select_related("author__profile__avatar")
+        elif "is_your_comment" in fields:
+            queryset = queryset.select_related("author")
+        return queryset
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -314,13 +776,11 @@ class CommentViewSet(viewsets.ModelViewSet):
         if request.method == "POST":
             serializer = CommentRateSerializer(data=request.data)
             serializer.is_valid(raise_exception=True)
-            oldRate = CommentRate.objects.filter(
+            CommentRate.objects.upsert(
                 user=user,
                 comment=comment,
+                defaults=serializer.validated_data,
             )
-            if oldRate.exists():
-                oldRate.delete()
-            serializer.save(user=user, comment=comment)
             return Response({"detail": "Comment rated"})
         elif request.method == "DELETE":
             CommentRate.objects.filter(user=user, comment=comment).delete()
@@ -329,7 +789,10 @@ class CommentViewSet(viewsets.ModelViewSet):
 
 @extend_schema(tags=["Profiles"])
 @extend_schema_view(
-    list=extend_schema(operation_id="getProfiles"),
+    list=extend_schema(
+        operation_id="getProfiles",
+        parameters=SPARSE_FIELDS_PARAMETERS,
+    ),
     retrieve=extend_schema(
         operation_id="getProfile",
         parameters=[
@@ -340,16 +803,44 @@ class CommentViewSet(viewsets.ModelViewSet):
                 default=None,
                 description="Whether to include email in the response. The requester must be the owner of the profile.",
             ),
+            *SPARSE_FIELDS_PARAMETERS,
+        ],
+    ),
+    batch=extend_schema(
+        operation_id="getProfilesBatch",
+        parameters=[
+            OpenApiParameter(
+                "usernames",
+                OpenApiTypes.STR,
+                OpenApiParameter.QUERY,
+                required=True,
+                description="Comma separated profile usernames.",
+            ),
+            *SPARSE_FIELDS_PARAMETERS,
         ],
+        responses=BatchProfileSerializer(many=True),
+    ),
+    autocomplete=extend_schema(
+        operation_id="autocompleteProfiles",
+        parameters=AUTOCOMPLETE_PARAMETERS,
+        responses=ProfileSuggestionSerializer(many=True),
     ),
     create=extend_schema(operation_id="createProfile"),
     update=extend_schema(operation_id="updateProfile"),
     partial_update=extend_schema(operation_id="partialUpdateProfile"),
     destroy=extend_schema(operation_id="deleteProfile"),
 )
-class ProfileViewSet(viewsets.ModelViewSet):
+class ProfileViewSet(
+    AutocompleteMixin,
+    BatchRetrieveMixin,
+    SparseFieldsViewMixin,
+    viewsets.ModelViewSet,
+):
     queryset = Profile.objects.all()
     serializer_class = ProfileSerializer
+    batch_param = "usernames"
+    autocomplete_index = "usernames"
+    autocomplete_serializer_class = ProfileSuggestionSerializer
     filter_backends = [
         filters.SearchFilter,
         filters.OrderingFilter,
@@ -366,6 +857,50 @@ class ProfileViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(subscribers__user=self.request.user)
         return queryset
 
+    def trim_queryset(self, queryset, fields):
+        queryset = queryset.select_related("user")
+        if "avatar_url" in fields or "avatar_metadata" in fields:
+            queryset = queryset.select_related("avatar")
+        return annotate_profiles(queryset, fields, self.request.user)
+
+    def retrieve(self, request, *args, **kwargs):
+        if (
+            request.accepted_renderer.format != "json"
+            or request.query_params.get("subscribed") is not None
+        ):
+            return super().retrieve(request, *args, **kwargs)
+        # The public part of the profile is cached for every viewer, the
+        # viewer dependent fields are added per request.
+        key = f"blog_app:profile:{kwargs['username']}"
+        entry = cache.get(key)
+        if entry is None or get_versions(*entry["versions"]) != entry["versions"]:
+            profile = self.get_object()
+            entry = {
+                "profile_id": profile.pk,
+                "user_id": profile.user_id,
+                # Read before the data, changes made meanwhile make it stale.
+                "versions": get_versions(version_key("author", profile.user_id)),
+            }
+            entry["data"] = PublicProfileSerializer(
+                profile,
+                context=self.get_serializer_context(),
+            ).data
+            cache.set(key, entry, timeout=settings.PROFILE_CACHE_TIMEOUT)
+        data = {
+            **entry["data"],
+            **ProfileSerializer.get_viewer_data(
+                request, entry["profile_id"], entry["user_id"]
+            ),
+        }
+        return Response(
+            {
+                name: data[name]
+                for name in self.get_serializer().fields
+                # Like the serializer, leave out `avatar_url` without avatar.
+                if name in data
+            }
+        )
+
     @extend_schema(operation_id="subscribe", methods=["post"])
     @extend_schema(operation_id="unsubscribe", methods=["delete"])
     @decorators.action(
@@ -384,10 +919,7 @@ class ProfileViewSet(viewsets.ModelViewSet):
             )
 
         if request.method == "POST":
-            if not ProfileSubscription.objects.filter(
-                user=user, profile=profile
-            ).exists():
-                ProfileSubscription.objects.create(user=user, profile=profile)
+            ProfileSubscription.objects.upsert(user=user, profile=profile)
             return Response({"detail": "Profile subscribed"})
         elif request.method == "DELETE":
             ProfileSubscription.objects.filter(user=user, profile=profile).delete()
@@ -400,6 +932,7 @@ class UploadedImageViewSet(viewsets.ViewSet):
     serializer_class = UploadedImageSerializer
     parser_classes = [parsers.MultiPartParser]
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    throttle_scope = "uploads"
 
     @extend_schema(operation_id="uploadImage")
     def create(self, request):
@@ -427,6 +960,7 @@ class UploadedFileViewSet(viewsets.ViewSet):
     serializer_class = UploadedFileSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
     parser_classes = [parsers.MultiPartParser]
+    throttle_scope = "uploads"
 
     @extend_schema(operation_id="uploadFile")
     def create(self, request):
@@ -446,3 +980,147 @@ class UploadedFileViewSet(viewsets.ViewSet):
             context={"request": request},
         )
         return Response(serializer.data)
+
+
+@extend_schema(
+    tags=["Export"],
+    parameters=[
+        OpenApiParameter(
+            "since",
+            OpenApiTypes.DATETIME,
+            OpenApiParameter.QUERY,
+            description="Only export rows created or updated at or after this time.",
+        ),
+    ],
+    responses={(200, "application/x-ndjson"): OpenApiTypes.STR},
+)
+class ExportViewSet(viewsets.ViewSet):
+    """
+    Staff only exports streamed as newline delimited JSON, one row per line.
+
+    Rows are read in chunks and written one by one, so memory use doesn't
+    grow with the table. Rows are ordered by the time they were last
+    changed, pass the last exported time as `since` to export increments.
+    Articles and users being deleted, and the rows depending on them or
+    written by them, are left out, see `blog_app.deletion`.
+    """
+
+    permission_classes = [permissions.IsAdminUser]
+    chunk_size = 2000
+
+    def _get_since(self):
+        value = self.request.query_params.get("since")
+        if value is None:
+            return None
+        since = parse_datetime(value)
+        if since is None:
+            raise ValidationError({"since": "Invalid datetime."})
+        if timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        return since
+
+    def _stream(self, queryset, time_field, to_row):
+        since = self._get_since()
+        if since is not None:
+            queryset = queryset.filter(**{f"{time_field}__gte": since})
+        rows = queryset.order_by(time_field, "pk").iterator(chunk_size=self.chunk_size)
+        encoder = DjangoJSONEncoder()
+        return StreamingHttpResponse(
+            (encoder.encode(to_row(row)) + "\n" for row in rows),
+            content_type="application/x-ndjson",
+        )
+
+    def _stream_values(self, queryset, time_field, fields):
+        return self._stream(queryset.values(*fields), time_field, dict)
+
+    @extend_schema(operation_id="exportArticles")
+    @decorators.action(detail=False, methods=["get"])
+    def articles(self, request):
+        fields = [
+            "id",
+            "author_id",
+            "title",
+            "content",
+            "excerpt",
+            "word_count",
+            "category_id",
+            "cover_id",
+            "editor_choice",
+            "created_at",
+            "updated_at",
+        ]
+        return self._stream(
+            Article._base_manager.filter(
+                deleted_at=None, author__profile__deleted_at=None
+            )
+            .only(*fields)
+            .prefetch_related("tags"),
+            "updated_at",
+            lambda article: {
+                **{field: getattr(article, field) for field in fields},
+                "tags": [tag.name for tag in article.tags.all()],
+            },
+        )
+
+    @extend_schema(operation_id="exportComments")
+    @decorators.action(detail=False, methods=["get"])
+    def comments(self, request):
+        return self._stream_values(
+            Comment._base_manager.filter(
+                article__deleted_at=None, author__profile__deleted_at=None
+            ),
+            "updated_at",
+            [
+                "id",
+                "author_id",
+                "article_id",
+                "reply_to_id",
+                "content",
+                "created_at",
+                "updated_at",
+            ],
+        )
+
+    @extend_schema(operation_id="exportArticleRates")
+    @decorators.action(detail=False, methods=["get"])
+    def article_rates(self, request):
+        return self._stream_values(
+            ArticleRate.objects.filter(
+                article__deleted_at=None, user__profile__deleted_at=None
+            ),
+            "rated_at",
+            ["id", "user_id", "article_id", "is_positive", "rated_at"],
+        )
+
+    @extend_schema(operation_id="exportCommentRates")
+    @decorators.action(detail=False, methods=["get"])
+    def comment_rates(self, request):
+        return self._stream_values(
+            CommentRate.objects.filter(
+                comment__article__deleted_at=None, user__profile__deleted_at=None
+            ),
+            "rated_at",
+            ["id", "user_id", "comment_id", "is_positive", "rated_at"],
+        )
+
+    @extend_schema(operation_id="exportFavorites")
+    @decorators.action(detail=False, methods=["get"])
+    def favorites(self, request):
+        return self._stream_values(
+            ArticleFavorite.objects.filter(
+                article__deleted_at=None, user__profile__deleted_at=None
+            ),
+            "favored_at",
+            ["id", "user_id", "article_id", "favored_at"],
+        )
+
+    @extend_schema(operation_id="exportSubscriptions")
+    @decorators.action(detail=False, methods=["get"])
+    def subscriptions(self, request):
+        return self._stream_values(
+            ProfileSubscription.objects.filter(
+                profile__deleted_at=None, user__profile__deleted_at=None
+            ),
+            "subscribed_at",
+            ["id", "user_id", "profile_id", "subscribed_at"],
+        )
@@ -0,0 +1,247 @@
+import atexit
+import fcntl
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+
+from django.conf import settings
+from django.db import close_old_connections, models, transaction
+
+from blog_app.models import Article, ArticleRate, rows_upserted
+from blog_app.recommendations import interactions_removed
+
+logger = logging.getLogger(__name__)
+
+
+class RateBuffer:
+    """
+    Write-behind buffer for article rates.
+
+    Rates are appended to a per-process log file, coalesced in memory per
+    (user, article) and written to the database in batches by a background
+    thread. A rate of `None` stands for an un-rate.
+
+    Every log is locked with `flock()` while its process is alive, so logs
+    left behind by dead processes are replayed by the next buffer started.
+
+    Pending rates are only known to the process buffering them. Responses
+    of that process show them at once, those of the others once flushed,
+    up to `flush_interval` later, so users may not see their own rate when
+    their next request goes to another worker.
+    """
+
+    def __init__(self, log_dir, flush_interval=1.0, batch_size=500, fsync=False):
+        self.log_dir = Path(log_dir)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        # (user_id, article_id) -> [stored value, pending value]
+        self.pending = {}
+        # article_id -> keys of `pending`, for the ratings of an article.
+        self.by_article = {}
+        self.stopped = threading.Event()
+        self.thread = None
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.log_dir / f"rates-{os.getpid()}.log"
+        self.log = None
+
+    def start(self):
+        self._recover()
+        self._open_log()
+        self.thread = threading.Thread(
+            target=self._run,
+            name="rate-write-behind",
+            daemon=True,
+        )
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        if self.stopped.is_set():
+            return
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+        self.log.close()
+        if not self.pending:
+            self.log_path.unlink(missing_ok=True)
+
+    def add(self, user_id, article_id, is_positive):
+        key = (user_id, article_id)
+        stored = None
+        if key not in self.pending:
+            stored = (
+                ArticleRate.objects.filter(user_id=user_id, article_id=article_id)
+                .values_list("is_positive", flat=True)
+                .first()
+            )
+        with self.lock:
+            if key not in self.pending:
+                self._add_pending(key, [stored, is_positive])
+            else:
+                self.pending[key][1] = is_positive
+            self._append(key, is_positive)
+
+    def get_rate(self, user_id, article_id):
+        """
+        Return `(True, value)` when the user has a pending rate for the
+        article, `(False, None)` otherwise.
+        """
+        entry = self.pending.get((user_id, article_id))
+        if entry is None:
+            return False, None
+        return True, entry[1]
+
+    def get_ratings_delta(self, article_id) -> dict:
+        delta = {"positive": 0, "negative": 0}
+        with self.lock:
+            entries = [
+                list(self.pending[key]) for key in self.by_article.get(article_id, ())
+            ]
+        for stored, value in entries:
+            for rate, sign in ((stored, -1), (value, 1)):
+                if rate is True:
+                    delta["positive"] += sign
+                elif rate is False:
+                    delta["negative"] += sign
+        return delta
+
+    def flush(self):
+        with self.lock:
+            if not self.pending:
+                return
+            pending, self.pending = self.pending, {}
+            self.by_article = {}
+            # The renamed log stays open, and so locked, until it is applied.
+            flushing_log = self.log
+            flushing_path = self.log_path.with_suffix(".flushing")
+            os.replace(self.log_path, flushing_path)
+            self._open_log()
+        try:
+            self._apply({key: entry[1] for key, entry in pending.items()})
+        except Exception:
+            logger.exception("Failed to flush %d buffered rates", len(pending))
+            with self.lock:
+                for key, entry in pending.items():
+                    if key in self.pending:
+                        self.pending[key][0] = entry[0]
+                    else:
+                        self._add_pending(key, entry)
+                        self._append(key, entry[1])
+        finally:
+            flushing_path.unlink(missing_ok=True)
+            flushing_log.close()
+
+    def _apply(self, rates):
+        # Rates of articles deleted in the meantime are dropped.
+        articles = set(
+            Article._base_manager.filter(
+                pk__in={article_id for _, article_id in rates}
+            ).values_list("pk", flat=True)
+        )
+        items = [(key, value) for key, value in rates.items() if key[1] in articles]
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start : start + self.batch_size]
+            upserts = [
+                ArticleRate(user_id=user_id, article_id=article_id, is_positive=value)
+                for (user_id, article_id), value in batch
+                if value is not None
+            ]
+            deletes = [key for key, value in batch if value is None]
+            with transaction.atomic():
+                ArticleRate.objects.bulk_create(
+                    upserts,
+                    update_conflicts=True,
+                    unique_fields=["user", "article"],
+                    update_fields=["is_positive", "rated_at"],
+                )
+                if deletes:
+                    condition = models.Q()
+                    for user_id, article_id in deletes:
+                        condition |= models.Q(user_id=user_id, article_id=article_id)
+                    ArticleRate.objects.filter(condition).delete()
+                    interactions_removed(article_id for _, article_id in deletes)
+        if items:
+            # Once for the flush, receivers handle each article once.
+            rows_upserted.send(
+                sender=ArticleRate,
+                rows=[
+                    {"user_id": user_id, "article_id": article_id, "is_positive": value}
+                    for (user_id, article_id), value in items
+                ],
+                using=ArticleRate.objects.db,
+            )
+
+    def _run(self):
+        while not self.stopped.wait(self.flush_interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def _add_pending(self, key, entry):
+        self.pending[key] = entry
+        self.by_article.setdefault(key[1], set()).add(key)
+
+    def _open_log(self):
+        self.log = open(self.log_path, "a", encoding="utf-8")
+        fcntl.flock(self.log, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _append(self, key, is_positive):
+        self.log.write(json.dumps([key[0], key[1], is_positive]) + "\n")
+        self.log.flush()
+        if self.fsync:
+            os.fsync(self.log.fileno())
+
+    def _recover(self):
+        """Apply the logs of processes that stopped before flushing."""
+        # Logs being flushed sort before the live log of the same process.
+        for path in sorted(self.log_dir.glob("rates-*")):
+            with open(path, encoding="utf-8") as log:
+                try:
+                    fcntl.flock(log, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Still owned by a running process.
+                    continue
+                rates = {}
+                for line in log:
+                    try:
+                        user_id, article_id, value = json.loads(line)
+                    except ValueError:
+                        # Torn write at the end of the log.
+                        continue
+                    rates[(user_id, article_id)] = value
+                if rates:
+                    logger.info("Recovering %d rates from %s", len(rates), path)
+                    self._apply(rates)
+                path.unlink()
+
+
+_rate_buffer = None
+_rate_buffer_lock = threading.Lock()
+
+
+def get_rate_buffer() -> RateBuffer | None:
+    """
+    Return the process wide rate buffer, or `None` when write-behind is
+    disabled by the `WRITE_BEHIND_ENABLED` setting.
+    """
+    global _rate_buffer
+    if not settings.WRITE_BEHIND_ENABLED:
+        return None
+    if _rate_buffer is None:
+        with _rate_buffer_lock:
+            if _rate_buffer is None:
+                buffer = RateBuffer(
+                    settings.WRITE_BEHIND_LOG_DIR,
+                    flush_interval=settings.WRITE_BEHIND_FLUSH_INTERVAL,
+                    batch_size=settings.WRITE_BEHIND_BATCH_SIZE,
+                    fsync=settings.WRITE_BEHIND_FSYNC,
+                )
+                buffer.start()
+                _rate_buffer = buffer
+    return _rate_buffer
@@ -14,3 +14,20 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'blog_project.settings')
 
 application = get_asgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.AUTOCOMPLETE_PRELOAD:
+    from blog_app.autocomplete import preload
+
+    preload()
+
+if settings.INVALIDATION_LISTEN:
+    from blog_app.invalidation import start_listener
+
+    start_listener()
+
+if settings.JOBS_WORKER_THREADS:
+    from blog_app.jobs import start_workers
+
+    start_workers()
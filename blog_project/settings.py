@@ -54,7 +54,12 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "blog_app.metrics.MetricsMiddleware",
+    "blog_app.slow_queries.SlowQueryMiddleware",
+    "blog_app.invalidation.InvalidationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
+    "blog_app.throttling.AdmissionControlMiddleware",
+    "blog_app.compression.CompressionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
@@ -79,8 +84,30 @@ REST_FRAMEWORK = {
     ],
     "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
     "PAGE_SIZE": 100,
+    "DEFAULT_THROTTLE_CLASSES": [
+        "blog_app.throttling.ClientRateThrottle",
+        "blog_app.throttling.SearchRateThrottle",
+        "blog_app.throttling.DeepOffsetRateThrottle",
+        "blog_app.throttling.UploadRateThrottle",
+    ],
+    # Token bucket sizes per client, see blog_app/throttling.py
+    "DEFAULT_THROTTLE_RATES": {
+        "client": "20/s",
+        "search": "30/m",
+        "deep_offset": "30/m",
+        "uploads": "20/m",
+    },
 }
 
+# Offset from which listings count as deep pages, throttled on their own.
+THROTTLE_DEEP_OFFSET = 1000
+
+# Requests handled at once by a process, see AdmissionControlMiddleware.
+ADMISSION_MAX_IN_FLIGHT = 32
+ADMISSION_MAX_QUEUE = 64
+ADMISSION_QUEUE_TIMEOUT = 2.0
+ADMISSION_RETRY_AFTER = 5
+
 ROOT_URLCONF = "blog_project.urls"
 
 TEMPLATES = [
@@ -109,6 +136,9 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # A file rather than memory, so the tests writing from many threads
+        # wait for the lock as in production instead of failing.
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
@@ -157,3 +187,135 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 UPLOADS_DIR = "uploads/"
 UPLOADS_URL = "uploads/"
+
+
+# Responses smaller than COMPRESSION_MIN_SIZE bytes are not compressed.
+# Streaming responses use the cheaper COMPRESSION_STREAMING_LEVEL.
+# Run `manage.py benchmark_compression` to compare levels.
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_LEVEL = 6
+COMPRESSION_STREAMING_LEVEL = 4
+COMPRESSION_CACHE_TIMEOUT = 300
+
+# Profiles are cached without their viewer dependent fields, until one of
+# the author's profile, articles, rates or subscriptions changes.
+PROFILE_CACHE_TIMEOUT = 60 * 60
+
+# Prebuilt OpenAPI schemas, see `manage.py build_schema`.
+SCHEMA_DIR = BASE_DIR / "schema"
+SCHEMA_MAX_AGE = 60 * 60 * 24
+
+# Renders article content into the stored excerpt, HTML and outline.
+# Run `manage.py rebuild_article_content` after changing it.
+ARTICLE_RENDERER = "blog_app.rendering.HTMLRenderer"
+
+# Length of the stored related articles lists, see blog_app/related.py
+# Run `manage.py rebuild_related_articles` after changing it.
+RELATED_ARTICLES_LIMIT = 10
+
+# Item to item recommendations, see blog_app/recommendations.py
+# Run `manage.py build_similar_articles` hourly to keep them up to date.
+SIMILAR_ARTICLES_LIMIT = 20
+# Number of a user's latest rates and favorites their feed is built from.
+RECOMMENDATIONS_HISTORY = 50
+
+# Article view counting, see blog_app/view_counter.py
+VIEW_COUNTER_FLUSH_INTERVAL = 5.0
+# Repeated views of an article by a viewer within this many seconds count once.
+VIEW_COUNTER_DEDUP_WINDOW = 30 * 60
+# Name of a shared memory segment the processes of a host add their views
+# up in before flushing, `None` to count in each process.
+VIEW_COUNTER_SHARED_MEMORY = None
+VIEW_COUNTER_SHARED_SLOTS = 16384
+
+# Job queue, see blog_app/jobs.py
+# Jobs are queued in the database and run in the background. When True,
+# they run in the request's process after its transaction commits, except
+# the long ones queued with `always_queue`.
+JOBS_EAGER = False
+# Job workers run by each web process, set to 0 when jobs are run by
+# `manage.py run_workers` instead.
+JOBS_WORKER_THREADS = 1
+JOBS_POLL_INTERVAL = 1.0
+JOBS_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled on every attempt.
+JOBS_RETRY_BACKOFF = 5
+JOBS_RETRY_BACKOFF_MAX = 60 * 60
+# Running jobs not done after this many seconds are run again.
+JOBS_LOCK_TIMEOUT = 10 * 60
+
+# Write-behind buffering of article rates, see blog_app/write_behind.py
+WRITE_BEHIND_ENABLED = False
+WRITE_BEHIND_LOG_DIR = BASE_DIR / "write_behind"
+WRITE_BEHIND_FLUSH_INTERVAL = 1.0
+WRITE_BEHIND_BATCH_SIZE = 500
+WRITE_BEHIND_FSYNC = False
+
+# Autocomplete prefix indexes, see blog_app/autocomplete.py
+# Suggestions kept per prefix, the most an autocomplete request returns.
+AUTOCOMPLETE_LIMIT = 10
+# Longer prefixes are matched by filtering, fewer nodes take less memory.
+AUTOCOMPLETE_MAX_DEPTH = 12
+# Build the indexes when the application loads, not on first use.
+AUTOCOMPLETE_PRELOAD = True
+
+# Bulk user provisioning, see blog_app/provisioning.py
+# Processes hashing passwords, for the API, `manage.py provision_users`
+# takes `--workers`.
+PROVISIONING_WORKERS = 4
+# Users created by a request to the provisioning API at most. Passwords take
+# about 0.3s each to hash, 100 of them hold the request for about 10s with
+# 4 workers, within the usual timeouts. Import more with the command.
+PROVISIONING_MAX_USERS = 100
+
+# Background deletion of articles and users, see blog_app/deletion.py
+# Rows deleted per transaction.
+DELETION_BATCH_SIZE = 500
+# Seconds a deletion job runs before queuing the rest of the work.
+DELETION_JOB_SECONDS = 30
+
+# Placeholders of uploaded images, see blog_app/images.py
+# Run `manage.py backfill_image_metadata --all` after changing them.
+IMAGE_PLACEHOLDER_SIZE = 16
+IMAGE_PLACEHOLDER_QUALITY = 50
+
+# Uploads nothing refers to are deleted by `manage.py collect_uploads` once
+# older than UPLOADS_GC_GRACE_SECONDS, see blog_app/uploads_gc.py. Uploaded
+# files, only ever linked to, are kept unless run with `--include-files`.
+UPLOADS_GC_GRACE_SECONDS = 60 * 60 * 24 * 7
+UPLOADS_GC_BATCH_SIZE = 500
+
+# Invalidations of the in-process caches sent to the other processes, see
+# blog_app/invalidation.py. Set INVALIDATION_TRANSPORT to None when a single
+# process serves the site.
+INVALIDATION_TRANSPORT = "blog_app.invalidation.DatabaseTransport"
+# Seconds between polls, how long other processes may serve stale data.
+INVALIDATION_POLL_INTERVAL = 1.0
+INVALIDATION_BATCH_SIZE = 1000
+# Messages are deleted after this many seconds.
+INVALIDATION_RETENTION_SECONDS = 10 * 60
+# Web processes listen to the invalidations of the others.
+INVALIDATION_LISTEN = True
+
+# Prometheus metrics served at /api/metrics/, see blog_app/metrics.py
+# Processes write their metrics to METRICS_DIR every METRICS_FLUSH_INTERVAL
+# seconds. Clear it when deploying.
+METRICS_DIR = BASE_DIR / "metrics"
+METRICS_FLUSH_INTERVAL = 5.0
+# Addresses allowed to scrape, staff users are allowed too, by token or session.
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+METRICS_LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+METRICS_QUERY_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100]
+METRICS_SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536, 262144, 1048576]
+
+# Queries taking more than SLOW_QUERY_THRESHOLD seconds are logged with
+# their plan to SLOW_QUERY_LOG_DIR, see blog_app/slow_queries.py and
+# `manage.py slow_queries`. Set it to None to log nothing.
+SLOW_QUERY_THRESHOLD = 0.1
+# Plans are captured the first time a process sees a query, then for this
+# share of them.
+SLOW_QUERY_EXPLAIN_RATE = 0.1
+SLOW_QUERY_STACK_DEPTH = 8
+SLOW_QUERY_LOG_DIR = BASE_DIR / "slow_queries"
+SLOW_QUERY_LOG_MAX_BYTES = 10 * 2**20
+SLOW_QUERY_LOG_BACKUPS = 5